@@ -0,0 +1,174 @@
+-- bench/bench_ansi.lua
+-- Benchmark del parser ANSI (`jove.ansi.parse`).
+--
+-- Confronta il parser attuale con quello originale (riportato qui sotto come riferimento,
+-- senza registro dei gruppi) e stampa il throughput in righe al secondo per testo senza
+-- colori, con i 16 colori di base (log colorati), 256 colori (tracebacks di `rich`) e
+-- truecolor.
+--
+-- Uso:
+--   nvim --headless -u NONE --cmd "set rtp^=." -l bench/bench_ansi.lua [--lines N] [--repeat N] [--json]
+local ansi = require("jove.ansi")
+ansi.setup_highlights()
+
+local opts = { lines = 20000, ["repeat"] = 3, json = false }
+local i = 1
+while i <= #arg do
+	if arg[i] == "--json" then
+		opts.json = true
+	elseif arg[i] == "--lines" or arg[i] == "--repeat" then
+		opts[arg[i]:sub(3)] = tonumber(arg[i + 1])
+		i = i + 1
+	end
+	i = i + 1
+end
+
+local legacy_color_map = {}
+for n = 0, 7 do
+	legacy_color_map[tostring(30 + n)] = { fg = "AnsiColor" .. n }
+	legacy_color_map[tostring(40 + n)] = { bg = "AnsiBgColor" .. n }
+	legacy_color_map[tostring(90 + n)] = { fg = "AnsiColor" .. (n + 8) }
+	legacy_color_map[tostring(100 + n)] = { bg = "AnsiBgColor" .. (n + 8) }
+end
+
+--- Parser originale: divide i codici con vim.split e ridefinisce con `:highlight` il gruppo
+-- di ogni colore 256/truecolor a ogni sequenza. Usato come riferimento.
+local function legacy_parse(text, default_hl)
+	local chunks = {}
+	local current_fg, current_bg = nil, nil
+	local pos, chunk_start = 1, 1
+	local function get_hl_group()
+		if not current_fg and not current_bg then
+			return default_hl or "Normal"
+		end
+		local group = {}
+		if current_fg then
+			table.insert(group, current_fg)
+		end
+		if current_bg then
+			table.insert(group, current_bg)
+		end
+		return group
+	end
+	while true do
+		local start, finish, code_str = text:find("\x1b%[([%d;]*)m", pos)
+		if not start then
+			if chunk_start <= #text then
+				table.insert(chunks, { text:sub(chunk_start), get_hl_group() })
+			end
+			break
+		end
+		if start > chunk_start then
+			table.insert(chunks, { text:sub(chunk_start, start - 1), get_hl_group() })
+		end
+		local codes = vim.split(code_str, ";")
+		if #codes == 0 or code_str == "" then
+			codes = { "0" }
+		end
+		local code_idx = 1
+		while code_idx <= #codes do
+			local code = codes[code_idx]
+			if code == "0" or code == "" then
+				current_fg, current_bg = nil, nil
+			elseif code == "38" then
+				code_idx = code_idx + 1
+				if codes[code_idx] == "5" then
+					code_idx = code_idx + 1
+					local color_index = tonumber(codes[code_idx])
+					if color_index then
+						local hl_name = "AnsiFg256_" .. color_index
+						pcall(vim.api.nvim_command, string.format("highlight default %s ctermfg=%s guifg=NONE", hl_name, color_index))
+						current_fg = hl_name
+					end
+				elseif codes[code_idx] == "2" then
+					local r, g, b = tonumber(codes[code_idx + 1]), tonumber(codes[code_idx + 2]), tonumber(codes[code_idx + 3])
+					if r and g and b then
+						local hl_name = "AnsiFgTrue_" .. r .. "_" .. g .. "_" .. b
+						pcall(vim.api.nvim_command, string.format("highlight default %s guifg=#%02x%02x%02x", hl_name, r, g, b))
+						current_fg = hl_name
+					end
+					code_idx = code_idx + 3
+				end
+			elseif code == "48" then
+				local next_code = codes[code_idx]
+				if next_code == "5" then
+					code_idx = code_idx + 1
+				elseif next_code == "2" then
+					code_idx = code_idx + 3
+				end
+			else
+				local color_info = legacy_color_map[code]
+				if color_info then
+					current_fg = color_info.fg or current_fg
+					current_bg = color_info.bg or current_bg
+				end
+			end
+			code_idx = code_idx + 1
+		end
+		pos = finish + 1
+		chunk_start = pos
+	end
+	return chunks
+end
+
+local function make_lines(kind, n)
+	local lines = {}
+	for k = 1, n do
+		if kind == "plain" then
+			lines[k] = string.format("2024-05-01 12:00:%02d INFO worker %d: processed batch of 512 items", k % 60, k)
+		elseif kind == "basic" then
+			lines[k] = string.format(
+				"\27[32m2024-05-01 12:00:%02d\27[0m \27[1;34mINFO\27[0m worker %d: \27[33mprocessed\27[0m 512 items",
+				k % 60,
+				k
+			)
+		elseif kind == "256" then
+			lines[k] = string.format(
+				"\27[38;5;%dm│\27[0m \27[38;5;204mFile\27[0m \27[38;5;%dm\"/srv/app/module_%d.py\"\27[0m, line \27[38;5;81m%d\27[0m",
+				k % 24 + 232,
+				k % 216 + 16,
+				k % 50,
+				k
+			)
+		else
+			lines[k] = string.format(
+				"\27[38;2;%d;%d;200m▇▇▇\27[48;2;30;30;30m progress %d%%\27[0m",
+				k % 64 * 4,
+				k % 32 * 8,
+				k % 100
+			)
+		end
+	end
+	return lines
+end
+
+local function measure(parse, lines)
+	local best = math.huge
+	for _ = 1, opts["repeat"] do
+		local start = vim.uv.hrtime()
+		for _, line in ipairs(lines) do
+			parse(line, "Normal")
+		end
+		best = math.min(best, (vim.uv.hrtime() - start) / 1e9)
+	end
+	return #lines / best
+end
+
+local results = {}
+for _, kind in ipairs({ "plain", "basic", "256", "truecolor" }) do
+	local lines = make_lines(kind, opts.lines)
+	local legacy = measure(legacy_parse, lines)
+	local current = measure(ansi.parse, lines)
+	table.insert(results, { input = kind, legacy_lines_per_s = legacy, lines_per_s = current, speedup = current / legacy })
+end
+
+if opts.json then
+	io.stdout:write(vim.json.encode(results) .. "\n")
+else
+	io.stdout:write(string.format("%-10s %16s %16s %8s\n", "input", "originale (r/s)", "attuale (r/s)", "x"))
+	for _, r in ipairs(results) do
+		io.stdout:write(
+			string.format("%-10s %16.0f %16.0f %8.1f\n", r.input, r.legacy_lines_per_s, r.lines_per_s, r.speedup)
+		)
+	end
+end
@@ -0,0 +1,428 @@
+"""
+Benchmark del bridge kernel ↔ Neovim.
+
+Avvia un ipykernel locale, pilota `python/py_kernel_client.py` attraverso il suo
+protocollo JSON su stdin/stdout (lo stesso usato da Lua) e misura throughput e
+latenza per alcuni scenari tipici:
+
+    stream_flood   molte righe di print() consecutive
+    image_burst    una raffica di display_data con immagini PNG
+    live_update    un'immagine aggiornata in un ciclo con update_display (grafico dal vivo)
+    huge_repr      un execute_result con un repr testuale molto grande
+    inspect        round-trip di inspect_request in sequenza
+
+Con `--nvim` esegue gli stessi scenari anche in `nvim --headless` con il plugin
+caricato (script `bench/nvim_bridge.lua`), riportando le latenze per fase di
+`jove.stats` fino al disegno.
+
+I risultati possono essere salvati in JSON (`--output`) e confrontati con quelli
+di un altro commit (`--compare`).
+
+Uso:
+    python bench/bench_bridge.py [--scenarios a,b] [--repeat N] [--json]
+                                 [--output FILE] [--compare BASELINE.json]
+                                 [--client-args "--stream-window-ms 0"] [--nvim]
+
+Con `--client-args "--display-update-max-fps 0"` live_update inoltra ogni fotogramma.
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import queue
+import shlex
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from jupyter_client import KernelManager
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+CLIENT_SCRIPT = os.path.join(ROOT, "python", "py_kernel_client.py")
+NVIM_SCRIPT = os.path.join(ROOT, "bench", "nvim_bridge.lua")
+
+# Un messaggio ricevuto dal client: (istante di ricezione time.time(), messaggio, byte)
+Received = Tuple[float, Dict[str, Any], int]
+
+
+def make_png_b64(width: int, height: int, seed: int = 0) -> str:
+    """PNG di rumore (poco comprimibile, quindi di dimensione realistica per un grafico denso)."""
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels, "RGB").save(buf, format="PNG")
+    return base64.b64encode(buf.getvalue()).decode("ascii")
+
+
+def scenario_code(name: str, size: str) -> str:
+    """Codice eseguito nel kernel per uno scenario ("small" per una prova veloce)."""
+    small = size == "small"
+    if name == "stream_flood":
+        lines = 2000 if small else 20000
+        return f"for i in range({lines}):\n    print(i, 'x' * 40)"
+    if name == "image_burst":
+        count = 4 if small else 20
+        b64 = make_png_b64(200, 150) if small else make_png_b64(640, 480)
+        return (
+            "import base64\n"
+            "from IPython.display import Image, display\n"
+            f"_png = base64.b64decode('{b64}')\n"
+            f"for _ in range({count}):\n"
+            "    display(Image(data=_png, format='png'))"
+        )
+    if name == "live_update":
+        count = 30 if small else 300
+        b64 = make_png_b64(200, 150) if small else make_png_b64(640, 480)
+        return (
+            "import base64\n"
+            "from IPython.display import Image, display\n"
+            f"_png = base64.b64decode('{b64}')\n"
+            "_handle = display(Image(data=_png, format='png'), display_id=True)\n"
+            f"for _ in range({count}):\n"
+            "    _handle.update(Image(data=_png, format='png'))"
+        )
+    if name == "huge_repr":
+        chars = 500_000 if small else 5_000_000
+        return f"'x' * {chars}"
+    raise ValueError(f"Scenario senza codice: {name}")
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(p * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def latency_summary(prefix: str, values_ms: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        f"{prefix}_p50_ms": percentile(values_ms, 0.5),
+        f"{prefix}_p95_ms": percentile(values_ms, 0.95),
+        f"{prefix}_max_ms": max(values_ms) if values_ms else None,
+    }
+
+
+class Bridge:
+    """Un kernel locale e il client Python collegato, pilotati come farebbe Lua."""
+
+    def __init__(self, client_args: List[str]) -> None:
+        self.km = KernelManager(kernel_name="python3")
+        self.km.start_kernel()
+        self.proc = subprocess.Popen(
+            [sys.executable, "-u", CLIENT_SCRIPT, self.km.connection_file, "80", "none"]
+            + client_args,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self.messages: "queue.Queue[Received]" = queue.Queue()
+        threading.Thread(target=self._read_stdout, daemon=True).start()
+        self._wait_for(lambda m: m.get("type") == "status" and m.get("message") == "connected", 30)
+        # I primi messaggi IOPub possono andare persi finché la sottoscrizione non è attiva:
+        # si riprova un execute vuoto finché non arriva anche il suo status idle.
+        for _ in range(30):
+            try:
+                self.execute("None", timeout=2)
+                break
+            except TimeoutError:
+                continue
+        else:
+            raise TimeoutError("Il kernel non risponde")
+
+    def _read_stdout(self) -> None:
+        assert self.proc.stdout is not None
+        for raw in self.proc.stdout:
+            received = time.time()
+            try:
+                self.messages.put((received, json.loads(raw), len(raw)))
+            except ValueError:
+                continue
+
+    def _wait_for(self, predicate: Callable[[Dict[str, Any]], bool], timeout: float) -> List[Received]:
+        deadline = time.time() + timeout
+        collected: List[Received] = []
+        while True:
+            remaining = deadline - time.time()
+            try:
+                item = self.messages.get(timeout=max(remaining, 0))
+            except queue.Empty:
+                raise TimeoutError("Nessuna risposta dal client Python") from None
+            collected.append(item)
+            if predicate(item[1]):
+                return collected
+
+    def send(self, command: Dict[str, Any]) -> None:
+        assert self.proc.stdin is not None
+        self.proc.stdin.write((json.dumps(command) + "\n").encode("utf-8"))
+        self.proc.stdin.flush()
+
+    def execute(self, code: str, timeout: float = 300) -> Tuple[float, List[Received]]:
+        """Esegue del codice e raccoglie i messaggi fino a execute_reply e status idle."""
+        msg_id = f"bench-{uuid.uuid4().hex}"
+        seen = {"reply": False, "idle": False}
+
+        def done(message: Dict[str, Any]) -> bool:
+            jupyter_msg = message.get("message")
+            if isinstance(jupyter_msg, dict):
+                if jupyter_msg.get("parent_header", {}).get("msg_id") == msg_id:
+                    msg_type = jupyter_msg.get("header", {}).get("msg_type")
+                    if msg_type == "execute_reply":
+                        seen["reply"] = True
+                    elif (
+                        msg_type == "status"
+                        and jupyter_msg.get("content", {}).get("execution_state") == "idle"
+                    ):
+                        seen["idle"] = True
+            return seen["reply"] and seen["idle"]
+
+        sent = time.time()
+        self.send({"command": "execute", "payload": {"header": {"msg_id": msg_id}, "content": {"code": code}}})
+        return sent, self._wait_for(done, timeout)
+
+    def inspect(self, code: str, timeout: float = 30) -> Tuple[float, List[Received]]:
+        sent = time.time()
+        self.send({"command": "inspect", "payload": {"code": code, "cursor_pos": len(code)}})
+
+        def done(message: Dict[str, Any]) -> bool:
+            jupyter_msg = message.get("message")
+            return (
+                isinstance(jupyter_msg, dict)
+                and jupyter_msg.get("header", {}).get("msg_type") == "inspect_reply"
+            )
+
+        return sent, self._wait_for(done, timeout)
+
+    def close(self) -> None:
+        try:
+            self.send({"command": "shutdown"})
+            assert self.proc.stdin is not None
+            self.proc.stdin.close()
+            self.proc.wait(timeout=10)
+        except Exception:
+            self.proc.kill()
+        self.km.shutdown_kernel(now=True)
+
+
+def message_kind(message: Dict[str, Any]) -> str:
+    jupyter_msg = message.get("message")
+    if isinstance(jupyter_msg, dict):
+        return jupyter_msg.get("header", {}).get("msg_type", "")
+    return message.get("type", "")
+
+
+def kernel_latencies_ms(received: List[Received], kinds: Tuple[str, ...]) -> List[float]:
+    """Latenza dal timestamp del kernel (trace `k`) alla ricezione qui, per i messaggi indicati."""
+    values = []
+    for at, message, _ in received:
+        trace = message.get("trace") or {}
+        if message_kind(message) in kinds and "k" in trace:
+            values.append((at - trace["k"]) * 1000)
+    return values
+
+
+def run_execute_scenario(bridge: Bridge, name: str, size: str) -> Dict[str, Any]:
+    code = scenario_code(name, size)
+    sent, received = bridge.execute(code)
+    finished = received[-1][0]
+    outputs = [r for r in received if message_kind(r[1]) in ("stream", "image_iip", "execute_result", "display_data")]
+    result: Dict[str, Any] = {
+        "wall_ms": (finished - sent) * 1000,
+        "messages": len(received),
+        "bytes": sum(r[2] for r in received),
+        "first_output_ms": (outputs[0][0] - sent) * 1000 if outputs else None,
+    }
+    result["mb_per_s"] = result["bytes"] / 1e6 / max(finished - sent, 1e-9)
+    if name == "stream_flood":
+        lines = sum(r[1]["message"]["content"].get("text", "").count("\n") for r in outputs)
+        result["lines"] = lines
+        result["lines_per_s"] = lines / max(finished - sent, 1e-9)
+        result.update(latency_summary("kernel_to_bench", kernel_latencies_ms(received, ("stream",))))
+    elif name == "image_burst":
+        images = [r for r in outputs if message_kind(r[1]) in ("image_iip", "display_data")]
+        result["images"] = len(images)
+        result["images_per_s"] = len(images) / max(finished - sent, 1e-9)
+        result.update(
+            latency_summary("kernel_to_bench", kernel_latencies_ms(received, ("image_iip", "display_data")))
+        )
+    elif name == "live_update":
+        updates = [r for r in received if message_kind(r[1]) == "update_display_data"]
+        result["frames_forwarded"] = len(updates)
+        result["frames_per_s"] = len(updates) / max(finished - sent, 1e-9)
+        # Ritardo dell'ultimo fotogramma: quanto il display resta indietro rispetto al kernel.
+        result.update(latency_summary("kernel_to_bench", kernel_latencies_ms(received, ("update_display_data",))))
+    elif name == "huge_repr":
+        result.update(latency_summary("kernel_to_bench", kernel_latencies_ms(received, ("execute_result",))))
+    return result
+
+
+def run_inspect_scenario(bridge: Bridge, size: str) -> Dict[str, Any]:
+    rounds = 20 if size == "small" else 200
+    round_trips = []
+    for _ in range(rounds):
+        sent, received = bridge.inspect("print")
+        round_trips.append((received[-1][0] - sent) * 1000)
+    result: Dict[str, Any] = {"round_trips": rounds, "mean_ms": statistics.fmean(round_trips)}
+    result.update(latency_summary("round_trip", round_trips))
+    return result
+
+
+SCENARIOS = ["stream_flood", "image_burst", "live_update", "huge_repr", "inspect"]
+
+
+def run_bridge(scenarios: List[str], size: str, client_args: List[str]) -> Dict[str, Dict[str, Any]]:
+    bridge = Bridge(client_args)
+    try:
+        results = {}
+        for name in scenarios:
+            if name == "inspect":
+                results[name] = run_inspect_scenario(bridge, size)
+            else:
+                results[name] = run_execute_scenario(bridge, name, size)
+        return results
+    finally:
+        bridge.close()
+
+
+def run_nvim(scenarios: List[str], size: str) -> Dict[str, Dict[str, Any]]:
+    """Esegue gli scenari in `nvim --headless` con il plugin e restituisce tempi e `jove.stats`."""
+    nvim = shutil.which("nvim")
+    if not nvim:
+        raise SystemExit("--nvim richiesto ma `nvim` non è nel PATH")
+    with tempfile.TemporaryDirectory() as tmp:
+        spec_path = os.path.join(tmp, "spec.json")
+        out_path = os.path.join(tmp, "result.json")
+        spec = {
+            "python": sys.executable,
+            "output": out_path,
+            "scenarios": [
+                {"name": name, "code": scenario_code(name, size)} for name in scenarios if name != "inspect"
+            ],
+        }
+        with open(spec_path, "w") as f:
+            json.dump(spec, f)
+        env = dict(os.environ, JOVE_BENCH_SPEC=spec_path)
+        subprocess.run(
+            [nvim, "--headless", "-u", "NONE", "-i", "NONE", "--cmd", f"set rtp^={ROOT}", "-l", NVIM_SCRIPT],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            timeout=600,
+            check=True,
+        )
+        with open(out_path) as f:
+            raw = json.load(f)
+
+    results = {}
+    for name, entry in raw.get("scenarios", {}).items():
+        flat: Dict[str, Any] = {"wall_ms": entry.get("wall_ms")}
+        for stage, values in entry.get("stats", {}).get("stages", {}).items():
+            for key in ("p50_ms", "p95_ms", "count"):
+                if isinstance(values.get(key), (int, float)):
+                    flat[f"{stage}_{key}"] = values[key]
+        results[f"nvim_{name}"] = flat
+    return results
+
+
+def merge_runs(runs: List[Dict[str, Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+    """Mediana di ogni metrica numerica tra le ripetizioni."""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for scenario in runs[0]:
+        merged[scenario] = {}
+        for key in runs[0][scenario]:
+            values = [run[scenario].get(key) for run in runs]
+            numbers = [v for v in values if isinstance(v, (int, float))]
+            merged[scenario][key] = statistics.median(numbers) if numbers else None
+    return merged
+
+
+def print_table(results: Dict[str, Dict[str, Any]], baseline: Optional[Dict[str, Any]]) -> None:
+    base_results = (baseline or {}).get("results", {})
+    for scenario, metrics in results.items():
+        print(scenario)
+        for key, value in metrics.items():
+            if value is None:
+                continue
+            line = f"  {key:<28} {value:>14.3f}" if isinstance(value, float) else f"  {key:<28} {value:>14}"
+            base = base_results.get(scenario, {}).get(key)
+            if isinstance(base, (int, float)) and isinstance(value, (int, float)) and base:
+                line += f"   baseline {base:>12.3f}  ({value / base:>5.2f}x)"
+            print(line)
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "-C", ROOT, "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="scenari separati da virgola")
+    parser.add_argument("--repeat", type=int, default=3, help="ripetizioni (si riporta la mediana)")
+    parser.add_argument("--size", choices=["small", "full"], default="full", help="dimensione dei carichi")
+    parser.add_argument("--client-args", default="", help="argomenti extra per py_kernel_client.py")
+    parser.add_argument("--nvim", action="store_true", help="esegue anche gli scenari in nvim --headless")
+    parser.add_argument("--json", action="store_true", help="stampa i risultati in JSON")
+    parser.add_argument("--output", help="salva i risultati in questo file JSON")
+    parser.add_argument("--compare", help="file JSON di un'esecuzione precedente da confrontare")
+    args = parser.parse_args()
+
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Scenari sconosciuti: {', '.join(sorted(unknown))}")
+
+    client_args = shlex.split(args.client_args)
+    runs = []
+    for _ in range(args.repeat):
+        run = run_bridge(scenarios, args.size, client_args)
+        if args.nvim:
+            run.update(run_nvim(scenarios, args.size))
+        runs.append(run)
+
+    report = {
+        "revision": git_revision(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "size": args.size,
+        "repeat": args.repeat,
+        "client_args": client_args,
+        "results": merge_runs(runs),
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    if args.json:
+        if baseline:
+            report["baseline"] = baseline.get("results", {})
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"revision {report['revision']}  size {args.size}  repeat {args.repeat}")
+        print_table(report["results"], baseline)
+
+
+if __name__ == "__main__":
+    main()
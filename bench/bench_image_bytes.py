@@ -0,0 +1,131 @@
+"""
+Benchmark dei byte inviati al terminale per ogni immagine.
+
+Prepara alcune immagini sintetiche (un grafico a 300 DPI con antialiasing, un grafico
+a colori piatti, una foto JPEG) con `image_renderer.prepare_iterm_image_props`, prima
+senza e poi con la dimensione in pixel delle celle, e stampa i byte base64 che
+finirebbero sul TTY per iTerm2 (IIP) e per il Kitty graphics protocol (PNG), con le
+dimensioni in pixel risultanti.
+
+Uso:
+    python bench/bench_image_bytes.py [--columns N] [--cell WxH] [--max-pixels N] [--json]
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "python"))
+
+from image_renderer import prepare_iterm_image_props  # noqa: E402
+
+
+def make_figure(width, height, smooth):
+    """Grafico sintetico: assi, griglia e curve (con antialiasing se `smooth`)."""
+    scale = 2 if smooth else 1
+    img = Image.new("RGB", (width * scale, height * scale), (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    w, h = img.size
+    for x in range(0, w, w // 10):
+        draw.line((x, 0, x, h), fill=(220, 220, 220), width=scale)
+    for y in range(0, h, h // 8):
+        draw.line((0, y, w, y), fill=(220, 220, 220), width=scale)
+    colors = [(31, 119, 180), (255, 127, 14), (44, 160, 44), (214, 39, 40)]
+    for k, color in enumerate(colors):
+        points = [
+            (x, h / 2 + np.sin(x / (w / (6 + 2 * k))) * h / (3 + k))
+            for x in range(0, w, 3)
+        ]
+        draw.line(points, fill=color, width=4 * scale)
+    if smooth:
+        # Come matplotlib: bordi sfumati, quindi migliaia di colori.
+        img = img.resize((width, height), Image.Resampling.LANCZOS)
+    return img
+
+
+def make_photo(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width]
+    base = np.stack(
+        [xx * 255 // width, yy * 255 // height, (xx + yy) * 255 // (width + height)], axis=-1
+    ).astype(np.int16)
+    base += rng.integers(-40, 40, size=base.shape, dtype=np.int16)
+    return Image.fromarray(np.clip(base, 0, 255).astype(np.uint8), "RGB")
+
+
+def to_b64(img, fmt):
+    buffered = io.BytesIO()
+    img.save(buffered, format=fmt, **({"quality": 92} if fmt == "JPEG" else {}))
+    return base64.b64encode(buffered.getvalue()).decode("ascii")
+
+
+def prepared_size(b64_data, args, png, cell_size):
+    start = time.perf_counter()
+    result = prepare_iterm_image_props(b64_data, args.columns, args.max_pixels, None, png, cell_size)
+    elapsed = time.perf_counter() - start
+    if "error" in result:
+        raise SystemExit(result["error"])
+    with Image.open(io.BytesIO(base64.b64decode(result["b64"]))) as img:
+        pixels = f"{img.width}x{img.height}"
+    return len(result["b64"]), pixels, f"{result['width']}x{result['height']}", elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--columns", type=int, default=80, help="larghezza dell'immagine in colonne")
+    parser.add_argument("--cell", default="10x20", help="dimensione in pixel di una cella (LxA)")
+    parser.add_argument("--max-pixels", type=int, default=None, help="come image_max_size")
+    parser.add_argument("--json", action="store_true", help="output in formato JSON")
+    args = parser.parse_args()
+    cell_size = tuple(float(v) for v in args.cell.lower().split("x"))
+
+    images = {
+        "figure_300dpi": to_b64(make_figure(1800, 1200, smooth=True), "PNG"),
+        "flat_chart": to_b64(make_figure(1500, 1000, smooth=False), "PNG"),
+        "photo_jpeg": to_b64(make_photo(2400, 1600), "JPEG"),
+    }
+
+    results = []
+    for name, b64_data in images.items():
+        for protocol, png in (("iip", False), ("kgp", True)):
+            before, before_px, _, _ = prepared_size(b64_data, args, png, None)
+            after, after_px, cells, elapsed = prepared_size(b64_data, args, png, cell_size)
+            results.append(
+                {
+                    "image": name,
+                    "protocol": protocol,
+                    "bytes_before": before,
+                    "pixels_before": before_px,
+                    "bytes_after": after,
+                    "pixels_after": after_px,
+                    "cells": cells,
+                    "reduction": before / after,
+                    "prepare_ms": elapsed * 1000,
+                }
+            )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(
+        f"{'image':>14} {'proto':>5} {'before (B)':>11} {'pixels':>10} "
+        f"{'after (B)':>10} {'pixels':>9} {'cells':>7} {'x':>6} {'ms':>7}"
+    )
+    for r in results:
+        print(
+            f"{r['image']:>14} {r['protocol']:>5} {r['bytes_before']:>11} {r['pixels_before']:>10} "
+            f"{r['bytes_after']:>10} {r['pixels_after']:>9} {r['cells']:>7} "
+            f"{r['reduction']:>5.1f}x {r['prepare_ms']:>7.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
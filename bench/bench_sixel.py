@@ -0,0 +1,145 @@
+"""
+Benchmark dell'encoder Sixel.
+
+Confronta l'encoder vettoriale di `universal_image_handler.encode_sixel_bands`
+con l'implementazione originale a cicli annidati (riportata qui sotto come
+riferimento), verifica che l'output sia identico byte per byte e stampa il
+throughput in megapixel al secondo per diverse dimensioni e palette.
+
+Uso:
+    python bench/bench_sixel.py [--repeat N] [--json]
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "python"))
+
+from universal_image_handler import encode_sixel_bands, quantize_for_sixel  # noqa: E402
+
+SIZES = [(320, 240), (640, 480), (1200, 800)]
+PALETTES = [16, 64, 255]
+
+
+def legacy_encode_sixel_bands(pixels):
+    """Encoder originale, pixel per pixel: usato come riferimento."""
+    height, width = pixels.shape
+    sixel_data = io.StringIO()
+    for y in range(0, height, 6):
+        bands = {}
+        for i in range(6):
+            if y + i >= height:
+                continue
+            for x in range(width):
+                color_index = pixels[y + i, x]
+                if color_index not in bands:
+                    bands[color_index] = np.zeros(width, dtype=int)
+                bands[color_index][x] |= 1 << i
+
+        for color_index, data in sorted(bands.items()):
+            sixel_data.write(f"#{color_index}")
+            last_val = -1
+            count = 0
+            for val in data:
+                if val == last_val:
+                    count += 1
+                else:
+                    if count > 3:
+                        sixel_data.write(f"!{count}{chr(last_val + 63)}")
+                    else:
+                        sixel_data.write(chr(last_val + 63) * count)
+                    last_val = val
+                    count = 1
+            if count > 3:
+                sixel_data.write(f"!{count}{chr(last_val + 63)}")
+            else:
+                sixel_data.write(chr(last_val + 63) * count)
+
+        sixel_data.write("-")
+    return sixel_data.getvalue()
+
+
+def make_plot_image(width, height, seed=0):
+    """Immagine sintetica simile a un grafico: sfondo, gradiente, linee e rumore."""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width]
+    base = np.full((height, width, 3), 255, dtype=np.uint8)
+    # Area con gradiente (tipo heatmap)
+    h2, w2 = height // 2, width // 2
+    base[h2:, w2:, 0] = (xx[h2:, w2:] * 255 // max(1, width)).astype(np.uint8)
+    base[h2:, w2:, 1] = (yy[h2:, w2:] * 255 // max(1, height)).astype(np.uint8)
+    base[h2:, w2:, 2] = 128
+    # Area rumorosa (tipo scatter denso)
+    noise = rng.integers(0, 256, size=(h2, w2, 3), dtype=np.uint8)
+    base[:h2, :w2] = noise
+    img = Image.fromarray(base, "RGB")
+    draw = ImageDraw.Draw(img)
+    for k in range(8):
+        points = [
+            (x, height / 2 + np.sin(x / (20 + 5 * k)) * height / 3)
+            for x in range(0, width, 4)
+        ]
+        draw.line(points, fill=(30 * k, 80, 255 - 30 * k), width=2)
+    return img
+
+
+def time_call(fn, arg, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(arg)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="ripetizioni per misura")
+    parser.add_argument("--json", action="store_true", help="output in formato JSON")
+    args = parser.parse_args()
+
+    results = []
+    for width, height in SIZES:
+        img = make_plot_image(width, height)
+        for max_colors in PALETTES:
+            pixels, _ = quantize_for_sixel(img, max_colors)
+            legacy_time, legacy_out = time_call(legacy_encode_sixel_bands, pixels, 1)
+            fast_time, fast_out = time_call(encode_sixel_bands, pixels, args.repeat)
+            if fast_out != legacy_out:
+                raise SystemExit(
+                    f"Output diverso per {width}x{height} con {max_colors} colori"
+                )
+            megapixels = width * height / 1e6
+            results.append(
+                {
+                    "size": f"{width}x{height}",
+                    "colors": max_colors,
+                    "legacy_mpx_s": megapixels / legacy_time,
+                    "vectorized_mpx_s": megapixels / fast_time,
+                    "speedup": legacy_time / fast_time,
+                    "bytes": len(fast_out),
+                }
+            )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'size':>10} {'colors':>6} {'legacy MP/s':>12} {'vector MP/s':>12} {'speedup':>8}")
+    for r in results:
+        print(
+            f"{r['size']:>10} {r['colors']:>6} {r['legacy_mpx_s']:>12.3f} "
+            f"{r['vectorized_mpx_s']:>12.2f} {r['speedup']:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
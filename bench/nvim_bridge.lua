@@ -0,0 +1,61 @@
+-- bench/nvim_bridge.lua
+-- Driver per `nvim --headless` usato da bench/bench_bridge.py --nvim.
+-- Legge gli scenari dal file JSON indicato in $JOVE_BENCH_SPEC, li esegue in un kernel
+-- avviato dal plugin e scrive tempi e statistiche (`jove.stats`) nel file `output`.
+local spec = vim.json.decode(table.concat(vim.fn.readfile(os.getenv("JOVE_BENCH_SPEC")), "\n"))
+
+vim.g.jove_default_python = spec.python
+require("jove").setup({ log_level = vim.log.levels.WARN })
+
+local kernel = require("jove.kernel")
+local state = require("jove.state")
+local stats = require("jove.stats")
+
+local bufnr = vim.api.nvim_get_current_buf()
+vim.bo[bufnr].filetype = "python"
+
+local ready = false
+kernel.start("python", function()
+	ready = true
+end)
+assert(vim.wait(60000, function()
+	return ready
+end, 20), "Il kernel non è pronto")
+
+local function execute_and_wait(code)
+	local lines = vim.split(code, "\n")
+	vim.api.nvim_buf_set_lines(bufnr, 0, -1, false, lines)
+	local _, msg_id = kernel.execute_cell("python", code, bufnr, 0, #lines - 1)
+	assert(vim.wait(600000, function()
+		return state.get_kernel("python").executions[msg_id] == nil
+	end, 5), "Timeout in attesa del kernel")
+end
+
+-- Riscaldamento: codice di setup del kernel e primo ridisegno.
+execute_and_wait("None")
+
+local results = { scenarios = vim.empty_dict() }
+for _, scenario in ipairs(spec.scenarios) do
+	stats.reset()
+	local start = vim.uv.hrtime()
+	execute_and_wait(scenario.code)
+	local wall_ms = (vim.uv.hrtime() - start) / 1e6
+	-- Le immagini inline vengono disegnate in modo differito dopo la risposta del worker.
+	vim.wait(500, function()
+		return false
+	end, 50)
+	results.scenarios[scenario.name] = {
+		wall_ms = wall_ms,
+		stats = stats.snapshot().kernels.python or vim.empty_dict(),
+	}
+end
+
+vim.fn.writefile({ vim.json.encode(results) }, spec.output)
+
+local k_info = state.get_kernel("python")
+if k_info then
+	pcall(vim.fn.jobstop, k_info.py_client_job_id)
+	pcall(vim.fn.jobstop, k_info.ipykernel_job_id)
+end
+require("jove.bridge").stop()
+vim.cmd("qa!")
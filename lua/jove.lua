@@ -12,7 +12,8 @@ vim.g.jove_default_python = vim.g.jove_default_python or "python"
 local function deep_merge(tbl1, tbl2)
 	local result = vim.deepcopy(tbl1)
 	for k, v in pairs(tbl2 or {}) do
-		if type(v) == "table" and type(result[k]) == "table" then
+		-- Le liste (es. output_mime_types) dell'utente sostituiscono quelle predefinite.
+		if type(v) == "table" and type(result[k]) == "table" and not (vim.islist or vim.tbl_islist)(v) then
 			result[k] = deep_merge(result[k], v)
 		else
 			result[k] = v
@@ -33,6 +34,57 @@ local defaults = {
 	image_renderer = "iip", -- Renderer per le immagini: "popup", "iip" (inline), "terminal_popup" (re-openable)
 	image_width = 80,
 	image_max_size = 400, -- Maximum size in pixels for height/width (preserves aspect ratio)
+	image_cache = {
+		memory_entries = 64, -- Immagini preparate tenute in memoria dal worker (0 per disabilitare la cache)
+		disk = true, -- Salva le immagini preparate anche in stdpath("cache")/jove/images
+	},
+	-- Le immagini più grandi di questa soglia (in byte) passano da Python a Lua tramite
+	-- file temporanei invece che nel JSON sullo stdout (0 per disabilitare).
+	payload_spool_threshold = 256 * 1024,
+	-- Gli output `stream` ravvicinati vengono accorpati dal client Python in un
+	-- aggiornamento per finestra di questi millisecondi (0 per disabilitare).
+	stream_window_ms = 16,
+	-- Numero massimo di righe di output mostrate sotto una cella (le ultime); le altre
+	-- restano consultabili con JoveSelectOutput (0 per nessun limite).
+	output_max_lines = 200,
+	-- Gli output text/plain più lunghi di queste righe (es. la repr di un DataFrame enorme)
+	-- restano nel client Python: arriva solo la prima pagina, le altre si caricano con
+	-- JoveMore o JoveSelectOutput (0 per inviare sempre tutto il testo).
+	output_page_lines = 200,
+	-- Rappresentazioni degli output inoltrate dal client Python, in ordine di preferenza
+	-- (delle immagini arriva solo la prima disponibile). Le altre (text/html, widget, LaTeX,
+	-- SVG...) restano nel client e si aprono con JoveMime ({} per inoltrare tutto).
+	output_mime_types = { "image/png", "image/jpeg", "image/gif", "text/plain" },
+	-- Aggiornamenti al secondo inoltrati al massimo per ogni display_id (grafici e dashboard
+	-- che chiamano update_display in un ciclo): dei fotogrammi arrivati nel frattempo viene
+	-- mostrato solo l'ultimo (0 per mostrarli tutti).
+	display_update_max_fps = 30,
+	-- Memoria (in byte, stimata) per gli output trattenuti di tutte le celle. Oltre il limite,
+	-- immagini e righe nascoste delle celle usate meno di recente vengono spostate su disco.
+	output_memory_budget = 64 * 1024 * 1024,
+	-- Livello minimo dei messaggi registrati nel log (vim.log.levels); vale anche per il
+	-- log del client Python. DEBUG registra ogni messaggio scambiato con il kernel.
+	log_level = vim.log.levels.INFO,
+	-- Righe di log conservate in memoria per JoveLog (le più vecchie vengono scartate).
+	log_max_lines = 2000,
+	-- Kernel di riserva tenuti avviati (e già collegati) per ogni kernel usato: l'avvio e il
+	-- riavvio prendono un kernel dal pool invece di attendere l'avvio di ipykernel (0 per disabilitare).
+	kernel_pool_size = 0,
+	-- Chi avvia il processo del kernel: "client" (il client Python, che lo avvia prima di
+	-- importare jupyter_client e segnala "connected" appena il kernel risponde) oppure
+	-- "lua" (jobstart da Neovim e attesa del file di connessione, come in passato).
+	kernel_launch = "client",
+	-- "shared": un solo processo client Python (bridge) per istanza di Neovim serve tutti i
+	-- kernel, indirizzati per ID; "per_kernel": un processo client per ogni kernel.
+	kernel_bridge = "shared",
+	-- Protocollo per le immagini inline: "auto" (in base al terminale: Kitty graphics protocol
+	-- per kitty e Ghostty, che trasmette ogni immagine una sola volta; altrimenti iTerm2),
+	-- "kgp" o "iip".
+	image_protocol = "auto",
+	-- Dimensione in pixel delle celle del terminale, per ridurre ogni immagine al riquadro
+	-- che occuperà: "auto" (letta dal terminale), { width = 10, height = 20 }, o false
+	-- (immagini inviate senza riduzione, con le proporzioni predefinite).
+	image_cell_size = "auto",
 	kernels = {
 		python = {
 			cmd = "{executable} -m ipykernel_launcher -f {connection_file}",
@@ -71,8 +123,10 @@ function M.setup(user_opts)
 		config[k] = v
 	end
 
-	log.add(vim.log.levels.DEBUG, "Configurazione utente applicata: " .. vim.inspect(user_opts))
-	log.add(vim.log.levels.DEBUG, "Configurazione finale: " .. vim.inspect(config))
+	if log.is_enabled(vim.log.levels.DEBUG) then
+		log.add(vim.log.levels.DEBUG, "Configurazione utente applicata: " .. vim.inspect(user_opts))
+		log.add(vim.log.levels.DEBUG, "Configurazione finale: " .. vim.inspect(config))
+	end
 
 	log.add(vim.log.levels.INFO, "[Jove] setup completato.")
 
@@ -81,13 +135,27 @@ function M.setup(user_opts)
 	require("jove.ansi").setup_highlights()
 
 	-- Autocmd per mantenere l'allineamento dei prompt e delle immagini durante l'editing e lo scrolling
-	vim.api.nvim_create_autocmd({ "TextChanged", "TextChangedI", "WinScrolled", "VimResized", "WinResized" }, {
+	vim.api.nvim_create_autocmd({
+		"TextChanged",
+		"TextChangedI",
+		"WinScrolled",
+		"VimResized",
+		"WinResized",
+		"BufWinEnter",
+		"WinClosed",
+		"TabEnter",
+	}, {
 		group = vim.api.nvim_create_augroup("JoveSync", { clear = true }),
 		callback = function(ev)
 			local state = require("jove.state")
 			local output = require("jove.output")
 			local bufnr = ev.buf
 
+			if ev.event == "VimResized" then
+				-- Un cambio di font cambia anche la dimensione in pixel delle celle.
+				require("jove.term-image.cell_size").invalidate()
+			end
+
 			-- 1. Allineamento Prompt (solo per modifiche testo nella cella corrente)
 			if ev.event == "TextChanged" or ev.event == "TextChangedI" then
 				local cursor_row = vim.api.nvim_win_get_cursor(0)[1] - 1
@@ -105,13 +173,8 @@ function M.setup(user_opts)
 			end
 
 			-- 2. Refresh Immagini (per ogni evento che sposta o altera il layout)
-			-- Usiamo un piccolo delay per evitare di inondare il TTY durante lo scroll veloce
-			if _G._jove_refresh_timer then
-				vim.fn.timer_stop(_G._jove_refresh_timer)
-			end
-			_G._jove_refresh_timer = vim.fn.timer_start(20, function()
-				output.refresh_images(bufnr)
-			end)
+			-- Gli eventi ravvicinati vengono accorpati per non inondare il TTY durante lo scroll veloce
+			output.schedule_image_refresh(bufnr)
 		end,
 	})
 end
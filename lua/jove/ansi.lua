@@ -4,183 +4,239 @@ local M = {}
 -- Mappa i codici colore ANSI di base a gruppi di highlight di Neovim.
 local color_map = {
 	-- Foreground
-	["30"] = { fg = "AnsiColor0" }, -- Black
-	["31"] = { fg = "AnsiColor1" }, -- Red
-	["32"] = { fg = "AnsiColor2" }, -- Green
-	["33"] = { fg = "AnsiColor3" }, -- Yellow
-	["34"] = { fg = "AnsiColor4" }, -- Blue
-	["35"] = { fg = "AnsiColor5" }, -- Magenta
-	["36"] = { fg = "AnsiColor6" }, -- Cyan
-	["37"] = { fg = "AnsiColor7" }, -- White
+	[30] = { fg = "AnsiColor0" }, -- Black
+	[31] = { fg = "AnsiColor1" }, -- Red
+	[32] = { fg = "AnsiColor2" }, -- Green
+	[33] = { fg = "AnsiColor3" }, -- Yellow
+	[34] = { fg = "AnsiColor4" }, -- Blue
+	[35] = { fg = "AnsiColor5" }, -- Magenta
+	[36] = { fg = "AnsiColor6" }, -- Cyan
+	[37] = { fg = "AnsiColor7" }, -- White
 	-- Background
-	["40"] = { bg = "AnsiBgColor0" },
-	["41"] = { bg = "AnsiBgColor1" },
-	["42"] = { bg = "AnsiBgColor2" },
-	["43"] = { bg = "AnsiBgColor3" },
-	["44"] = { bg = "AnsiBgColor4" },
-	["45"] = { bg = "AnsiBgColor5" },
-	["46"] = { bg = "AnsiBgColor6" },
-	["47"] = { bg = "AnsiBgColor7" },
+	[40] = { bg = "AnsiBgColor0" },
+	[41] = { bg = "AnsiBgColor1" },
+	[42] = { bg = "AnsiBgColor2" },
+	[43] = { bg = "AnsiBgColor3" },
+	[44] = { bg = "AnsiBgColor4" },
+	[45] = { bg = "AnsiBgColor5" },
+	[46] = { bg = "AnsiBgColor6" },
+	[47] = { bg = "AnsiBgColor7" },
 	-- Bright Foreground
-	["90"] = { fg = "AnsiColor8" },
-	["91"] = { fg = "AnsiColor9" },
-	["92"] = { fg = "AnsiColor10" },
-	["93"] = { fg = "AnsiColor11" },
-	["94"] = { fg = "AnsiColor12" },
-	["95"] = { fg = "AnsiColor13" },
-	["96"] = { fg = "AnsiColor14" },
-	["97"] = { fg = "AnsiColor15" },
+	[90] = { fg = "AnsiColor8" },
+	[91] = { fg = "AnsiColor9" },
+	[92] = { fg = "AnsiColor10" },
+	[93] = { fg = "AnsiColor11" },
+	[94] = { fg = "AnsiColor12" },
+	[95] = { fg = "AnsiColor13" },
+	[96] = { fg = "AnsiColor14" },
+	[97] = { fg = "AnsiColor15" },
 	-- Bright Background
-	["100"] = { bg = "AnsiBgColor8" },
-	["101"] = { bg = "AnsiBgColor9" },
-	["102"] = { bg = "AnsiBgColor10" },
-	["103"] = { bg = "AnsiBgColor11" },
-	["104"] = { bg = "AnsiBgColor12" },
-	["105"] = { bg = "AnsiBgColor13" },
-	["106"] = { bg = "AnsiBgColor14" },
-	["107"] = { bg = "AnsiBgColor15" },
+	[100] = { bg = "AnsiBgColor8" },
+	[101] = { bg = "AnsiBgColor9" },
+	[102] = { bg = "AnsiBgColor10" },
+	[103] = { bg = "AnsiBgColor11" },
+	[104] = { bg = "AnsiBgColor12" },
+	[105] = { bg = "AnsiBgColor13" },
+	[106] = { bg = "AnsiBgColor14" },
+	[107] = { bg = "AnsiBgColor15" },
 }
 
---- Imposta i gruppi di highlight predefiniti per i colori ANSI.
-function M.setup_highlights()
-	local colors = {
-		"#000000",
-		"#CD3131",
-		"#0DBC79",
-		"#E5E510",
-		"#2472C8",
-		"#BC3FBC",
-		"#11A8CD",
-		"#E5E5E5",
-		"#666666",
-		"#F14C4C",
-		"#23D186",
-		"#F5F543",
-		"#3B8EEA",
-		"#D670D6",
-		"#29B8DB",
-		"#E5E5E5",
-	}
+-- Colori dei 16 colori ANSI di base (0-7 normali, 8-15 brillanti).
+local base_colors = {
+	"#000000",
+	"#CD3131",
+	"#0DBC79",
+	"#E5E510",
+	"#2472C8",
+	"#BC3FBC",
+	"#11A8CD",
+	"#E5E5E5",
+	"#666666",
+	"#F14C4C",
+	"#23D186",
+	"#F5F543",
+	"#3B8EEA",
+	"#D670D6",
+	"#29B8DB",
+	"#E5E5E5",
+}
+
+-- Registro dei gruppi di highlight già definiti per i colori 256 e truecolor: ogni gruppo
+-- viene definito una sola volta, non a ogni sequenza di escape che lo usa.
+local defined = {}
+-- Liste di gruppi { fg, bg } già create: [fg or ""][bg or ""] = lista.
+local combined = {}
+
+--- Colore esadecimale di un indice della palette xterm a 256 colori.
+local function xterm_color(index)
+	if index < 16 then
+		return base_colors[index + 1]
+	elseif index < 232 then
+		local levels = { 0, 95, 135, 175, 215, 255 }
+		local n = index - 16
+		return string.format("#%02x%02x%02x", levels[math.floor(n / 36) + 1], levels[math.floor(n / 6) % 6 + 1], levels[n % 6 + 1])
+	end
+	local gray = 8 + (index - 232) * 10
+	return string.format("#%02x%02x%02x", gray, gray, gray)
+end
+
+--- Restituisce (definendolo la prima volta) il gruppo per un colore 256 di primo piano o di sfondo.
+local function hl_256(is_bg, index)
+	local name = (is_bg and "AnsiBg256_" or "AnsiFg256_") .. index
+	if not defined[name] then
+		defined[name] = true
+		if is_bg then
+			vim.api.nvim_set_hl(0, name, { bg = xterm_color(index), ctermbg = index, default = true })
+		else
+			vim.api.nvim_set_hl(0, name, { fg = xterm_color(index), ctermfg = index, default = true })
+		end
+	end
+	return name
+end
+
+--- Restituisce (definendolo la prima volta) il gruppo per un colore truecolor.
+local function hl_true(is_bg, r, g, b)
+	local name = string.format("%s_%d_%d_%d", is_bg and "AnsiBgTrue" or "AnsiFgTrue", r, g, b)
+	if not defined[name] then
+		defined[name] = true
+		local hex = string.format("#%02x%02x%02x", r, g, b)
+		vim.api.nvim_set_hl(0, name, is_bg and { bg = hex, default = true } or { fg = hex, default = true })
+	end
+	return name
+end
+
+--- Definisce i gruppi dei 16 colori di base e dimentica quelli creati al bisogno.
+local function define_palette()
 	for i = 0, 15 do
-		vim.api.nvim_command(string.format("highlight default AnsiColor%d guifg=%s", i, colors[i + 1]))
-		vim.api.nvim_command(string.format("highlight default AnsiBgColor%d guibg=%s", i, colors[i + 1]))
+		vim.api.nvim_set_hl(0, "AnsiColor" .. i, { fg = base_colors[i + 1], ctermfg = i, default = true })
+		vim.api.nvim_set_hl(0, "AnsiBgColor" .. i, { bg = base_colors[i + 1], ctermbg = i, default = true })
+	end
+	defined = {}
+end
+
+--- Imposta i gruppi di highlight predefiniti per i colori ANSI. Dopo un cambio di
+-- colorscheme (che li cancella) vengono ridefiniti, e così i gruppi creati al bisogno.
+function M.setup_highlights()
+	define_palette()
+	vim.api.nvim_create_autocmd("ColorScheme", {
+		group = vim.api.nvim_create_augroup("JoveAnsi", { clear = true }),
+		callback = define_palette,
+	})
+end
+
+--- Gruppo (o lista di gruppi) di highlight per i colori correnti. Le liste vengono
+-- create una volta per combinazione di colori e condivise tra i chunk.
+local function hl_group(fg, bg, default_hl)
+	if not fg and not bg then
+		return default_hl
 	end
+	local by_bg = combined[fg or ""]
+	if not by_bg then
+		by_bg = {}
+		combined[fg or ""] = by_bg
+	end
+	local group = by_bg[bg or ""]
+	if not group then
+		group = { fg or bg, fg and bg or nil }
+		by_bg[bg or ""] = group
+	end
+	return group
 end
 
+-- Codici della sequenza SGR in corso di analisi (riusata tra le chiamate).
+local codes = {}
+
 --- Analizza una stringa con codici di escape ANSI e la converte in una lista di "chunk"
---- per la funzione `virt_text` di Neovim.
+--- per la funzione `virt_text` di Neovim. Le sequenze CSI diverse dai colori (SGR, `m`),
+--- come spostamenti del cursore o cancellazioni, vengono rimosse.
 --- @param text (string) Il testo da analizzare.
 --- @param default_hl (string) Il gruppo di highlight da usare come predefinito.
 --- @return (table) Una tabella di chunk, es. `{{ "testo1", "hl1" }, { "testo2", "hl2" }}`.
 function M.parse(text, default_hl)
+	default_hl = default_hl or "Normal"
+	if text == "" then
+		return {}
+	end
+	-- Percorso veloce: la gran parte delle righe non contiene sequenze di escape.
+	if not text:find("\27", 1, true) then
+		return { { text, default_hl } }
+	end
+
 	local chunks = {}
 	local current_fg = nil
 	local current_bg = nil
 	local i = 1
-	local current_chunk_start = 1
-
-	-- Helper to create the highlight group
-	local function get_hl_group()
-		if not current_fg and not current_bg then
-			return default_hl or "Normal"
-		end
-		local group = {}
-		if current_fg then
-			table.insert(group, current_fg)
-		end
-		if current_bg then
-			table.insert(group, current_bg)
-		end
-		return group
-	end
 
 	while true do
-		local start, finish, code_str = text:find("\x1b%[([%d;]*)m", i)
+		local start, finish, code_str, final = text:find("\27%[([%d;:?]*)(%a)", i)
 
 		if not start then
-			if current_chunk_start <= #text then
-				table.insert(chunks, { text:sub(current_chunk_start), get_hl_group() })
+			if i <= #text then
+				chunks[#chunks + 1] = { text:sub(i), hl_group(current_fg, current_bg, default_hl) }
 			end
 			break
 		end
 
-		if start > current_chunk_start then
-			table.insert(chunks, { text:sub(current_chunk_start, start - 1), get_hl_group() })
+		if start > i then
+			chunks[#chunks + 1] = { text:sub(i, start - 1), hl_group(current_fg, current_bg, default_hl) }
 		end
 
-		local codes = vim.split(code_str, ";")
-		if #codes == 0 or code_str == "" then
-			codes = { "0" }
-		end
+		if final == "m" then
+			local n = 0
+			for code in (code_str .. ";"):gmatch("([^;]*);") do
+				n = n + 1
+				codes[n] = tonumber(code) or 0 -- Un codice vuoto vale 0 (reset)
+			end
 
-		local code_idx = 1
-		while code_idx <= #codes do
-			local code = codes[code_idx]
-			if code == "0" or code == "" then
-				current_fg, current_bg = nil, nil
-			elseif code == "38" then -- Extended foreground color
-				code_idx = code_idx + 1
-				local next_code = codes[code_idx]
-				if next_code == "5" then -- 256 color
-					code_idx = code_idx + 1
-					local color_index = tonumber(codes[code_idx])
-					if color_index then
-						local hl_name = "AnsiFg256_" .. color_index
-						pcall(
-							vim.api.nvim_command,
-							string.format("highlight default %s ctermfg=%s guifg=NONE", hl_name, color_index)
-						)
-						current_fg = hl_name
-					end
-				elseif next_code == "2" then -- True color
-					local r, g, b = tonumber(codes[code_idx + 1]), tonumber(codes[code_idx + 2]), tonumber(codes[code_idx + 3])
-					if r and g and b then
-						local hex = string.format("#%02x%02x%02x", r, g, b)
-						local hl_name = "AnsiFgTrue_" .. r .. "_" .. g .. "_" .. b
-						pcall(vim.api.nvim_command, string.format("highlight default %s guifg=%s", hl_name, hex))
-						current_fg = hl_name
+			local code_idx = 1
+			while code_idx <= n do
+				local code = codes[code_idx]
+				if code == 0 then
+					current_fg, current_bg = nil, nil
+				elseif code == 39 then
+					current_fg = nil
+				elseif code == 49 then
+					current_bg = nil
+				elseif code == 38 or code == 48 then -- Colore esteso di primo piano o di sfondo
+					local is_bg = code == 48
+					local mode = codes[code_idx + 1]
+					local group = nil
+					if mode == 5 and code_idx + 2 <= n then -- 256 colori
+						local index = codes[code_idx + 2]
+						if index <= 255 then
+							group = hl_256(is_bg, index)
+						end
+						code_idx = code_idx + 2
+					elseif mode == 2 and code_idx + 4 <= n then -- Truecolor
+						local r, g, b = codes[code_idx + 2], codes[code_idx + 3], codes[code_idx + 4]
+						if r <= 255 and g <= 255 and b <= 255 then
+							group = hl_true(is_bg, r, g, b)
+						end
+						code_idx = code_idx + 4
+					else
+						code_idx = n -- Sequenza incompleta: il resto non è interpretabile
 					end
-					code_idx = code_idx + 3
-				end
-			elseif code == "48" then -- Extended background color
-				local next_code = codes[code_idx]
-				if next_code == "5" then -- 256 color
-					code_idx = code_idx + 1
-					local color_index = tonumber(codes[code_idx])
-					if color_index then
-						local hl_name = "AnsiBg256_" .. color_index
-						pcall(
-							vim.api.nvim_command,
-							string.format("highlight default %s ctermbg=%s guibg=NONE", hl_name, color_index)
-						)
-						current_bg = hl_name
+					if group and is_bg then
+						current_bg = group
+					elseif group then
+						current_fg = group
 					end
-				elseif next_code == "2" then -- True color
-					local r, g, b = tonumber(codes[code_idx + 1]), tonumber(codes[code_idx + 2]), tonumber(codes[code_idx + 3])
-					if r and g and b then
-						local hex = string.format("#%02x%02x%02x", r, g, b)
-						local hl_name = "AnsiBgTrue_" .. r .. "_" .. g .. "_" .. b
-						pcall(vim.api.nvim_command, string.format("highlight default %s guibg=%s", hl_name, hex))
-						current_bg = hl_name
-					end
-					code_idx = code_idx + 3
-				end
-			else
-				local color_info = color_map[code]
-				if color_info then
-					if color_info.fg then
-						current_fg = color_info.fg
-					end
-					if color_info.bg then
-						current_bg = color_info.bg
+				else
+					local color_info = color_map[code]
+					if color_info then
+						if color_info.fg then
+							current_fg = color_info.fg
+						end
+						if color_info.bg then
+							current_bg = color_info.bg
+						end
 					end
 				end
+				code_idx = code_idx + 1
 			end
-			code_idx = code_idx + 1
 		end
 
 		i = finish + 1
-		current_chunk_start = i
 	end
 
 	return chunks
@@ -0,0 +1,127 @@
+-- lua/jove/bridge.lua
+-- Processo bridge condiviso (`kernel_bridge = "shared"`): un solo client Python
+-- (py_kernel_client.py --multiplex) per istanza di Neovim gestisce le connessioni a
+-- tutti i kernel. Ogni messaggio scambiato sul suo stdin/stdout porta nel campo
+-- `kernel` l'ID del kernel a cui si riferisce.
+local M = {}
+
+local log = require("jove.log")
+local line_reader = require("jove.line_reader")
+
+local job_id = nil
+-- [id] = route del kernel ({ name = nome nello stato, nil dopo l'arresto })
+local routes = {}
+local id_counter = 0
+
+--- Restituisce un nuovo ID per un kernel. Il contatore fa sì che un kernel riavviato
+-- con lo stesso nome non riceva i messaggi (in ritardo) di quello precedente.
+function M.new_id(kernel_name)
+	id_counter = id_counter + 1
+	return string.format("%s#%d", kernel_name, id_counter)
+end
+
+--- Instrada una riga JSON del bridge al kernel indicato dal suo campo `kernel`.
+local function route_line(json_line, handlers)
+	local ok, data = pcall(vim.json.decode, json_line)
+	if not ok or type(data) ~= "table" then
+		log.add(vim.log.levels.ERROR, "Errore JSON dal bridge Python: " .. json_line)
+		return
+	end
+	local route = data.kernel and routes[data.kernel]
+	if not route then
+		if data.kernel == nil and data.type == "error" then
+			log.add(vim.log.levels.ERROR, "Errore dal bridge Python: " .. tostring(data.message))
+		end
+		return -- Kernel già fermato: il messaggio è in ritardo
+	end
+	if data.type == "client_exited" then
+		routes[data.kernel] = nil
+		handlers.on_exit(route, data.exit_code)
+	elseif route.name then
+		handlers.on_message(route.name, json_line, data)
+	end
+end
+
+--- Avvia il processo bridge, se non è già attivo.
+local function ensure_started(cmd, handlers)
+	if job_id then
+		return true
+	end
+	local new_job_id = vim.fn.jobstart(cmd, {
+		stdin = "pipe",
+		on_stdout = line_reader.new(function(lines)
+			handlers.on_lines(lines, function(line)
+				route_line(line, handlers)
+			end)
+		end),
+		on_stderr = function(_, data, _)
+			log.add(vim.log.levels.ERROR, "Python bridge stderr: " .. table.concat(data, "\n"))
+		end,
+		on_exit = function(_, exit_code, _)
+			log.add(vim.log.levels.INFO, "Bridge Python terminato con codice: " .. exit_code)
+			job_id = nil
+			-- Con il processo muoiono tutti i client dei kernel.
+			local orphaned = routes
+			routes = {}
+			vim.schedule(function()
+				for _, route in pairs(orphaned) do
+					handlers.on_exit(route, exit_code)
+				end
+			end)
+		end,
+	})
+	if new_job_id <= 0 then
+		log.add(vim.log.levels.ERROR, "Errore nell'avvio del bridge Python: " .. table.concat(cmd, " "))
+		return false
+	end
+	job_id = new_job_id
+	return true
+end
+
+--- Collega (o avvia, se `payload.kernel_cmd` è presente) un kernel nel bridge, avviando
+-- il processo bridge al primo kernel.
+-- @param id (string) L'ID del kernel nel bridge (vedi `new_id`).
+-- @param route (table) La route del kernel: i messaggi vanno a `route.name`.
+-- @param payload (table) connection_file, kernel_cmd, image_width, image_renderer.
+-- @param cmd (table) Il comando del bridge, usato solo se il processo non è ancora attivo.
+-- @param handlers (table) `on_message(kernel_name, json_line, data)`, `on_exit(route, exit_code)` e
+--   `on_lines(lines, handle)`, che gestisce con `handle` ogni riga di un gruppo arrivato insieme.
+-- @return (boolean) true se la richiesta è stata inviata al bridge.
+function M.start_kernel(id, route, payload, cmd, handlers)
+	if not ensure_started(cmd, handlers) then
+		return false
+	end
+	routes[id] = route
+	return M.send(id, { command = "start", payload = payload })
+end
+
+--- Invia un comando al kernel `id` del bridge.
+-- @return (boolean) true se il comando è stato inviato.
+function M.send(id, data_table)
+	if not job_id or not routes[id] then
+		return false
+	end
+	data_table.kernel = id
+	vim.fn.jobsend(job_id, vim.json.encode(data_table) .. "\n")
+	return true
+end
+
+--- Ferma un kernel del bridge. I suoi messaggi ancora in arrivo vengono ignorati.
+function M.stop_kernel(id)
+	M.send(id, { command = "shutdown" })
+	routes[id] = nil
+end
+
+--- Ferma il processo bridge (e con esso tutti i kernel che gestisce).
+function M.stop()
+	if job_id then
+		vim.fn.jobstop(job_id)
+	end
+end
+
+--- Job ID del processo bridge (nil se non è attivo).
+function M.job_id()
+	return job_id
+end
+
+return M
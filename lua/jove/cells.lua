@@ -93,6 +93,26 @@ function M.find_jupytext_cell_boundaries(bufnr, cursor_row)
 	return cell_start_row, cell_end_row
 end
 
+--- Trova tutte le celle Jupytext di un buffer (marcatori '# %%'), in ordine.
+-- Le righe prima del primo marcatore, se presenti, formano la prima cella.
+-- @return (table) Lista di `{ start_row = ..., end_row = ... }` (0-indexed, inclusivi).
+function M.find_all_jupytext_cells(bufnr)
+	local lines = vim.api.nvim_buf_get_lines(bufnr, 0, -1, false)
+	local cell_marker_pattern = "^#%s*%%%%"
+	local result = {}
+	local cell_start_row = 0
+	for i = 1, #lines + 1 do
+		local row = i - 1
+		if i > #lines or lines[i]:match(cell_marker_pattern) then
+			if cell_start_row <= row - 1 then
+				table.insert(result, { start_row = cell_start_row, end_row = row - 1 })
+			end
+			cell_start_row = row + 1
+		end
+	end
+	return result
+end
+
 --- Cerca il marcatore di cella Jupytext successivo o precedente.
 function M.find_cell_marker(bufnr, start_row, direction)
 	local line_count = vim.api.nvim_buf_line_count(bufnr)
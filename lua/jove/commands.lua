@@ -41,7 +41,9 @@ end
 local function run_with_kernel(callback, kernel_name_override)
 	local active_kernel_name = kernel_name_override or vim.b.jove_active_kernel
 	if active_kernel_name then
-		if status.get_status(active_kernel_name) == "idle" then
+		local kernel_status = status.get_status(active_kernel_name)
+		-- Un kernel occupato accetta comunque nuove richieste: vengono messe in coda dal kernel.
+		if kernel_status == "idle" or kernel_status == "busy" then
 			callback(active_kernel_name)
 		elseif not status.get_status(active_kernel_name) then -- Non in esecuzione o in avvio
 			log.add(vim.log.levels.INFO, "Avvio del kernel richiesto: '" .. active_kernel_name .. "'...")
@@ -202,6 +204,29 @@ function M.execute_jupytext_cell_cmd()
 	run_with_kernel(execute, kernel_name_override)
 end
 
+--- Esegue le celle Jupytext del buffer corrente (tutte, o solo quelle da aggiornare).
+local function run_buffer_cells(only_stale)
+	local bufnr = vim.api.nvim_get_current_buf()
+	run_with_kernel(function(kernel_name)
+		local submitted = kernel.run_buffer_cells(kernel_name, bufnr, only_stale)
+		if submitted == 0 then
+			log.add(vim.log.levels.INFO, "Tutte le celle sono già aggiornate.")
+		else
+			log.add(vim.log.levels.INFO, string.format("%d celle inviate al kernel '%s'.", submitted, kernel_name))
+		end
+	end)
+end
+
+-- Comando per eseguire tutte le celle Jupytext del buffer
+function M.run_all_cmd()
+	run_buffer_cells(false)
+end
+
+-- Comando per eseguire solo le celle modificate (e le successive) dall'ultima esecuzione
+function M.run_stale_cmd()
+	run_buffer_cells(true)
+end
+
 -- Comando per muoversi alla cella successiva
 function M.next_cell_cmd()
 	local bufnr = vim.api.nvim_get_current_buf()
@@ -360,11 +385,64 @@ function M.list_kernels_cmd()
 	vim.api.nvim_buf_set_keymap(buf, "n", "q", "<cmd>close<cr>", { noremap = true, silent = true })
 end
 
+-- Comando per mostrare la memoria occupata dagli output delle celle
+function M.memory_cmd()
+	for _, line in ipairs(require("jove.state").memory_report()) do
+		vim.api.nvim_echo({ { line, "Normal" } }, false, {})
+	end
+end
+
+--- Comando per le statistiche di latenza e traffico dei kernel.
+--- Senza argomenti mostra il riepilogo; `reset` le azzera; `dump [file]` le salva in JSON.
+function M.stats_cmd(opts)
+	local stats = require("jove.stats")
+	local action = opts.fargs[1]
+	if action == "reset" then
+		stats.reset()
+		log.add(vim.log.levels.INFO, "Statistiche azzerate.")
+	elseif action == "dump" then
+		local path = opts.fargs[2]
+		if not path then
+			local dir = vim.fn.stdpath("cache") .. "/jove"
+			vim.fn.mkdir(dir, "p")
+			path = dir .. "/stats-" .. os.date("%Y%m%d-%H%M%S") .. ".json"
+		end
+		local ok, err = stats.dump(vim.fn.expand(path))
+		if ok then
+			log.add(vim.log.levels.INFO, "Statistiche salvate in " .. path)
+		else
+			log.add(vim.log.levels.ERROR, "Impossibile salvare le statistiche: " .. tostring(err))
+		end
+	else
+		for _, line in ipairs(stats.report()) do
+			vim.api.nvim_echo({ { line, "Normal" } }, false, {})
+		end
+	end
+end
+
 -- Comando per mostrare i log
 function M.show_log_cmd()
 	log.show()
 end
 
+--- Comando per i contatori della cache delle immagini preparate.
+function M.image_cache_cmd()
+	require("jove.image_renderer").get_cache_stats(function(stats, err)
+		if not stats then
+			log.add(vim.log.levels.WARN, "Impossibile leggere i contatori della cache immagini: " .. tostring(err))
+			return
+		end
+		local line = string.format(
+			"Cache immagini: %d hit in memoria, %d hit su disco, %d miss, %d voci in memoria",
+			stats.hits or 0,
+			stats.disk_hits or 0,
+			stats.misses or 0,
+			stats.entries or 0
+		)
+		vim.api.nvim_echo({ { line, "Normal" } }, false, {})
+	end)
+end
+
 --- NUOVO: Comando per testare il rendering di un'immagine inline (iTerm2/Wezterm).
 function M.test_image_cmd(args)
 	-- NOTA: Questo comando è per il debug. Non si integra con lo stato della cella,
@@ -403,6 +481,25 @@ function M.select_output_cmd()
 	output.show_selectable_output(bufnr, cursor_row)
 end
 
+--- Comando per caricare altre righe di un output paginato della cella corrente.
+function M.more_output_cmd(opts)
+	local output = require("jove.output")
+	local bufnr = vim.api.nvim_get_current_buf()
+	local cursor_row = vim.api.nvim_win_get_cursor(0)[1] - 1 -- 0-indexed
+	local cell_id = output.find_cell_near(bufnr, cursor_row)
+	local count = tonumber(opts.args)
+	if not cell_id or not output.load_more_output(cell_id, count) then
+		log.add(vim.log.levels.INFO, "Nessun output con altre righe da caricare vicino al cursore.")
+	end
+end
+
+function M.open_mime_cmd(opts)
+	local output = require("jove.output")
+	local bufnr = vim.api.nvim_get_current_buf()
+	local cursor_row = vim.api.nvim_win_get_cursor(0)[1] - 1 -- 0-indexed
+	output.open_dropped_output(bufnr, cursor_row, opts.args ~= "" and opts.args or nil)
+end
+
 -- =========================================================================
 -- REGISTRAZIONE DEI COMANDI
 -- =========================================================================
@@ -435,6 +532,16 @@ vim.api.nvim_create_user_command("JoveExecuteCell", M.execute_jupytext_cell_cmd,
 	desc = "Esegue la cella Jupytext corrente (delimitata da '# %%').",
 })
 
+vim.api.nvim_create_user_command("JoveRunAll", M.run_all_cmd, {
+	nargs = 0,
+	desc = "Esegue tutte le celle Jupytext del buffer nel kernel attivo.",
+})
+
+vim.api.nvim_create_user_command("JoveRunStale", M.run_stale_cmd, {
+	nargs = 0,
+	desc = "Riesegue solo dalla prima cella Jupytext modificata dall'ultima esecuzione in poi.",
+})
+
 vim.api.nvim_create_user_command("JoveNextCell", M.next_cell_cmd, {
 	nargs = 0,
 	desc = "Sposta il cursore all'inizio della cella Jupytext successiva.",
@@ -486,6 +593,24 @@ vim.api.nvim_create_user_command("JoveLog", M.show_log_cmd, {
 	desc = "Mostra i log di Jove in un nuovo buffer.",
 })
 
+vim.api.nvim_create_user_command("JoveImageCache", M.image_cache_cmd, {
+	nargs = 0,
+	desc = "Mostra i contatori (hit, miss) della cache delle immagini preparate.",
+})
+
+vim.api.nvim_create_user_command("JoveMemory", M.memory_cmd, {
+	nargs = 0,
+	desc = "Mostra la memoria occupata dagli output, per buffer e per cella.",
+})
+
+vim.api.nvim_create_user_command("JoveStats", M.stats_cmd, {
+	nargs = "*",
+	complete = function()
+		return { "reset", "dump" }
+	end,
+	desc = "Mostra le latenze per fase e i contatori dei messaggi (reset | dump [file.json]).",
+})
+
 vim.api.nvim_create_user_command("JoveTestImage", M.test_image_cmd, {
 	nargs = "?",
 	complete = "file",
@@ -497,4 +622,14 @@ vim.api.nvim_create_user_command("JoveSelectOutput", M.select_output_cmd, {
 	desc = "Mostra l'output della cella corrente in una finestra per la selezione.",
 })
 
+vim.api.nvim_create_user_command("JoveMore", M.more_output_cmd, {
+	nargs = "?",
+	desc = "Carica altre righe (predefinito: output_page_lines) di un output lungo della cella corrente.",
+})
+
+vim.api.nvim_create_user_command("JoveMime", M.open_mime_cmd, {
+	nargs = "?",
+	desc = "Apre una rappresentazione non inoltrata (es. text/html) di un output della cella corrente.",
+})
+
 return M
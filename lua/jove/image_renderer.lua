@@ -1,6 +1,9 @@
 local M = {}
 
 local log = require("jove.log")
+local payload = require("jove.payload")
+local adapter = require("jove.term-image.adapter")
+local cell_size = require("jove.term-image.cell_size")
 
 -- Fallback in puro Lua per la codifica base64.
 local b64_chars = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/="
@@ -54,59 +57,193 @@ local function write_raw_to_terminal(data)
 	vim.api.nvim_chan_send(2, final_data)
 end
 
---- Ottiene le proprietà dell'immagine (dimensioni, dati b64) da Python.
--- @param b64_data (string) Dati dell'immagine codificati in base64.
--- @param max_width (number|nil) Larghezza massima in caratteri.
--- @param max_pixels (number|nil) Dimensione massima in pixel (override config).
--- @return (table | nil) Una tabella con `width`, `height`, `b64` o `nil` in caso di errore.
-function M.get_inline_image_properties(b64_data, max_width, max_pixels)
+-- Stato del worker Python persistente che prepara le immagini.
+-- Le richieste sono identificate da un ID e risolte in modo asincrono.
+local worker = {
+	job_id = nil,
+	next_request_id = 0,
+	callbacks = {}, -- [request_id] = function(response)
+}
+
+--- Consegna una risposta del worker alla callback registrata per il suo ID.
+local function handle_worker_line(line)
+	local ok, response = pcall(vim.json.decode, line)
+	if not ok or type(response) ~= "table" then
+		log.add(vim.log.levels.ERROR, "[Jove] Risposta non valida dal worker immagini: " .. line)
+		return
+	end
+
+	local callback = worker.callbacks[response.id]
+	worker.callbacks[response.id] = nil
+	if callback then
+		response.id = nil
+		callback(response)
+	end
+end
+
+--- Avvia (se necessario) il worker persistente `image_renderer.py --server`.
+-- @return (integer|nil) L'ID del job, o nil in caso di errore.
+local function ensure_worker()
+	if worker.job_id then
+		return worker.job_id
+	end
+
 	local plugin_root = vim.g.jove_plugin_root
 	if not plugin_root then
 		return nil, "vim.g.jove_plugin_root non definito."
 	end
 
-	-- Sanitizza i dati b64 rimuovendo eventuali newline che potrebbero rompere il passaggio argomenti
-	b64_data = b64_data:gsub("[\n\r]", "")
-
 	local python_script = plugin_root .. "/python/image_renderer.py"
 	local python_exec = vim.g.python3_host_prog or vim.g.jove_default_python or "python3"
 
-	-- Esegue lo script python passandogli i dati b64 via stdin
-	-- Passa la larghezza massima come argomento se fornita
-	local cmd = { python_exec, python_script }
-	if max_width then
-		table.insert(cmd, tostring(max_width))
-	else
-		table.insert(cmd, "80") -- Default width if not provided
+	-- Cache delle immagini preparate: livello in memoria e (opzionale) su disco.
+	local cache_config = require("jove").get_config().image_cache or {}
+	local cache_dir = ""
+	if cache_config.disk then
+		cache_dir = vim.fn.stdpath("cache") .. "/jove/images"
 	end
+	local cmd = {
+		python_exec,
+		"-u",
+		python_script,
+		"--server",
+		tostring(cache_config.memory_entries or 0),
+		cache_dir,
+	}
 
+	local job_id = vim.fn.jobstart(cmd, {
+		stdin = "pipe",
+		on_stdout = require("jove.line_reader").new(function(lines)
+			for _, line in ipairs(lines) do
+				handle_worker_line(line)
+			end
+		end),
+		on_stderr = function(_, data, _)
+			if data and table.concat(data) ~= "" then
+				log.add(vim.log.levels.WARN, "[Jove] Worker immagini stderr: " .. table.concat(data, "\n"))
+			end
+		end,
+		on_exit = function(_, exit_code, _)
+			log.add(vim.log.levels.DEBUG, "[Jove] Worker immagini terminato con codice: " .. exit_code)
+			worker.job_id = nil
+			local pending = worker.callbacks
+			worker.callbacks = {}
+			vim.schedule(function()
+				for _, callback in pairs(pending) do
+					callback({ error = "Worker immagini terminato (codice " .. exit_code .. ")." })
+				end
+			end)
+		end,
+	})
+
+	if job_id <= 0 then
+		return nil, "Impossibile avviare il worker immagini: " .. python_exec
+	end
+	worker.job_id = job_id
+	return job_id
+end
+
+--- Invia una richiesta al worker e registra la callback che riceverà la risposta grezza.
+local function send_worker_request(request, callback)
+	local job_id, err = ensure_worker()
+	if not job_id then
+		vim.schedule(function()
+			callback({ error = err })
+		end)
+		return
+	end
+
+	worker.next_request_id = worker.next_request_id + 1
+	request.id = worker.next_request_id
+	worker.callbacks[request.id] = callback
+	vim.fn.chansend(job_id, vim.json.encode(request) .. "\n")
+end
+
+--- Ottiene le proprietà dell'immagine (dimensioni, dati b64) dal worker Python, in modo asincrono.
+-- @param b64_data (string|table) Dati dell'immagine codificati in base64, oppure un
+--   riferimento a un file dello spool (vedi `jove.payload`), che il worker legge direttamente.
+-- @param max_width (number|nil) Larghezza massima in caratteri.
+-- @param max_pixels (number|nil) Dimensione massima in pixel (override config).
+-- @param callback (function) Chiamata con `(image_data, nil)` in caso di successo, dove
+--   `image_data` contiene `width`, `height`, `b64`, oppure con `(nil, err)` in caso di errore.
+function M.get_inline_image_properties(b64_data, max_width, max_pixels, callback)
 	-- Gestione max_pixels: priorità all'argomento, poi config
-	if max_pixels then
-		table.insert(cmd, tostring(max_pixels))
+	if not max_pixels then
+		max_pixels = require("jove").get_config().image_max_size
+	end
+
+	local request = {
+		max_width = max_width or 80,
+		max_pixels = max_pixels,
+		png = adapter.needs_png() or nil, -- Es. per il Kitty graphics protocol
+	}
+	local cell = cell_size.get()
+	if cell then
+		-- Il worker riduce l'immagine al riquadro in pixel che occuperà nel terminale.
+		request.cell_width = cell.width
+		request.cell_height = cell.height
+	end
+	if payload.is_ref(b64_data) then
+		request.path = payload.path(b64_data)
+		request.offset = b64_data.offset
+		request.length = b64_data.length
 	else
-		local config = require("jove").get_config()
-		local config_max = config.image_max_size
-		if config_max then
-			table.insert(cmd, tostring(config_max))
-		end
+		-- Sanitizza i dati b64 rimuovendo eventuali newline che romperebbero il protocollo a righe
+		request.b64 = b64_data:gsub("[\n\r]", "")
 	end
 
-	local json_result = vim.fn.system(cmd, b64_data)
+	send_worker_request(request, function(image_data)
+		if request.path and image_data.b64 == nil then
+			-- Immagine non ricodificata: teniamo il riferimento, letto solo al momento del disegno.
+			image_data.b64 = b64_data
+		end
+		if image_data.error then
+			callback(nil, "Errore da Python: " .. tostring(image_data.error))
+		elseif not image_data.b64 or not image_data.height or not image_data.width then
+			callback(nil, "Dati immagine incompleti da Python.")
+		else
+			callback(image_data)
+		end
+	end)
+end
 
-	if vim.v.shell_error ~= 0 then
-		return nil, "Errore esecuzione Python: " .. json_result
-	end
+--- Richiede al worker i contatori della cache delle immagini preparate.
+-- @param callback (function) Chiamata con una tabella `{ hits, disk_hits, misses, entries }`
+--   oppure con `(nil, err)` in caso di errore.
+function M.get_cache_stats(callback)
+	send_worker_request({ command = "stats" }, function(stats)
+		if stats.error then
+			callback(nil, stats.error)
+		else
+			callback(stats)
+		end
+	end)
+end
 
-	local ok, image_data = pcall(vim.json.decode, json_result)
-	if not ok or (image_data and image_data.error) then
-		local err_msg = (image_data and image_data.error) or tostring(json_result)
-		return nil, "Errore da Python: " .. err_msg
+--- Libera nel terminale i dati di immagini non più mostrate, se il protocollo li conserva
+-- (es. il fotogramma sostituito da un update_display_data).
+-- @param images (table) Le proprietà delle immagini, come restituite dal worker.
+function M.free_images(images)
+	local sequence = adapter.delete({ images = images }, true)
+	if sequence and sequence ~= "" then
+		write_raw_to_terminal(sequence)
 	end
-	if not image_data or not image_data.b64 or not image_data.height or not image_data.width then
-		return nil, "Dati immagine incompleti da Python."
+end
+
+--- Cancella tutte le immagini dal terminale, se il protocollo le conserva (es. all'uscita di Neovim).
+function M.clear_all_images()
+	local sequence = adapter.reset()
+	if sequence then
+		write_raw_to_terminal(sequence)
 	end
+end
 
-	return image_data
+--- Arresta il worker immagini (es. all'uscita di Neovim).
+function M.stop_worker()
+	if worker.job_id then
+		vim.fn.jobstop(worker.job_id)
+		worker.job_id = nil
+	end
 end
 
 --- Disegna un'immagine nel terminale e registra le sue informazioni per la pulizia.
@@ -139,6 +276,11 @@ function M.draw_and_register_inline_image(bufnr, lineno, image_props, cell_id, r
 	local screen_col = pos.col + col_offset
 
 	if cell_info then
+		-- Le immagini disegnate nella cella, da cancellare con i protocolli che le gestiscono per ID.
+		local images = cell_info.image_output_info and cell_info.image_output_info.images or {}
+		if not vim.tbl_contains(images, image_props) then
+			table.insert(images, image_props)
+		end
 		cell_info.image_output_info = {
 			bufnr = bufnr,
 			buffer_line = lineno,
@@ -146,19 +288,25 @@ function M.draw_and_register_inline_image(bufnr, lineno, image_props, cell_id, r
 			height = image_props.height,
 			line = screen_row,
 			col = screen_col,
+			images = images,
+			placement = adapter.placements.INLINE,
 		}
 	end
 
-	local name_part = ""
-	if cell_id then
+	local sequence = adapter.draw(image_props, {
+		placement = adapter.placements.INLINE,
 		-- iTerm2 richiede che il nome sia codificato in base64
-		local b64_name = b64_encode(tostring(cell_id))
-		name_part = string.format("name=%s;", b64_name)
+		name = cell_id and b64_encode(tostring(cell_id)) or nil,
+	})
+	if not sequence then
+		return
 	end
 
 	local move_cursor_cmd = string.format("\x1b[%d;%dH", screen_row, screen_col)
-	local sequence = string.format("\x1b]1337;File=%sinline=1:%s\a", name_part, image_props.b64)
 	write_raw_to_terminal(move_cursor_cmd .. sequence)
+	if cell_id then
+		require("jove.stats").rendered(cell_id, "image")
+	end
 end
 
 --- Disegna un'immagine a coordinate assolute dello schermo (per finestre flottanti).
@@ -167,18 +315,22 @@ function M.draw_inline_image_at_pos(screen_row, screen_col, image_props)
 	local target_col = screen_col + 1 + 1
 	-- +1 perché le coordinate ANSI sono 1-indexed.
 	local target_row = screen_row + 1
+	local sequence = adapter.draw(image_props, { placement = adapter.placements.POPUP, float = true })
+	if not sequence then
+		return
+	end
 	local move_cursor_cmd = string.format("\x1b[%d;%dH", target_row, target_col)
-	local sequence = string.format("\x1b]1337;File=inline=1;size=%d;doNotMoveCursor=1:%s\a", #image_props.b64, image_props.b64)
 	write_raw_to_terminal(move_cursor_cmd .. sequence)
 end
 
 function M.render_image_from_b64(bufnr, lineno, b64_data, cell_id)
-	local image_props, err = M.get_inline_image_properties(b64_data)
-	if err then
-		log.add(vim.log.levels.ERROR, "[Jove TestImage] " .. err)
-		return
-	end
-	M.draw_and_register_inline_image(bufnr, lineno, image_props, cell_id)
+	M.get_inline_image_properties(b64_data, nil, nil, function(image_props, err)
+		if err then
+			log.add(vim.log.levels.ERROR, "[Jove TestImage] " .. err)
+			return
+		end
+		M.draw_and_register_inline_image(bufnr, lineno, image_props, cell_id)
+	end)
 end
 
 --- Renderizza un'immagine da un file (per JoveTestImage).
@@ -198,13 +350,23 @@ end
 local TRANSPARENT_PIXEL_B64 = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII="
 
 --- Pulisce l'area dove era stata disegnata un'immagine.
--- Se cell_id è presente, usa il rimpiazzo con pixel trasparente (più sicuro).
--- Altrimenti usa il fallback degli spazi (più rischioso per il codice).
-function M.clear_image_area(image_info, cell_id)
+-- Con i protocolli che gestiscono le immagini per ID (Kitty) ne cancella i posizionamenti.
+-- Altrimenti, se cell_id è presente, usa il rimpiazzo con pixel trasparente (più sicuro),
+-- oppure il fallback degli spazi (più rischioso per il codice).
+-- @param free (boolean|nil) L'output è stato rimosso: libera anche i dati nel terminale.
+function M.clear_image_area(image_info, cell_id, free)
 	if not image_info then
 		return
 	end
 
+	local delete_sequence = adapter.delete(image_info, free)
+	if delete_sequence then
+		if delete_sequence ~= "" then
+			write_raw_to_terminal(delete_sequence)
+		end
+		return
+	end
+
 	local start_row, start_col = image_info.line, image_info.col
 
 	-- Fallback se non abbiamo coordinate assolute
@@ -244,8 +406,12 @@ function M.clear_image_area(image_info, cell_id)
 end
 
 --- NUOVO: Renderizza un'immagine da dati B64 in una finestra popup Tcl/Tk.
--- @param b64_data (string) I dati dell'immagine codificati in base64.
+-- @param b64_data (string|table) I dati dell'immagine codificati in base64 (o un riferimento allo spool).
 function M.render_image_popup_from_b64(b64_data)
+	b64_data = payload.resolve_or_log(b64_data)
+	if not b64_data then
+		return
+	end
 	local popup_script = vim.g.jove_plugin_root .. "/python/popup_renderer.py"
 	local executable = vim.g.python3_host_prog or vim.g.jove_default_python or "python"
 
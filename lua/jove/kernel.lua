@@ -7,6 +7,47 @@ local status = require("jove.status")
 local message = require("jove.message")
 local output = require("jove.output")
 local log = require("jove.log")
+local cells = require("jove.cells")
+local stats = require("jove.stats")
+local bridge = require("jove.bridge")
+local line_reader = require("jove.line_reader")
+
+--- Aggiorna lo stato di una richiesta execute. La voce viene rimossa quando il kernel
+-- è tornato idle per la richiesta e ha inviato la sua execute_reply.
+-- @param event (string) "idle" oppure "reply" (in quel caso `reply` è il contenuto della risposta).
+local function update_execution(kernel_name, parent_id, event, reply)
+	local k_info = state.get_kernel(kernel_name)
+	local execution = k_info and parent_id and k_info.executions[parent_id]
+	if not execution then
+		return
+	end
+	if event == "reply" then
+		execution.replied = true
+		if execution.on_reply then
+			execution.on_reply(reply)
+		end
+		-- Le richieste annullate (es. dopo un errore o un'interruzione) non produrranno altro output.
+		if reply.status == "aborted" then
+			execution.idle = true
+		end
+	else
+		execution.idle = true
+	end
+	if execution.idle and execution.replied then
+		k_info.executions[parent_id] = nil
+	end
+end
+
+--- Indica se il kernel ha ancora richieste execute in coda o in esecuzione (non ancora idle).
+local function has_pending_executions(kernel_name)
+	local k_info = state.get_kernel(kernel_name)
+	for _, execution in pairs(k_info and k_info.executions or {}) do
+		if not execution.idle then
+			return true
+		end
+	end
+	return false
+end
 
 --- NUOVO: Esegue il codice di setup per un kernel (es. per matplotlib).
 local function execute_setup_code(kernel_name)
@@ -25,185 +66,477 @@ local function execute_setup_code(kernel_name)
 	M.send_to_py_client(kernel_name, { command = "execute", payload = req })
 end
 
-function M.start(kernel_name, on_ready_callback)
-	if not kernel_name then
-		log.add(vim.log.levels.ERROR, "Kernel name is nil")
-		return
-	end
-
-	if state.get_kernel(kernel_name) then
-		log.add(vim.log.levels.WARN, "Kernel '" .. kernel_name .. "' is already running or starting.")
-		return
+--- Sceglie l'eseguibile Python per un kernel.
+local function get_best_python(kernel_config)
+	-- 1. Priorità: Esplicito in configurazione kernel
+	if kernel_config.executable then return kernel_config.executable end
+
+	-- 2. Buffer-local (es. impostato da venv-selector)
+	if vim.b.python_exec then return vim.b.python_exec end
+
+	-- 3. Ambiente in working directory (.venv locale)
+	local local_venv = vim.fn.getcwd() .. "/.venv"
+	if vim.fn.isdirectory(local_venv) == 1 then
+		local venv_python = vim.fn.has("win32") == 1 and (local_venv .. "/Scripts/python.exe") or (local_venv .. "/bin/python")
+		if vim.fn.executable(venv_python) == 1 then
+			log.add(vim.log.levels.INFO, "[Jove] Trovato ambiente locale: " .. local_venv)
+			return venv_python
+		end
 	end
 
-	local kernels_config = config_module.get_config().kernels
-	local kernel_config = kernels_config[kernel_name]
-	if not kernel_config then
-		log.add(vim.log.levels.ERROR, "Configurazione non trovata per il kernel: " .. kernel_name)
-		return
+	-- 4. VIRTUAL_ENV standard (attivato nella shell)
+	if vim.env.VIRTUAL_ENV then
+		local venv_python = vim.fn.has("win32") == 1 and (vim.env.VIRTUAL_ENV .. "/Scripts/python.exe") or (vim.env.VIRTUAL_ENV .. "/bin/python")
+		if vim.fn.executable(venv_python) == 1 then
+			log.add(vim.log.levels.INFO, "[Jove] Uso VIRTUAL_ENV: " .. vim.env.VIRTUAL_ENV)
+			return venv_python
+		end
 	end
 
-	state.add_kernel(kernel_name, kernel_config)
-
-	local function get_best_python()
-		-- 1. Priorità: Esplicito in configurazione kernel
-		if kernel_config.executable then return kernel_config.executable end
+	-- 5. Fallback globale o default
+	return vim.g.jove_default_python or "python"
+end
 
-		-- 2. Buffer-local (es. impostato da venv-selector)
-		if vim.b.python_exec then return vim.b.python_exec end
+--- Aggiorna lo stato di un kernel. I kernel di riserva del pool non toccano la UI (spinner).
+local function set_status(kernel_name, value)
+	local k_info = state.get_kernel(kernel_name)
+	if k_info and k_info.pool_of then
+		state.update_kernel_status(kernel_name, value)
+	else
+		status.update_status(kernel_name, value)
+	end
+end
 
-		-- 3. Ambiente in working directory (.venv locale)
-		local local_venv = vim.fn.getcwd() .. "/.venv"
-		if vim.fn.isdirectory(local_venv) == 1 then
-			local venv_python = vim.fn.has("win32") == 1 and (local_venv .. "/Scripts/python.exe") or (local_venv .. "/bin/python")
-			if vim.fn.executable(venv_python) == 1 then
-				log.add(vim.log.levels.INFO, "[Jove] Trovato ambiente locale: " .. local_venv)
-				return venv_python
-			end
-		end
+--- Ferma i processi di un kernel. I callback dei job ancora in arrivo vengono ignorati,
+--- così non possono toccare un kernel avviato nel frattempo con lo stesso nome.
+local function stop_processes(kernel_info)
+	if kernel_info.route then
+		kernel_info.route.name = nil
+	end
+	if kernel_info.py_client_job_id then
+		vim.fn.jobstop(kernel_info.py_client_job_id)
+	end
+	if kernel_info.bridge_id then
+		bridge.stop_kernel(kernel_info.bridge_id)
+	end
+	if kernel_info.ipykernel_job_id then
+		vim.fn.jobstop(kernel_info.ipykernel_job_id)
+	end
+end
 
-		-- 4. VIRTUAL_ENV standard (attivato nella shell)
-		if vim.env.VIRTUAL_ENV then
-			local venv_python = vim.fn.has("win32") == 1 and (vim.env.VIRTUAL_ENV .. "/Scripts/python.exe") or (vim.env.VIRTUAL_ENV .. "/bin/python")
-			if vim.fn.executable(venv_python) == 1 then
-				log.add(vim.log.levels.INFO, "[Jove] Uso VIRTUAL_ENV: " .. vim.env.VIRTUAL_ENV)
-				return venv_python
+-- Kernel di riserva già avviati (o in avvio), per nome di configurazione:
+-- [kernel_name] = { nome_nello_stato, ... }
+local pools = {}
+local pool_counter = 0
+-- Attesa prima di riempire il pool, per non rallentare l'avvio del kernel in primo piano.
+local POOL_REFILL_DELAY_MS = 1000
+
+--- Una riserva morta prima di essere usata va tolta dal pool.
+local function forget_dead_reserve(route)
+	local k_info = route.name and state.get_kernel(route.name)
+	if k_info and k_info.pool_of then
+		local pool = pools[k_info.pool_of] or {}
+		for i, name in ipairs(pool) do
+			if name == route.name then
+				table.remove(pool, i)
+				break
 			end
 		end
-
-		-- 5. Fallback globale o default
-		return vim.g.jove_default_python or "python"
+		stop_processes(k_info)
+		state.remove_kernel(k_info.name)
 	end
+end
 
-	local kernel_exec = get_best_python()
-	log.add(vim.log.levels.INFO, string.format("[Jove] Ambiente selezionato per '%s': %s", kernel_name, kernel_exec))
+--- Avvia i processi (ipykernel e client Python) di un kernel registrato nello stato come `state_name`.
+-- Con `kernel_launch = "client"` il kernel viene avviato dal client Python stesso.
+-- @param pool_of (string|nil) Se presente, il kernel è una riserva del pool di quel kernel.
+-- @return (boolean) true se il processo del kernel è stato avviato.
+local function launch_kernel(state_name, kernel_config, on_ready_callback, pool_of)
+	state.add_kernel(state_name, kernel_config)
+	-- Nome con cui i messaggi dei processi vengono instradati: cambia se il kernel viene
+	-- preso dal pool, diventa nil quando il kernel viene fermato.
+	local route = { name = state_name }
+	state.set_kernel_property(state_name, "route", route)
+	state.set_kernel_property(state_name, "pool_of", pool_of)
+	if on_ready_callback then
+		state.set_kernel_property(state_name, "on_ready_callback", on_ready_callback)
+	end
 
+	local kernel_exec = get_best_python(kernel_config)
+	state.set_kernel_property(state_name, "executable", kernel_exec)
+	log.add(vim.log.levels.INFO, string.format("[Jove] Ambiente selezionato per '%s': %s", state_name, kernel_exec))
 
 	local connection_file = vim.fn.tempname() .. ".json"
 
 	local ipykernel_cmd = string.gsub(kernel_config.cmd, "{executable}", kernel_exec)
+	if config_module.get_config().kernel_launch == "client" then
+		-- Il client scrive il file di connessione e avvia il kernel prima di importare
+		-- jupyter_client: niente attesa del file né processo in più da gestire qui.
+		state.set_kernel_property(state_name, "kernel_cmd", ipykernel_cmd)
+		if not M.start_python_client(state_name, connection_file) then
+			log.add(vim.log.levels.ERROR, "Errore nell'avvio del client Python per: " .. state_name)
+			set_status(state_name, "error")
+			if pool_of then
+				state.remove_kernel(state_name)
+			end
+			return false
+		end
+		return true
+	end
 	ipykernel_cmd = string.gsub(ipykernel_cmd, "{connection_file}", connection_file)
 
 	log.add(vim.log.levels.INFO, "Avvio del processo ipykernel: " .. ipykernel_cmd)
 	local ipykernel_job_id = vim.fn.jobstart(ipykernel_cmd, {
 		on_stderr = function(_, data, _)
-			if data then
-				log.add(vim.log.levels.WARN, "ipykernel stderr (" .. kernel_name .. "): " .. table.concat(data, "\n"))
+			if data and route.name then
+				log.add(vim.log.levels.WARN, "ipykernel stderr (" .. route.name .. "): " .. table.concat(data, "\n"))
 			end
 		end,
 		on_exit = function(_, exit_code, _)
 			log.add(
 				vim.log.levels.INFO,
-				"Processo ipykernel per '" .. kernel_name .. "' terminato con codice: " .. exit_code
+				"Processo ipykernel per '" .. (route.name or state_name) .. "' terminato con codice: " .. exit_code
 			)
+			forget_dead_reserve(route)
 		end,
 	})
 
 	if ipykernel_job_id <= 0 then
-		log.add(vim.log.levels.ERROR, "Errore nell'avvio del processo ipykernel per: " .. kernel_name)
-		status.update_status(kernel_name, "error")
-		return
+		log.add(vim.log.levels.ERROR, "Errore nell'avvio del processo ipykernel per: " .. state_name)
+		set_status(state_name, "error")
+		if pool_of then
+			state.remove_kernel(state_name)
+		end
+		return false
 	end
+	state.set_kernel_property(state_name, "ipykernel_job_id", ipykernel_job_id)
 
 	local poll_interval_ms = 100
 	local timeout_ms = 10000
 	local attempts = timeout_ms / poll_interval_ms
 
 	local function poll_for_connection_file()
+		if not route.name then
+			return -- Kernel fermato durante l'avvio
+		end
 		if attempts <= 0 then
 			log.add(
 				vim.log.levels.ERROR,
-				"Timeout: Il file di connessione per '" .. kernel_name .. "' non è stato creato in tempo."
+				"Timeout: Il file di connessione per '" .. route.name .. "' non è stato creato in tempo."
 			)
 			vim.fn.jobstop(ipykernel_job_id)
 			return
 		end
 		attempts = attempts - 1
 		if vim.fn.filereadable(connection_file) == 1 and #vim.fn.readfile(connection_file) > 0 then
-			M.start_python_client(kernel_name, connection_file, ipykernel_job_id, on_ready_callback)
+			M.start_python_client(route.name, connection_file, ipykernel_job_id)
 			return
 		end
 		vim.defer_fn(poll_for_connection_file, poll_interval_ms)
 	end
 	vim.defer_fn(poll_for_connection_file, poll_interval_ms)
+	return true
 end
 
-function M.start_python_client(kernel_name, connection_file_path, ipykernel_job_id_ref, on_ready_callback)
-	local jove_config = config_module.get_config()
-	local image_width = tostring(jove_config.image_width or 120)
-	-- Passiamo sempre "none" al client Python. Tutta la logica di rendering delle
-	-- immagini (inline o popup) viene gestita da Lua per coerenza.
-	local image_renderer = "none"
+--- Riporta il pool di kernel di riserva di `kernel_name` alla dimensione `kernel_pool_size`.
+local function refill_pool(kernel_name)
+	local size = config_module.get_config().kernel_pool_size or 0
+	local kernel_config = config_module.get_config().kernels[kernel_name]
+	if size <= 0 or not kernel_config then
+		return
+	end
+	local pool = pools[kernel_name] or {}
+	pools[kernel_name] = pool
+	while #pool < size do
+		pool_counter = pool_counter + 1
+		local pooled_name = string.format("%s~pool%d", kernel_name, pool_counter)
+		if not launch_kernel(pooled_name, kernel_config, nil, kernel_name) then
+			return
+		end
+		table.insert(pool, pooled_name)
+	end
+end
+
+local function schedule_pool_refill(kernel_name)
+	if (config_module.get_config().kernel_pool_size or 0) > 0 then
+		vim.defer_fn(function()
+			refill_pool(kernel_name)
+		end, POOL_REFILL_DELAY_MS)
+	end
+end
+
+--- Prende un kernel di riserva dal pool e lo registra come `kernel_name`.
+-- Preferisce un kernel già connesso; altrimenti quello in avvio da più tempo.
+-- Vengono scartate le riserve avviate con un eseguibile Python diverso da quello attuale.
+-- @return (boolean) true se un kernel è stato preso dal pool.
+local function claim_pooled_kernel(kernel_name, on_ready_callback)
+	local pool = pools[kernel_name]
+	local kernel_config = config_module.get_config().kernels[kernel_name]
+	if not pool or #pool == 0 or not kernel_config then
+		return false
+	end
+
+	local executable = get_best_python(kernel_config)
+	local chosen
+	for i, pooled_name in ipairs(pool) do
+		local k_info = state.get_kernel(pooled_name)
+		if k_info and k_info.executable == executable and (not chosen or (k_info.connected and not chosen.connected)) then
+			chosen = { index = i, connected = k_info.connected }
+		end
+	end
+	if not chosen then
+		return false
+	end
+
+	local pooled_name = table.remove(pool, chosen.index)
+	local k_info = state.rename_kernel(pooled_name, kernel_name)
+	k_info.pool_of = nil
+	k_info.route.name = kernel_name
+	log.add(vim.log.levels.INFO, string.format("[Jove] Kernel '%s' preso dal pool (%s).", kernel_name, pooled_name))
+
+	if k_info.connected then
+		status.update_status(kernel_name, k_info.status or "idle")
+		if on_ready_callback then
+			vim.schedule(function()
+				on_ready_callback(kernel_name)
+			end)
+		end
+	else
+		k_info.on_ready_callback = on_ready_callback
+	end
+	return true
+end
+
+function M.start(kernel_name, on_ready_callback)
+	if not kernel_name then
+		log.add(vim.log.levels.ERROR, "Kernel name is nil")
+		return
+	end
+
+	if state.get_kernel(kernel_name) then
+		log.add(vim.log.levels.WARN, "Kernel '" .. kernel_name .. "' is already running or starting.")
+		return
+	end
+
+	local kernels_config = config_module.get_config().kernels
+	local kernel_config = kernels_config[kernel_name]
+	if not kernel_config then
+		log.add(vim.log.levels.ERROR, "Configurazione non trovata per il kernel: " .. kernel_name)
+		return
+	end
+
+	if not claim_pooled_kernel(kernel_name, on_ready_callback) then
+		launch_kernel(kernel_name, kernel_config, on_ready_callback)
+	end
+	schedule_pool_refill(kernel_name)
+end
 
+-- Nomi dei livelli del modulo logging di Python corrispondenti a vim.log.levels.
+local PY_LOG_LEVELS = {
+	[vim.log.levels.TRACE] = "DEBUG",
+	[vim.log.levels.DEBUG] = "DEBUG",
+	[vim.log.levels.INFO] = "INFO",
+	[vim.log.levels.WARN] = "WARNING",
+	[vim.log.levels.ERROR] = "ERROR",
+	[vim.log.levels.OFF] = "CRITICAL",
+}
+
+--- Comando del client Python con le opzioni comuni a tutti i kernel.
+-- @param args (table) Argomenti da mettere subito dopo lo script.
+local function python_client_cmd(jove_config, args)
 	local py_client_script = vim.g.jove_plugin_root .. "/python/py_kernel_client.py"
 	-- Usa l'eseguibile Python di Neovim per il client, che dovrebbe avere jupyter_client.
 	local executable = vim.g.python3_host_prog
 		or vim.g.jove_default_python
 		or "python"
-	local py_client_cmd = {
-		executable,
-		"-u",
-		py_client_script,
-		connection_file_path,
-		image_width,
-		image_renderer,
-	}
+	local cmd = { executable, "-u", py_client_script }
+	vim.list_extend(cmd, args)
+	vim.list_extend(cmd, {
+		"--stream-window-ms",
+		tostring(jove_config.stream_window_ms or 0),
+		"--page-lines",
+		tostring(jove_config.output_page_lines or 0),
+		"--mime-types",
+		table.concat(jove_config.output_mime_types or {}, ","),
+		"--display-update-max-fps",
+		tostring(jove_config.display_update_max_fps or 0),
+		"--log-level",
+		PY_LOG_LEVELS[jove_config.log_level] or "INFO",
+	})
+	local spool_threshold = jove_config.payload_spool_threshold or 0
+	if spool_threshold > 0 then
+		-- Sotto la directory temporanea di Neovim, rimossa automaticamente all'uscita.
+		vim.list_extend(cmd, {
+			"--spool-dir",
+			vim.fn.tempname() .. "-spool",
+			"--spool-threshold",
+			tostring(spool_threshold),
+		})
+	end
+	return cmd
+end
+
+--- Chiamata quando il client Python di un kernel termina (processo dedicato o kernel del bridge).
+local function on_client_exit(route, exit_code)
+	local msg = "Client Python per '" .. tostring(route.name) .. "' terminato con codice: " .. tostring(exit_code)
+	log.add(vim.log.levels.INFO, msg)
+	if route.name then
+		state.set_kernel_property(route.name, "py_client_job_id", nil)
+		state.set_kernel_property(route.name, "bridge_id", nil)
+	end
+	forget_dead_reserve(route)
+end
+
+--- Gestisce con `handle` le righe arrivate insieme da un client Python, ridisegnando una
+-- sola volta ogni cella toccata. Un messaggio che provoca un errore non ferma gli altri.
+local function handle_lines(lines, handle)
+	output.batch(function()
+		for _, line in ipairs(lines) do
+			local ok, err = pcall(handle, line)
+			if not ok then
+				log.add(vim.log.levels.ERROR, "Errore nella gestione di un messaggio del client Python: " .. tostring(err))
+			end
+		end
+	end)
+end
+
+local bridge_handlers = {
+	on_message = function(kernel_name, json_line, data)
+		M.handle_py_client_message(kernel_name, json_line, data)
+	end,
+	on_lines = handle_lines,
+	on_exit = on_client_exit,
+}
+
+--- Collega il kernel `kernel_name` a un client Python: un processo dedicato, oppure il
+-- bridge condiviso con `kernel_bridge = "shared"`. Se il kernel ha un `kernel_cmd`, è il
+-- client ad avviarlo.
+-- @return (boolean) true se il client è stato avviato.
+function M.start_python_client(kernel_name, connection_file_path, ipykernel_job_id_ref, on_ready_callback)
+	local jove_config = config_module.get_config()
+	local image_width = tostring(jove_config.image_width or 120)
+	-- Passiamo sempre "none" al client Python. Tutta la logica di rendering delle
+	-- immagini (inline o popup) viene gestita da Lua per coerenza.
+	local image_renderer = "none"
 
 	state.set_kernel_property(kernel_name, "ipykernel_job_id", ipykernel_job_id_ref)
 	if on_ready_callback then
 		state.set_kernel_property(kernel_name, "on_ready_callback", on_ready_callback)
 	end
+	local k_info = state.get_kernel(kernel_name)
+
+	if jove_config.kernel_bridge == "shared" then
+		local route = k_info and k_info.route or { name = kernel_name }
+		local bridge_id = bridge.new_id(kernel_name)
+		local payload = {
+			connection_file = connection_file_path,
+			kernel_cmd = k_info and k_info.kernel_cmd,
+			image_width = tonumber(image_width),
+			image_renderer = image_renderer,
+		}
+		if not bridge.start_kernel(bridge_id, route, payload, python_client_cmd(jove_config, { "--multiplex" }), bridge_handlers) then
+			return false
+		end
+		state.set_kernel_property(kernel_name, "bridge_id", bridge_id)
+		return true
+	end
+
+	local py_client_cmd = python_client_cmd(jove_config, { connection_file_path, image_width, image_renderer })
+	if k_info and k_info.kernel_cmd then
+		vim.list_extend(py_client_cmd, { "--kernel-cmd", k_info.kernel_cmd })
+	end
+	local route = k_info and k_info.route or { name = kernel_name }
 
-	local stdout_buffer = ""
 	local py_job_id = vim.fn.jobstart(py_client_cmd, {
 		stdin = "pipe",
-		on_stdout = function(_, data, _)
-			if data then
-				for i, chunk in ipairs(data) do
-					if i == 1 then
-						stdout_buffer = stdout_buffer .. chunk
-					else
-						local complete_line = stdout_buffer
-						stdout_buffer = chunk
-						if complete_line ~= "" then
-							vim.schedule(function()
-								M.handle_py_client_message(kernel_name, complete_line)
-							end)
-						end
-					end
+		on_stdout = line_reader.new(function(lines)
+			handle_lines(lines, function(line)
+				if route.name then
+					M.handle_py_client_message(route.name, line)
 				end
-			end
-		end,
+			end)
+		end),
 		on_stderr = function(_, data, _)
-			log.add(vim.log.levels.ERROR, "Python client stderr (" .. kernel_name .. "): " .. table.concat(data, "\n"))
+			local name = route.name or kernel_name
+			log.add(vim.log.levels.ERROR, "Python client stderr (" .. name .. "): " .. table.concat(data, "\n"))
 		end,
 		on_exit = function(_, exit_code, _)
-			local msg = "Client Python per '" .. kernel_name .. "' terminato con codice: " .. exit_code
-			log.add(vim.log.levels.INFO, msg)
-			state.set_kernel_property(kernel_name, "py_client_job_id", nil)
+			on_client_exit(route, exit_code)
 		end,
 	})
+	if py_job_id <= 0 then
+		return false
+	end
 	state.set_kernel_property(kernel_name, "py_client_job_id", py_job_id)
+	return true
 end
 
-function M.handle_py_client_message(kernel_name, json_line)
-	if not state.get_kernel(kernel_name) then
+-- Richieste fetch_page e fetch_mime in attesa di risposta: [id richiesta] = callback
+local fetch_requests = {}
+local fetch_request_counter = 0
+
+--- Invia al client Python una richiesta di dati trattenuti (`fetch_page`, `fetch_mime`).
+local function send_fetch(kernel_name, command, payload, callback)
+	local kernel_info = state.get_kernel(kernel_name)
+	if not kernel_info or not (kernel_info.py_client_job_id or kernel_info.bridge_id) then
+		callback({ error = "Kernel '" .. tostring(kernel_name) .. "' non disponibile." })
 		return
 	end
+	fetch_request_counter = fetch_request_counter + 1
+	fetch_requests[fetch_request_counter] = callback
+	payload.request = fetch_request_counter
+	M.send_to_py_client(kernel_name, { command = command, payload = payload })
+end
+
+--- Chiede al client Python altre righe di un output paginato.
+-- @param page (table) Le informazioni di paginazione dell'output (id, next, total, kernel).
+-- @param count (integer|nil) Numero di righe da caricare (nil per tutte le rimanenti).
+-- @param callback (function) Chiamata con la risposta: { lines, next, total } oppure { error }.
+function M.fetch_page(page, count, callback)
+	send_fetch(page.kernel, "fetch_page", { id = page.id, start = page.next, count = count }, callback)
+end
 
-	local ok, data = pcall(vim.json.decode, json_line)
-	if not ok then
-		log.add(vim.log.levels.ERROR, "Errore JSON da Python (" .. kernel_name .. "): " .. json_line)
+--- Chiede al client Python una rappresentazione che non ha inoltrato (vedi `output_mime_types`).
+-- @param dropped (table) Le rappresentazioni scartate dall'output (id, mime_types, kernel).
+-- @param mime_type (string) Il tipo MIME richiesto.
+-- @param callback (function) Chiamata con la risposta: { data, metadata } oppure { error }.
+function M.fetch_mime(dropped, mime_type, callback)
+	send_fetch(dropped.kernel, "fetch_mime", { id = dropped.id, mime_type = mime_type }, callback)
+end
+
+--- Gestisce un messaggio del client Python di un kernel.
+-- @param data (table|nil) Il messaggio già decodificato (dal bridge condiviso), altrimenti viene decodificato `json_line`.
+function M.handle_py_client_message(kernel_name, json_line, data)
+	if not state.get_kernel(kernel_name) then
 		return
 	end
+	local received_at = stats.now()
+
+	if not data then
+		local ok
+		ok, data = pcall(vim.json.decode, json_line)
+		if not ok then
+			log.add(vim.log.levels.ERROR, "Errore JSON da Python (" .. kernel_name .. "): " .. json_line)
+			return
+		end
+	end
 
-	log.add(vim.log.levels.DEBUG, "Raw message from py_kernel_client: " .. json_line)
+	if log.is_enabled(vim.log.levels.DEBUG) then
+		log.add(vim.log.levels.DEBUG, "Raw message from py_kernel_client: " .. json_line)
+	end
 
 	local msg_type = data.type
 	local jupyter_msg = data.message
+	local trace = type(data.trace) == "table" and data.trace or nil
+	if trace then
+		trace.h = received_at
+	end
+	local jupyter_type = type(jupyter_msg) == "table" and jupyter_msg.header and jupyter_msg.header.msg_type
+	stats.count_message(kernel_name, jupyter_type and (msg_type .. "/" .. jupyter_type) or msg_type, #json_line)
 
 	if msg_type == "status" and data.message == "connected" then
-		status.update_status(kernel_name, "idle")
+		state.set_kernel_property(kernel_name, "connected", true)
+		set_status(kernel_name, "idle")
 		execute_setup_code(kernel_name)
 		local k_info = state.get_kernel(kernel_name)
 		if k_info and k_info.on_ready_callback then
@@ -214,65 +547,183 @@ function M.handle_py_client_message(kernel_name, json_line)
 			end)
 		end
 	elseif msg_type == "iopub" and jupyter_msg.header.msg_type == "status" then
-		status.update_status(kernel_name, jupyter_msg.content.execution_state)
+		local execution_state = jupyter_msg.content.execution_state
+		if execution_state == "idle" then
+			-- La richiesta è completata: non arriveranno altri output per questo msg_id.
+			update_execution(kernel_name, jupyter_msg.parent_header and jupyter_msg.parent_header.msg_id, "idle")
+			-- Con altre richieste in coda il kernel resta occupato: è idle solo a coda vuota.
+			if has_pending_executions(kernel_name) then
+				execution_state = "busy"
+			end
+		end
+		set_status(kernel_name, execution_state)
 	elseif msg_type == "error" then
 		log.add(vim.log.levels.ERROR, "Errore dal client Python (" .. kernel_name .. "): " .. data.message)
-		status.update_status(kernel_name, "error")
-	elseif msg_type == "shell" then
+		set_status(kernel_name, "error")
+	elseif msg_type == "kernel_stderr" then
+		-- Con kernel_launch = "client" lo stderr del kernel arriva tramite il client Python.
+		log.add(vim.log.levels.WARN, "ipykernel stderr (" .. kernel_name .. "): " .. data.message)
+	elseif msg_type == "kernel_exited" then
+		log.add(
+			vim.log.levels.INFO,
+			"Processo ipykernel per '" .. kernel_name .. "' terminato con codice: " .. tostring(data.exit_code)
+		)
+		forget_dead_reserve(state.get_kernel(kernel_name).route or {})
+	elseif msg_type == "shell" or msg_type == "control" then
+		-- Le risposte di controllo (es. interrupt_reply) arrivano sul canale control.
 		local shell_msg_type = jupyter_msg.header.msg_type
-		if shell_msg_type == "inspect_reply" then
+		if shell_msg_type == "execute_reply" then
+			local parent_id = jupyter_msg.parent_header and jupyter_msg.parent_header.msg_id
+			update_execution(kernel_name, parent_id, "reply", jupyter_msg.content)
+		elseif shell_msg_type == "inspect_reply" then
 			output.render_inspect_reply(jupyter_msg)
 		elseif shell_msg_type == "history_reply" then
 			output.render_history_reply(jupyter_msg)
 		elseif shell_msg_type == "interrupt_reply" then
 			log.add(vim.log.levels.INFO, "Kernel interrotto con successo.")
-			status.update_status(kernel_name, "idle")
+			-- Le richieste in coda non annullate dall'interruzione tengono il kernel occupato.
+			set_status(kernel_name, has_pending_executions(kernel_name) and "busy" or "idle")
 		end
+	elseif msg_type == "stdin" then
+		log.add(
+			vim.log.levels.WARN,
+			"Richiesta di input dal kernel '" .. kernel_name .. "' non supportata: " .. jupyter_msg.header.msg_type
+		)
 	elseif msg_type == "iopub" then
-		log.add(vim.log.levels.DEBUG, "Received IOPub message: " .. vim.inspect(jupyter_msg))
-		local k_info = state.get_kernel(kernel_name)
-		if k_info and k_info.current_execution_cell_id then
+		if log.is_enabled(vim.log.levels.TRACE) then
+			log.add(vim.log.levels.TRACE, "Received IOPub message: " .. vim.inspect(jupyter_msg))
+		end
+		local cell_id = M.cell_for_parent(kernel_name, jupyter_msg.parent_header and jupyter_msg.parent_header.msg_id)
+		if cell_id then
 			local iopub_msg_type = jupyter_msg.header.msg_type
 			local handler = output.iopub_handlers[iopub_msg_type]
 			if handler then
-				handler(k_info.current_execution_cell_id, jupyter_msg)
+				if trace then
+					stats.begin(kernel_name, cell_id, trace, "text")
+				end
+				if data.page then
+					data.page.kernel = kernel_name
+				end
+				if data.dropped then
+					data.dropped.kernel = kernel_name
+				end
+				handler(cell_id, jupyter_msg, data.page, data.dropped)
 			end
 		end
+	elseif msg_type == "page" or msg_type == "mime" then
+		local callback = fetch_requests[data.request]
+		fetch_requests[data.request] = nil
+		if callback then
+			callback(data)
+		end
 	elseif msg_type == "image_iip" then
 		local b64_data = data.payload
 		if b64_data then
-			local k_info = state.get_kernel(kernel_name)
-			if k_info and k_info.current_execution_cell_id then
+			local cell_id = M.cell_for_parent(kernel_name, data.parent_msg_id)
+			if cell_id then
+				if trace then
+					stats.begin(kernel_name, cell_id, trace, "image")
+				end
 				-- Costruisci un messaggio fittizio di tipo display_data per riutilizzare la logica esistente
 				local fake_jupyter_msg = {
 					content = {
 						data = {
 							["image/png"] = b64_data,
 						},
+						-- Con il display_id un update_display_data sostituisce l'immagine mostrata.
+						transient = data.display_id and { display_id = data.display_id } or nil,
 					},
 				}
 				-- Chiama il gestore di rendering come se fosse un normale messaggio jupyter
-				output.render_display_data(k_info.current_execution_cell_id, fake_jupyter_msg)
+				if data.msg_type == "update_display_data" then
+					output.render_update_display_data(cell_id, fake_jupyter_msg)
+				else
+					output.render_display_data(cell_id, fake_jupyter_msg)
+				end
 			end
 		end
 	end
 end
 
-function M.execute_cell(kernel_name, cell_content, bufnr, start_row, end_row)
-	local kernel_info = state.get_kernel(kernel_name)
-	if not kernel_info or not kernel_info.py_client_job_id then
-		return
+--- Restituisce la cella a cui appartengono i messaggi con il parent msg_id indicato.
+function M.cell_for_parent(kernel_name, parent_msg_id)
+	local k_info = state.get_kernel(kernel_name)
+	if not k_info or not parent_msg_id then
+		return nil
 	end
-	--- CORREZIONE: Chiamata alla funzione corretta in status.lua ---
-	if status.get_status(kernel_name) ~= "idle" then
-		log.add(vim.log.levels.WARN, "Kernel '" .. kernel_name .. "' è occupato.")
+	local execution = k_info.executions[parent_msg_id]
+	return execution and execution.cell_id
+end
+
+--- Invia una cella al kernel. Se il kernel è occupato la richiesta viene accodata dal
+-- kernel stesso: gli output vengono associati alla cella tramite il msg_id della richiesta.
+-- @param on_reply (function|nil) Chiamata con il contenuto della execute_reply.
+function M.execute_cell(kernel_name, cell_content, bufnr, start_row, end_row, on_reply)
+	local kernel_info = state.get_kernel(kernel_name)
+	if not kernel_info or not (kernel_info.py_client_job_id or kernel_info.bridge_id) then
 		return
 	end
 	state.find_and_remove_cells_in_range(bufnr, start_row, end_row)
 	local cell_id = state.add_cell(bufnr, start_row, end_row)
-	state.set_kernel_property(kernel_name, "current_execution_cell_id", cell_id)
+	local request = message.create_execute_request(cell_content)
+	kernel_info.executions[request.header.msg_id] = { cell_id = cell_id, on_reply = on_reply }
 	status.update_status(kernel_name, "busy")
-	M.send_to_py_client(kernel_name, { command = "execute", payload = message.create_execute_request(cell_content) })
+	M.send_to_py_client(kernel_name, { command = "execute", payload = request })
+	return cell_id, request.header.msg_id
+end
+
+--- Esegue in coda le celle Jupytext di un buffer.
+-- Per ogni buffer il kernel ricorda l'hash del sorgente delle celle eseguite con successo
+-- in questa sessione. Con `only_stale`, il prefisso di celle invariate viene saltato e si
+-- riparte dalla prima cella modificata (o mai eseguita), rieseguendo anche tutte le successive.
+-- @return (integer) Il numero di celle inviate al kernel.
+function M.run_buffer_cells(kernel_name, bufnr, only_stale)
+	local kernel_info = state.get_kernel(kernel_name)
+	if not kernel_info then
+		return 0
+	end
+
+	local buffer_cells = cells.find_all_jupytext_cells(bufnr)
+	for _, cell in ipairs(buffer_cells) do
+		local lines = vim.api.nvim_buf_get_lines(bufnr, cell.start_row, cell.end_row + 1, false)
+		cell.code = table.concat(lines, "\n")
+		cell.hash = vim.fn.sha256(cell.code)
+	end
+
+	local record = kernel_info.run_records[bufnr] or {}
+	kernel_info.run_records[bufnr] = record
+	local first = 1
+	if only_stale then
+		while first <= #buffer_cells and record[first] == buffer_cells[first].hash do
+			first = first + 1
+		end
+	end
+
+	-- Le celle da `first` in poi vengono rieseguite: quanto registrato per loro non vale più.
+	for i = first, table.maxn(record) do
+		record[i] = nil
+	end
+
+	local submitted = 0
+	for i = first, #buffer_cells do
+		local cell = buffer_cells[i]
+		if string.gsub(cell.code, "%s", "") == "" then
+			record[i] = cell.hash -- Una cella vuota non cambia lo stato del kernel
+		else
+			M.execute_cell(kernel_name, cell.code, bufnr, cell.start_row, cell.end_row, function(reply)
+				if reply.status == "ok" then
+					record[i] = cell.hash
+				else
+					-- Errore o annullamento: questa cella e le successive vanno rieseguite.
+					for j = i, table.maxn(record) do
+						record[j] = nil
+					end
+				end
+			end)
+			submitted = submitted + 1
+		end
+	end
+	return submitted
 end
 
 function M.inspect(kernel_name, code, cursor_pos)
@@ -297,16 +748,19 @@ function M.restart(kernel_name)
 	log.add(vim.log.levels.INFO, "Arresto del kernel '" .. kernel_name .. "' per il riavvio...")
 
 	-- Arresta i processi esistenti
-	if kernel_info.py_client_job_id then
-		vim.fn.jobstop(kernel_info.py_client_job_id)
-	end
-	if kernel_info.ipykernel_job_id then
-		vim.fn.jobstop(kernel_info.ipykernel_job_id)
-	end
+	stop_processes(kernel_info)
 
 	-- Rimuove il kernel dallo stato. La configurazione statica rimane in jove.lua.
 	state.remove_kernel(kernel_name)
 
+	-- Con un kernel di riserva pronto il riavvio è immediato.
+	if claim_pooled_kernel(kernel_name) then
+		vim.b.jove_active_kernel = kernel_name
+		status.set_active_kernel(kernel_name)
+		schedule_pool_refill(kernel_name)
+		return
+	end
+
 	-- Aggiungi un piccolo ritardo per dare tempo al sistema operativo di chiudere i processi
 	vim.defer_fn(function()
 		log.add(vim.log.levels.INFO, "Riavvio del kernel '" .. kernel_name .. "'...")
@@ -323,11 +777,15 @@ end
 
 function M.send_to_py_client(kernel_name, data_table)
 	local kernel_info = state.get_kernel(kernel_name)
-	if not kernel_info or not kernel_info.py_client_job_id then
+	if not kernel_info then
 		return
 	end
-	local json_data = vim.json.encode(data_table)
-	vim.fn.jobsend(kernel_info.py_client_job_id, json_data .. "\n")
+	if kernel_info.bridge_id then
+		bridge.send(kernel_info.bridge_id, data_table)
+	elseif kernel_info.py_client_job_id then
+		local json_data = vim.json.encode(data_table)
+		vim.fn.jobsend(kernel_info.py_client_job_id, json_data .. "\n")
+	end
 end
 
 -- Funzioni di utility non modificate
@@ -349,12 +807,15 @@ function M.list_running_kernels()
 		return { "Nessun kernel gestito al momento." }
 	end
 	for name, info in pairs(all_kernels) do
+		local client = info.bridge_id and string.format("Bridge ID: %s (job %s)", info.bridge_id, tostring(bridge.job_id()))
+			or ("PyClient Job ID: " .. tostring(info.py_client_job_id))
 		local status_line = string.format(
-			"Kernel: %s, Stato: %s, IPYKernel Job ID: %s, PyClient Job ID: %s",
+			"Kernel: %s%s, Stato: %s, IPYKernel Job ID: %s, %s",
 			name,
+			info.pool_of and " (riserva)" or "",
 			info.status or "sconosciuto",
 			tostring(info.ipykernel_job_id),
-			tostring(info.py_client_job_id)
+			client
 		)
 		table.insert(running, status_line)
 	end
@@ -369,14 +830,12 @@ vim.api.nvim_create_autocmd("VimLeavePre", {
 		local all_kernels = state.get_all_kernels()
 		if all_kernels and next(all_kernels) ~= nil then
 			for _, info in pairs(all_kernels) do
-				if info.py_client_job_id then
-					vim.fn.jobstop(info.py_client_job_id)
-				end
-				if info.ipykernel_job_id then
-					vim.fn.jobstop(info.ipykernel_job_id)
-				end
+				stop_processes(info)
 			end
 		end
+		bridge.stop()
+		require("jove.image_renderer").clear_all_images()
+		require("jove.image_renderer").stop_worker()
 	end,
 })
 
@@ -0,0 +1,47 @@
+-- lua/jove/line_reader.lua
+-- Ricompone le righe JSON dallo stdout di un client Python. I pezzi di una riga vengono
+-- accumulati in una tabella e uniti una sola volta a riga completa (niente concatenazioni
+-- ripetute per le righe di diversi MB con le immagini), e le righe complete arrivate nello
+-- stesso giro del ciclo di eventi vengono consegnate insieme, con un solo vim.schedule.
+local M = {}
+
+--- Crea un handler `on_stdout` per jobstart.
+-- @param on_batch (function) Chiamata (fuori dal callback del job) con la lista delle righe complete.
+-- @return (function) L'handler da passare come `on_stdout`.
+function M.new(on_batch)
+	local parts = {} -- Pezzi della riga in arrivo
+	local ready = {} -- Righe complete non ancora consegnate
+	local scheduled = false
+
+	local function deliver()
+		scheduled = false
+		local lines = ready
+		ready = {}
+		on_batch(lines)
+	end
+
+	return function(_, data, _)
+		if not data then
+			return
+		end
+		-- Il primo elemento continua la riga precedente; ogni altro inizia una riga nuova.
+		for i, chunk in ipairs(data) do
+			if i > 1 then
+				local line = table.concat(parts)
+				parts = {}
+				if line ~= "" then
+					ready[#ready + 1] = line
+				end
+			end
+			if chunk ~= "" then
+				parts[#parts + 1] = chunk
+			end
+		end
+		if #ready > 0 and not scheduled then
+			scheduled = true
+			vim.schedule(deliver)
+		end
+	end
+end
+
+return M
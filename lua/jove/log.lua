@@ -1,7 +1,6 @@
 -- lua/jove/log.lua
 local M = {}
 
-local log_messages = {}
 local log_levels = {
 	[vim.log.levels.TRACE] = "TRACE",
 	[vim.log.levels.DEBUG] = "DEBUG",
@@ -10,25 +9,76 @@ local log_levels = {
 	[vim.log.levels.ERROR] = "ERROR",
 }
 
+-- Storico dei log: buffer circolare di righe, le più vecchie vengono sovrascritte.
+local DEFAULT_MAX_LINES = 2000
+local log_messages = {}
+local capacity = DEFAULT_MAX_LINES
+local next_slot = 1 -- Posizione in cui verrà scritta la prossima riga
+local line_count = 0
+
+local function get_config()
+	return require("jove").get_config()
+end
+
+--- Indica se i messaggi del livello dato vengono registrati (vedi `log_level` nella configurazione).
+--- Da usare per evitare di costruire messaggi costosi (es. `vim.inspect`) quando verrebbero scartati.
+--- @param level vim.log.levels
+--- @return boolean
+function M.is_enabled(level)
+	return level >= (get_config().log_level or vim.log.levels.INFO)
+end
+
+--- Restituisce le righe del log in ordine cronologico.
+function M.get_lines()
+	local lines = {}
+	local first = line_count < capacity and 1 or next_slot
+	for i = 0, line_count - 1 do
+		lines[i + 1] = log_messages[(first - 1 + i) % capacity + 1]
+	end
+	return lines
+end
+
+local function push_line(line)
+	log_messages[next_slot] = line
+	next_slot = next_slot % capacity + 1
+	line_count = math.min(line_count + 1, capacity)
+end
+
+--- Adegua la capacità del buffer a `log_max_lines`, conservando le righe più recenti.
+local function resize(max_lines)
+	local lines = M.get_lines()
+	log_messages, capacity, next_slot, line_count = {}, max_lines, 1, 0
+	for i = math.max(1, #lines - max_lines + 1), #lines do
+		push_line(lines[i])
+	end
+end
+
 --- Aggiunge un messaggio al log e lo notifica all'utente.
---- Gestisce i messaggi su più righe.
+--- Gestisce i messaggi su più righe. I messaggi sotto il livello configurato vengono ignorati.
 --- @param level vim.log.levels
 --- @param message string
 function M.add(level, message)
+	if not M.is_enabled(level) then
+		return
+	end
+	local max_lines = math.max(1, get_config().log_max_lines or DEFAULT_MAX_LINES)
+	if max_lines ~= capacity then
+		resize(max_lines)
+	end
+
 	local lines = vim.split(message, "\n")
 	local level_str = log_levels[level] or "UNKNOWN"
 	local timestamp = os.date("%Y-%m-%d %H:%M:%S")
 
 	-- Aggiungi la prima riga con timestamp e livello
-	local first_line = string.format("[%s] [%s] %s", timestamp, level_str, lines[1])
-	table.insert(log_messages, first_line)
+	push_line(string.format("[%s] [%s] %s", timestamp, level_str, lines[1]))
 
 	-- Aggiungi le righe successive con indentazione per allineamento
 	if #lines > 1 then
 		local prefix = string.format("[%s] [%s] ", timestamp, level_str)
 		local indent = string.rep(" ", #prefix)
 		for i = 2, #lines do
-			table.insert(log_messages, indent .. lines[i])
+			push_line(indent .. lines[i])
 		end
 	end
 
@@ -40,7 +90,7 @@ end
 
 --- Mostra lo storico dei log in una finestra flottante.
 function M.show()
-	if #log_messages == 0 then
+	if line_count == 0 then
 		M.add(vim.log.levels.INFO, "Nessun log da mostrare.")
 		return
 	end
@@ -58,7 +108,7 @@ function M.show()
 
 	-- Aggiorna il contenuto del buffer
 	vim.bo[buf].readonly = false
-	vim.api.nvim_buf_set_lines(buf, 0, -1, false, log_messages)
+	vim.api.nvim_buf_set_lines(buf, 0, -1, false, M.get_lines())
 	vim.bo[buf].readonly = true
 
 	-- Calcola dimensioni e posizione della finestra
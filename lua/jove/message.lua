@@ -1,9 +1,19 @@
 -- lua/jove/message.lua
 local M = {}
 
+-- Gli ID dei messaggi devono essere univoci: il client Python li usa come msg_id
+-- delle richieste e Lua instrada gli output tramite parent_header.msg_id.
+local session_tag = string.format("jove-%d-%x", vim.fn.getpid(), os.time())
+local msg_counter = 0
+
+local function new_msg_id()
+	msg_counter = msg_counter + 1
+	return string.format("%s-%d", session_tag, msg_counter)
+end
+
 local function new_header(msg_type)
 	local header = {
-		msg_id = vim.fn.reltimestr(vim.fn.reltime()),
+		msg_id = new_msg_id(),
 		session = vim.v.servername, -- or a unique session ID
 		username = vim.env.USER or "unknown",
 		date = os.date("!%FT%TZ"),
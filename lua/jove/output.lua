@@ -5,6 +5,7 @@ local image_id_counter = 0
 local log = require("jove.log")
 local state = require("jove.state")
 local ansi = require("jove.ansi")
+local stats = require("jove.stats")
 
 -- Fallback in puro Lua per la decodifica base64.
 local function lua_b64_decode(data)
@@ -40,8 +41,131 @@ local function b64_decode(b64_data)
 	return lua_b64_decode(b64_data)
 end
 
+-- Dichiarata in anticipo perché usata come fallback da process_inline_image.
+local process_popup_image
+
+--- Sostituisce l'output con lo stesso display_id (se richiesto) o aggiunge il nuovo output alla cella.
+local function add_or_replace_output(cell_id, cell_info, output_data, is_update)
+	if is_update and output_data.display_id then
+		for i, output in ipairs(cell_info.outputs) do
+			if output.display_id == output_data.display_id then
+				cell_info.outputs[i] = output_data -- Replace entire object
+				return
+			end
+		end
+	end
+	state.add_output_to_cell(cell_id, output_data)
+end
+
+--- Indica se un output appartiene ancora alla cella (non è stato pulito o sostituito).
+local function cell_has_output(cell_info, output_data)
+	for _, out in ipairs(cell_info.outputs) do
+		if out == output_data then
+			return true
+		end
+	end
+	return false
+end
+
+-- Tipi di output che occupano righe virtuali sotto la cella.
+local RENDERED_OUTPUT_TYPES = {
+	stream = true,
+	execute_result = true,
+	display_data = true,
+	error = true,
+	image_inline = true,
+	image_popup = true,
+	terminal_popup = true,
+}
+
+--- Calcola quante righe di output ha la cella e quante ne vengono nascoste dal limite
+-- `output_max_lines` (si mostrano sempre le ultime righe).
+-- @return (integer, integer) Righe totali, righe nascoste.
+local function visible_window(cell_info)
+	local total = 0
+	for _, out in ipairs(cell_info.outputs) do
+		if RENDERED_OUTPUT_TYPES[out.type] and out.content then
+			total = total + state.output_line_count(out)
+		end
+	end
+	local max_lines = require("jove").get_config().output_max_lines or 0
+	if max_lines > 0 and total > max_lines then
+		return total, total - max_lines
+	end
+	return total, 0
+end
+
+--- Restituisce la riga (relativa alla prima riga di output della cella) in cui viene
+-- disegnato un output, tenendo conto delle righe nascoste e della riga con il loro conteggio.
+-- @return (integer|nil) nil se l'output cade nella parte nascosta.
+function M.output_row_offset(cell_info, output_data)
+	local _, hidden = visible_window(cell_info)
+	local before = 0
+	for _, out in ipairs(cell_info.outputs) do
+		if out == output_data then
+			break
+		end
+		if RENDERED_OUTPUT_TYPES[out.type] and out.content then
+			before = before + state.output_line_count(out)
+		end
+	end
+	if before < hidden then
+		return nil
+	end
+	return before - hidden + (hidden > 0 and 1 or 0)
+end
+
+-- Indice per buffer delle celle con immagini inline: [bufnr][end_mark] = cell_id. Le
+-- immagini sono ancorate all'extmark di fine cella, quindi per trovare quelle sullo
+-- schermo basta cercare gli extmark nelle righe visibili (vedi M.refresh_images).
+local image_index = {}
+-- Disposizione della finestra all'ultimo refresh_images, per buffer.
+local image_view_signatures = {}
+-- Celle con immagini sullo schermo all'ultimo refresh_images, per buffer: [bufnr][cell_id] = true.
+-- Usato solo con i protocolli le cui immagini restano finché non vengono cancellate (Kitty).
+local images_on_screen = {}
+-- Intervallo minimo (ms) tra due ridisegni delle immagini chiesti da schedule_image_refresh.
+local IMAGE_REFRESH_INTERVAL_MS = 16
+local refresh_timer = nil
+local refresh_pending = {}
+
+--- Registra una cella con un'immagine inline nell'indice del suo buffer.
+local function index_image_cell(cell_id, cell_info)
+	local index = image_index[cell_info.bufnr]
+	if not index then
+		index = {}
+		image_index[cell_info.bufnr] = index
+	end
+	index[cell_info.end_mark] = cell_id
+	image_view_signatures[cell_info.bufnr] = nil -- Il prossimo refresh non va saltato
+end
+
+-- Fotogrammi di update_display_data in preparazione nel worker, per cella e display_id
+-- (i display_id sono scelti dall'utente e possono ripetersi in celle e kernel diversi):
+-- { next = { cell_id, msg } } con l'ultimo fotogramma arrivato nel frattempo, se c'è.
+local frames_in_flight = {}
+
+local function in_flight_key(cell_id, display_id)
+	return cell_id .. "\0" .. display_id
+end
+
+--- Output inline con un'immagine già pronta per display_id, se la cella ne ha uno.
+local function find_live_image(cell_info, display_id)
+	for _, out in ipairs(cell_info.outputs) do
+		if out.display_id == display_id and out.type == "image_inline" and out.image_props then
+			return out
+		end
+	end
+	return nil
+end
+
 --- NUOVO: Gestisce il rendering di un'immagine inline.
 -- Se l'immagine viene processata, restituisce true. Altrimenti, false.
+-- La preparazione dell'immagine avviene in modo asincrono nel worker Python: nel frattempo
+-- un output segnaposto mantiene la posizione dell'immagine tra gli altri output della cella.
+-- Un aggiornamento di un'immagine già mostrata (grafici dal vivo) lascia invece il fotogramma
+-- precedente sullo schermo finché il nuovo non è pronto; i fotogrammi arrivati durante la
+-- preparazione vengono scartati, tranne l'ultimo.
 local function process_inline_image(cell_id, jupyter_msg, is_update)
 	local content = jupyter_msg.content
 	if not content or not content.data or not content.data["image/png"] then
@@ -53,166 +177,307 @@ local function process_inline_image(cell_id, jupyter_msg, is_update)
 		return true
 	end
 
-	-- Pulisce l'immagine precedente se ne esiste una
-	if cell_info.image_output_info then
+	local b64_data = content.data["image/png"]
+	local display_id = (content.transient and content.transient.display_id) or nil
+	local live = is_update and display_id and find_live_image(cell_info, display_id)
+	if live then
+		local key = in_flight_key(cell_id, display_id)
+		local in_flight = frames_in_flight[key]
+		if in_flight then
+			in_flight.next = { cell_id = cell_id, msg = jupyter_msg } -- Vince l'ultimo
+			return true
+		end
+		frames_in_flight[key] = {}
+	elseif cell_info.image_output_info then
+		-- Pulisce l'immagine precedente se ne esiste una
 		require("jove.image_renderer").clear_image_area(cell_info.image_output_info)
 		cell_info.image_output_info = nil
 	end
 
-	local b64_data = content.data["image/png"]
-	local image_renderer = require("jove.image_renderer")
-	log.add(vim.log.levels.DEBUG, "[Jove] Elaborazione immagine inline...")
-	local image_props, err = image_renderer.get_inline_image_properties(b64_data)
-
-	if err then
-		log.add(
-			vim.log.levels.WARN,
-			"Rendering inline dell'immagine fallito. Tento il fallback al popup. Errore: " .. err
-		)
-		return process_popup_image(cell_id, jupyter_msg, is_update)
-	end
-    log.add(vim.log.levels.DEBUG, "[Jove] Immagine processata con successo: " .. vim.inspect(image_props))
-
-	-- Ripristiniamo lo spazio: creiamo linee virtuali vuote
-	local virt_lines = {}
-	for _ = 1, image_props.height do
-		table.insert(virt_lines, { { "", "Normal" } }) -- Linea vuota
-	end
-
-	local output_content = virt_lines
-	local output_type = "image_inline"
-	local display_id = (content.transient and content.transient.display_id) or nil
 	local output_data = {
-		type = output_type,
-		content = output_content,
+		type = "image_inline",
+		content = {},
 		display_id = display_id,
 		b64_data = b64_data, -- STORE B64 DATA FOR JSO
-		image_props = image_props, -- STORE PROPERTIES FOR REFRESH
+		image_props = nil, -- STORE PROPERTIES FOR REFRESH (riempito quando il worker risponde)
 	}
+	if not live then
+		add_or_replace_output(cell_id, cell_info, output_data, is_update)
+	end
 
-	if is_update and display_id then
-		local updated = false
-		for i, output in ipairs(cell_info.outputs) do
-			if output.display_id == display_id then
-				cell_info.outputs[i] = output_data -- Replace entire object
-				updated = true
-				break
+	local image_renderer = require("jove.image_renderer")
+	log.add(vim.log.levels.DEBUG, "[Jove] Elaborazione immagine inline...")
+	image_renderer.get_inline_image_properties(b64_data, nil, nil, function(image_props, err)
+		if live then
+			local key = in_flight_key(cell_id, display_id)
+			local in_flight = frames_in_flight[key]
+			frames_in_flight[key] = nil
+			if in_flight and in_flight.next then
+				-- Nel frattempo è arrivato un fotogramma più recente: questo non viene disegnato.
+				M.render_update_display_data(in_flight.next.cell_id, in_flight.next.msg)
+				return
 			end
 		end
-		if not updated then
-			state.add_output_to_cell(cell_id, output_data)
-		end
-	else
-		state.add_output_to_cell(cell_id, output_data)
-	end
-
-	M.redraw_cell(cell_id)
 
-	-- Ora che lo spazio è stato creato, disegna l'immagine.
-	-- Usiamo vim.schedule per assicurarci che il ridisegno che crea lo spazio
-	-- avvenga prima del disegno dell'immagine, risolvendo una race condition.
-	vim.schedule(function()
 		local current_cell_info = state.get_cell(cell_id)
-		if not current_cell_info then
-			return
+		if not current_cell_info or not cell_has_output(current_cell_info, live or output_data) then
+			return -- La cella o l'output sono stati rimossi nel frattempo
 		end
-		local NS_ID = state.get_namespace_id()
-		local pos = vim.api.nvim_buf_get_extmark_by_id(current_cell_info.bufnr, NS_ID, current_cell_info.end_mark, {})
-		if pos and #pos > 0 then
-			local end_row = pos[1]
-
-			-- Calcola l'offset verticale: contiamo quante righe di virtual text (stream/error/altri)
-			-- precedono l'immagine corrente in questa cella.
-			local row_offset = 0
-			for _, out in ipairs(current_cell_info.outputs) do
-				-- Se troviamo il nostro output corrente (ovvero quello con i dati b64 appena ricevuti)
-				-- ci fermiamo. Usiamo il display_id se presente, altrimenti confrontiamo i dati.
-				if display_id and out.display_id == display_id then
+
+		if err then
+			log.add(
+				vim.log.levels.WARN,
+				"Rendering inline dell'immagine fallito. Tento il fallback al popup. Errore: " .. err
+			)
+			for i, out in ipairs(current_cell_info.outputs) do
+				if out == output_data then
+					table.remove(current_cell_info.outputs, i)
 					break
-				elseif not display_id and out.b64_data == b64_data then
+				end
+			end
+			process_popup_image(cell_id, jupyter_msg, is_update)
+			return
+		end
+
+		-- Il fotogramma precedente resta sullo schermo finché il nuovo non viene disegnato
+		-- sopra; poi i suoi dati nel terminale (Kitty) non servono più.
+		local function release_previous_frame()
+			if live then
+				image_renderer.free_images({ live.image_props })
+				live = nil
+			end
+		end
+		if live then
+			for i, out in ipairs(current_cell_info.outputs) do
+				if out == live then
+					current_cell_info.outputs[i] = output_data
 					break
 				end
+			end
+		end
+		if log.is_enabled(vim.log.levels.DEBUG) then
+			log.add(vim.log.levels.DEBUG, "[Jove] Immagine processata con successo: " .. vim.inspect(image_props))
+		end
+
+		-- Ripristiniamo lo spazio: creiamo linee virtuali vuote
+		local virt_lines = {}
+		for _ = 1, image_props.height do
+			table.insert(virt_lines, { { "", "Normal" } }) -- Linea vuota
+		end
+		output_data.content = virt_lines
+		output_data.image_props = image_props
+		index_image_cell(cell_id, current_cell_info)
 
-				if out.content then
-					row_offset = row_offset + #out.content
+		M.redraw_cell(cell_id)
+
+		-- Ora che lo spazio è stato creato, disegna l'immagine.
+		-- Usiamo vim.schedule per assicurarci che il ridisegno che crea lo spazio
+		-- avvenga prima del disegno dell'immagine, risolvendo una race condition.
+		vim.schedule(function()
+			current_cell_info = state.get_cell(cell_id)
+			if not current_cell_info then
+				release_previous_frame()
+				return
+			end
+			local NS_ID = state.get_namespace_id()
+			local pos = vim.api.nvim_buf_get_extmark_by_id(current_cell_info.bufnr, NS_ID, current_cell_info.end_mark, {})
+			if pos and #pos > 0 then
+				local end_row = pos[1]
+
+				-- Calcola l'offset verticale: quante righe di virtual text (stream/error/altri)
+				-- precedono l'immagine corrente in questa cella.
+				local row_offset = M.output_row_offset(current_cell_info, output_data)
+				if not row_offset then
+					release_previous_frame()
+					return -- L'immagine è tra le righe nascoste dal limite di output
 				end
+
+				-- Padding orizzontale richiesto dall'utente
+				local col_offset = 4
+
+				-- Redraw per sincronizzare il buffer Neovim con il terminale
+				vim.cmd("redraw")
+				-- Ritardo di sicurezza per permettere a Neovim di finire il flush al terminale
+				vim.defer_fn(function()
+					image_renderer.draw_and_register_inline_image(
+						current_cell_info.bufnr,
+						end_row,
+						image_props,
+						cell_id,
+						row_offset,
+						col_offset
+					)
+					release_previous_frame()
+				end, 50)
+			else
+				release_previous_frame()
 			end
+		end)
+	end)
 
-			-- Padding orizzontale richiesto dall'utente
+	return true
+end
+
+--- Ridisegna le immagini inline di una cella la cui posizione sullo schermo è cambiata.
+-- @param end_row (integer) Riga dell'extmark di fine cella, a cui sono ancorati gli output.
+-- @return (boolean) false se la cella non ha più immagini inline.
+local function refresh_cell_images(winid, bufnr, cell_id, cell_info, end_row)
+	local image_renderer = require("jove.image_renderer")
+	local _, hidden = visible_window(cell_info)
+	local lines_before = 0
+	local has_images = false
+	for _, out in ipairs(cell_info.outputs) do
+		local row_offset = lines_before - hidden + (hidden > 0 and 1 or 0)
+		if out.type == "image_inline" then
+			has_images = true
+		end
+		if out.type == "image_inline" and out.image_props and lines_before >= hidden then
 			local col_offset = 4
+			local s_pos = vim.fn.screenpos(winid, end_row + 1, 1)
+			if s_pos.row > 0 then
+				local target_row = s_pos.row + 1 + row_offset
+				local target_col = s_pos.col + col_offset
+
+				-- Ridisegniamo solo se la posizione è effettivamente cambiata sullo schermo.
+				-- Questo evita artefatti e flood di comandi TTY durante l'editing.
+				if
+					not cell_info.image_output_info
+					or cell_info.image_output_info.line ~= target_row
+					or cell_info.image_output_info.col ~= target_col
+				then
+					image_renderer.draw_and_register_inline_image(
+						bufnr,
+						end_row,
+						out.image_props,
+						cell_id,
+						row_offset,
+						col_offset
+					)
+				end
+			end
+		end
 
-			-- Redraw per sincronizzare il buffer Neovim con il terminale
-			vim.cmd("redraw")
-			-- Ritardo di sicurezza per permettere a Neovim di finire il flush al terminale
-			vim.defer_fn(function()
-				image_renderer.draw_and_register_inline_image(
-					cell_info.bufnr,
-					end_row,
-					image_props,
-					cell_id,
-					row_offset,
-					col_offset
-				)
-			end, 50)
+		-- Incrementiamo sempre il conteggio delle righe per i prossimi output
+		if RENDERED_OUTPUT_TYPES[out.type] and out.content then
+			lines_before = lines_before + state.output_line_count(out)
 		end
-	end)
+	end
+	return has_images
+end
 
-	return true
+--- Cancella le immagini delle celle che erano sullo schermo e non lo sono più.
+-- @param visible (table) Le celle ora visibili: [cell_id] = true.
+local function clear_offscreen_images(bufnr, visible)
+	local previous = images_on_screen[bufnr]
+	images_on_screen[bufnr] = next(visible) and visible or nil
+	for cell_id in pairs(previous or {}) do
+		local cell_info = not visible[cell_id] and state.get_cell(cell_id)
+		if cell_info and cell_info.image_output_info then
+			require("jove.image_renderer").clear_image_area(cell_info.image_output_info, cell_id)
+			cell_info.image_output_info = nil -- Verrà ridisegnata quando torna visibile
+		end
+	end
 end
 
---- Forza il ridisegno di tutte le immagini inline visibili nel buffer.
+--- Ridisegna le immagini inline visibili nel buffer che si sono spostate sullo schermo.
+-- Vengono considerate solo le celle indicizzate il cui extmark di fine cade nelle righe
+-- visibili della finestra; se la finestra non è cambiata dall'ultima volta non fa nulla.
+-- Con i protocolli le cui immagini restano sullo schermo (Kitty), cancella quelle delle
+-- celle uscite dalla finestra.
 function M.refresh_images(bufnr)
 	local current_buf = bufnr or vim.api.nvim_get_current_buf()
-	local image_renderer = require("jove.image_renderer")
-	local NS_ID = state.get_namespace_id()
-
-	-- Evitiamo di refreshare troppo spesso (debounce leggero implicito o controllo visibilità)
-	for cell_id, cell_info in pairs(state.get_all_cells()) do
-		if cell_info.bufnr == current_buf then
-			-- Cerchiamo output di tipo immagine
-			local row_offset = 0
-			for _, out in ipairs(cell_info.outputs) do
-				if out.type == "image_inline" and out.image_props then
-					local pos = vim.api.nvim_buf_get_extmark_by_id(current_buf, NS_ID, cell_info.end_mark, {})
-					if pos and #pos > 0 then
-						local end_row = pos[1]
-						local col_offset = 4
-						
-						-- Recuperiamo la finestra per calcolare la posizione attuale
-						local winid = vim.fn.bufwinid(current_buf)
-						if winid ~= -1 then
-							local s_pos = vim.fn.screenpos(winid, end_row + 1, 1)
-							if s_pos.row > 0 then
-								local target_row = s_pos.row + 1 + row_offset
-								local target_col = s_pos.col + col_offset
-
-								-- Ridisegniamo solo se la posizione è effettivamente cambiata sullo schermo.
-								-- Questo evita artefatti e flood di comandi TTY durante l'editing.
-								if not cell_info.image_output_info or 
-								   cell_info.image_output_info.line ~= target_row or 
-								   cell_info.image_output_info.col ~= target_col then
-									
-									image_renderer.draw_and_register_inline_image(
-										current_buf,
-										end_row,
-										out.image_props,
-										cell_id,
-										row_offset,
-										col_offset
-									)
-								end
-							end
-						end
-					end
-				end
+	local persistent = require("jove.term-image.adapter").persistent_placements()
+	local index = image_index[current_buf]
+	if not index or next(index) == nil then
+		if persistent then
+			clear_offscreen_images(current_buf, {})
+		end
+		return
+	end
+	local winid = vim.fn.bufwinid(current_buf)
+	if winid == -1 then
+		image_view_signatures[current_buf] = nil
+		if persistent then
+			clear_offscreen_images(current_buf, {})
+		end
+		return
+	end
+	local info = vim.fn.getwininfo(winid)[1]
+	if not info then
+		return
+	end
+	local signature = table.concat({
+		winid,
+		info.topline,
+		info.botline,
+		info.winrow,
+		info.wincol,
+		info.width,
+		info.height,
+		vim.api.nvim_buf_line_count(current_buf),
+	}, ":")
+	if image_view_signatures[current_buf] == signature then
+		return
+	end
+	image_view_signatures[current_buf] = signature
 
-				-- Incrementiamo sempre il row_offset per i prossimi output
-				if out.content then
-					row_offset = row_offset + #out.content
-				end
+	local NS_ID = state.get_namespace_id()
+	local marks = vim.api.nvim_buf_get_extmarks(current_buf, NS_ID, { info.topline - 1, 0 }, { info.botline - 1, -1 }, {})
+	local visible = {}
+	for _, mark in ipairs(marks) do
+		local cell_id = index[mark[1]]
+		if cell_id then
+			local cell_info = state.get_cell(cell_id)
+			if
+				not cell_info
+				or cell_info.end_mark ~= mark[1]
+				or not refresh_cell_images(winid, current_buf, cell_id, cell_info, mark[2])
+			then
+				index[mark[1]] = nil -- Cella rimossa o senza più immagini
+			elseif cell_info.image_output_info then
+				visible[cell_id] = true
 			end
 		end
 	end
+	if persistent then
+		clear_offscreen_images(current_buf, visible)
+	end
+end
+
+--- Chiede il ridisegno delle immagini del buffer. Gli eventi ravvicinati (scroll,
+-- digitazione, ridimensionamenti) vengono accorpati in un solo ridisegno per frame.
+function M.schedule_image_refresh(bufnr)
+	if not image_index[bufnr] and next(images_on_screen) == nil then
+		return -- Nessuna immagine inline nel buffer né sullo schermo
+	end
+	refresh_pending[bufnr] = true
+	if not refresh_timer then
+		refresh_timer = (vim.uv or vim.loop).new_timer()
+	end
+	if refresh_timer:is_active() then
+		return
+	end
+	refresh_timer:start(
+		IMAGE_REFRESH_INTERVAL_MS,
+		0,
+		vim.schedule_wrap(function()
+			local buffers = refresh_pending
+			refresh_pending = {}
+			-- Anche le immagini (persistenti) di altri buffer possono essere uscite dallo schermo.
+			for shown_buf in pairs(images_on_screen) do
+				buffers[shown_buf] = true
+			end
+			for pending_buf in pairs(buffers) do
+				if vim.api.nvim_buf_is_valid(pending_buf) then
+					M.refresh_images(pending_buf)
+				else
+					image_index[pending_buf] = nil
+					image_view_signatures[pending_buf] = nil
+					images_on_screen[pending_buf] = nil
+				end
+			end
+		end)
+	)
 end
 
 --- NUOVO: Gestisce l'output di un'immagine come placeholder riapribile.
@@ -269,7 +534,7 @@ end
 
 --- NUOVO: Gestisce il rendering di un'immagine in un popup.
 -- Se l'immagine viene processata, restituisce true. Altrimenti, false.
-local function process_popup_image(cell_id, jupyter_msg, is_update)
+function process_popup_image(cell_id, jupyter_msg, is_update)
 	local content = jupyter_msg.content
 	if not content or not content.data or not content.data["image/png"] then
 		return false -- Non è un messaggio con immagine
@@ -343,55 +608,134 @@ local function clear_cell_display(cell_info)
 	cell_info.output_marks = {}
 end
 
+-- Celle da ridisegnare alla fine del batch in corso (vedi M.batch), nell'ordine in cui
+-- sono state toccate; nil fuori da un batch.
+local batch_cells = nil
+
 --- Ridisegna tutti gli output di una cella leggendo dal modulo di stato.
+-- Mostra al massimo `output_max_lines` righe (le ultime), precedute da una riga con il
+-- numero di righe nascoste. L'extmark della cella viene aggiornato sul posto, quindi il
+-- costo dipende dalle righe visibili e non dalla lunghezza totale dell'output.
+-- Durante un batch il ridisegno viene rimandato alla fine, una volta per cella.
 function M.redraw_cell(cell_id)
+	if batch_cells then
+		if not batch_cells[cell_id] then
+			batch_cells[cell_id] = true
+			batch_cells[#batch_cells + 1] = cell_id
+		end
+		return
+	end
 	local cell_info = state.get_cell(cell_id)
 	if not cell_info then
 		return
 	end
-	clear_cell_display(cell_info)
+	-- Le immagini del Kitty graphics protocol non vengono coperte dal ridisegno: se l'output
+	-- cambia altezza, quelle sotto vanno spostate.
+	if image_index[cell_info.bufnr] and require("jove.term-image.adapter").persistent_placements() then
+		image_view_signatures[cell_info.bufnr] = nil
+		M.schedule_image_refresh(cell_info.bufnr)
+	end
 
-	local NS_ID = state.get_namespace_id()
+	local _, hidden = visible_window(cell_info)
 	local virt_lines = {}
+	if hidden > 0 then
+		virt_lines[1] = {
+			{ string.format("… %d righe nascoste (JoveSelectOutput per vederle)", hidden), "Comment" },
+		}
+	end
+	local skip = hidden
 	for _, output in ipairs(cell_info.outputs) do
-		if output.type == "stream" then
-			for _, line_chunks in ipairs(output.content) do
-				table.insert(virt_lines, line_chunks)
-			end
-		elseif output.type == "execute_result" or output.type == "display_data" then
-			for _, line_chunks in ipairs(output.content) do
-				table.insert(virt_lines, line_chunks)
-			end
-		elseif output.type == "error" then
-			for _, line_chunks in ipairs(output.content) do
-				table.insert(virt_lines, line_chunks)
-			end
-		elseif output.type == "image_inline" or output.type == "image_popup" or output.type == "terminal_popup" then
-			for _, line_chunks in ipairs(output.content) do
-				table.insert(virt_lines, line_chunks)
+		if RENDERED_OUTPUT_TYPES[output.type] and output.content then
+			local n = state.output_line_count(output)
+			if skip >= n then
+				skip = skip - n
+			else
+				local spilled = output.spilled_lines or 0
+				if skip < spilled then
+					-- Righe spostate su disco tornate visibili (es. output aggiornato più corto)
+					state.restore_output(output)
+					spilled = 0
+				end
+				for i = skip + 1 - spilled, #output.content do
+					virt_lines[#virt_lines + 1] = output.content[i]
+				end
+				skip = 0
 			end
 		end
 	end
 
 	if #virt_lines == 0 then
+		clear_cell_display(cell_info)
+		stats.rendered(cell_id)
 		return
 	end
 
+	local NS_ID = state.get_namespace_id()
 	local pos = vim.api.nvim_buf_get_extmark_by_id(cell_info.bufnr, NS_ID, cell_info.end_mark, {})
 	if not pos or #pos == 0 then
 		return
 	end
 	local end_row = pos[1]
 
-	local mark_id = vim.api.nvim_buf_set_extmark(cell_info.bufnr, NS_ID, end_row, -1, {
+	local opts = {
 		virt_lines = virt_lines,
 		virt_lines_above = false,
-	})
-	table.insert(cell_info.output_marks, mark_id)
+		id = cell_info.output_marks[1],
+	}
+	local ok, mark_id = pcall(vim.api.nvim_buf_set_extmark, cell_info.bufnr, NS_ID, end_row, -1, opts)
+	if not ok then
+		-- L'extmark precedente non è più valido: ne creiamo uno nuovo.
+		clear_cell_display(cell_info)
+		opts.id = nil
+		mark_id = vim.api.nvim_buf_set_extmark(cell_info.bufnr, NS_ID, end_row, -1, opts)
+	end
+	for i = 2, #cell_info.output_marks do
+		pcall(vim.api.nvim_buf_del_extmark, cell_info.bufnr, NS_ID, cell_info.output_marks[i])
+	end
+	cell_info.output_marks = { mark_id }
+	stats.rendered(cell_id)
+end
+
+--- Esegue fn(...) accorpando i ridisegni: ogni cella toccata viene ridisegnata una sola
+-- volta, al termine. Usato per i messaggi del client Python arrivati insieme.
+function M.batch(fn, ...)
+	if batch_cells then
+		return fn(...) -- Già dentro un batch
+	end
+	batch_cells = {}
+	local ok, err = pcall(fn, ...)
+	local cells = batch_cells
+	batch_cells = nil
+	for _, cell_id in ipairs(cells) do
+		M.redraw_cell(cell_id)
+	end
+	if not ok then
+		error(err, 0)
+	end
+end
+
+--- Riga mostrata in fondo a un output paginato con righe non ancora caricate.
+local function page_trailer(page)
+	return { { string.format("… altre %d righe (JoveMore per caricarle)", page.total - page.next), "Comment" } }
+end
+
+--- Indica se un output paginato ha ancora righe da caricare dal client Python.
+local function has_more_pages(output)
+	return output.page ~= nil and output.page.next < output.page.total
+end
+
+--- Riga mostrata al posto di un output senza text/plain le cui rappresentazioni sono
+-- rimaste nel client Python.
+local function dropped_placeholder(dropped)
+	return { { string.format("[%s] (JoveMime per aprirlo)", table.concat(dropped.mime_types, ", ")), "Comment" } }
 end
 
 --- Funzione unificata per elaborare e aggiungere/aggiornare output di tipo "rich text".
-local function process_rich_output(cell_id, jupyter_msg, output_type, is_update)
+-- @param page (table|nil) Se il client Python ha inviato solo la prima pagina del testo:
+--   { id, next, total, kernel }. In fondo all'output viene mostrata una riga con le righe mancanti.
+-- @param dropped (table|nil) Le rappresentazioni non inoltrate dal client Python:
+--   { id, mime_types, kernel }. Se manca il text/plain ne viene mostrato l'elenco.
+local function process_rich_output(cell_id, jupyter_msg, output_type, is_update, page, dropped)
 	local cell_info = state.get_cell(cell_id)
 	if not cell_info then
 		return
@@ -409,7 +753,10 @@ local function process_rich_output(cell_id, jupyter_msg, output_type, is_update)
 	end
 	local text_plain = content.data["text/plain"]
 	if not (text_plain and text_plain ~= "") then
-		return
+		if not dropped then
+			return
+		end
+		text_plain = ""
 	end
 
 	-- Estrae il display_id per gli aggiornamenti
@@ -423,6 +770,9 @@ local function process_rich_output(cell_id, jupyter_msg, output_type, is_update)
 	for _, line in ipairs(vim.split(cleaned_text, "\n", { trimempty = true })) do
 		table.insert(lines_of_chunks, ansi.parse(line, "Normal"))
 	end
+	if #lines_of_chunks == 0 and dropped then
+		table.insert(lines_of_chunks, dropped_placeholder(dropped))
+	end
 
 	if #lines_of_chunks == 0 then
 		return
@@ -433,6 +783,9 @@ local function process_rich_output(cell_id, jupyter_msg, output_type, is_update)
 		local prompt = string.format("Out[%d]: ", content.execution_count)
 		table.insert(lines_of_chunks[1], 1, { prompt, "JoveOutPrompt" })
 	end
+	if page and page.next < page.total then
+		table.insert(lines_of_chunks, page_trailer(page))
+	end
 
 	if is_update and display_id then
 		local updated = false
@@ -440,6 +793,8 @@ local function process_rich_output(cell_id, jupyter_msg, output_type, is_update)
 		for i, output in ipairs(cell_info.outputs) do
 			if output.display_id == display_id then
 				cell_info.outputs[i].content = lines_of_chunks
+				cell_info.outputs[i].page = page
+				cell_info.outputs[i].dropped = dropped
 				updated = true
 				break
 			end
@@ -452,6 +807,8 @@ local function process_rich_output(cell_id, jupyter_msg, output_type, is_update)
 				type = output_type,
 				content = lines_of_chunks,
 				display_id = display_id,
+				page = page,
+				dropped = dropped,
 			})
 		end
 		M.redraw_cell(cell_id)
@@ -461,11 +818,111 @@ local function process_rich_output(cell_id, jupyter_msg, output_type, is_update)
 			type = output_type,
 			content = lines_of_chunks,
 			display_id = display_id,
+			page = page,
+			dropped = dropped,
 		})
 		M.redraw_cell(cell_id)
 	end
 end
 
+--- Carica altre righe di un output paginato e le aggiunge in fondo all'output.
+-- @param count (integer|nil) Numero di righe (nil per tutte le rimanenti).
+-- @param on_done (function|nil) Chiamata al termine, anche in caso di errore.
+local function load_output_page(cell_id, output, count, on_done)
+	require("jove.kernel").fetch_page(output.page, count, function(reply)
+		local cell_info = state.get_cell(cell_id)
+		if not cell_info or not cell_has_output(cell_info, output) then
+			if on_done then
+				on_done()
+			end
+			return
+		end
+		-- Toglie la riga con il conteggio delle righe mancanti (sempre l'ultima).
+		state.restore_output(output)
+		table.remove(output.content)
+		if reply.error then
+			log.add(vim.log.levels.WARN, "[Jove] " .. reply.error)
+			output.page.total = output.page.next -- Le righe rimanenti non sono più recuperabili
+		else
+			local lines = reply.lines or {}
+			local last = reply.next >= reply.total and #lines or nil
+			for i, line in ipairs(lines) do
+				-- Come in process_rich_output, la riga vuota finale del testo non viene mostrata.
+				if not (i == last and line == "") then
+					local cleaned = clean_string(line):gsub(".*\r", "")
+					table.insert(output.content, ansi.parse(cleaned, "Normal"))
+				end
+			end
+			output.page.next = reply.next
+			output.page.total = reply.total
+		end
+		if has_more_pages(output) then
+			table.insert(output.content, page_trailer(output.page))
+		end
+		state.note_output_growth(cell_id)
+		M.redraw_cell(cell_id)
+		if on_done then
+			on_done()
+		end
+	end)
+end
+
+--- Carica la pagina successiva del primo output paginato incompleto di una cella.
+-- @param count (integer|nil) Numero di righe (predefinito: `output_page_lines`).
+-- @return (boolean) false se la cella non ha output con altre righe da caricare.
+function M.load_more_output(cell_id, count)
+	local cell_info = state.get_cell(cell_id)
+	if not cell_info then
+		return false
+	end
+	for _, output in ipairs(cell_info.outputs) do
+		if has_more_pages(output) then
+			load_output_page(cell_id, output, count or require("jove").get_config().output_page_lines, nil)
+			return true
+		end
+	end
+	return false
+end
+
+--- Restituisce l'ultimo contenuto visibile di una riga sovrascritta con `\r`.
+local function last_overwrite(line)
+	local visible = ""
+	for part in line:gmatch("[^\r]+") do
+		visible = part
+	end
+	return visible
+end
+
+--- Aggiunge del testo a un output di tipo stream, analizzando solo le righe nuove.
+-- L'ultima riga resta "aperta" (output.partial) se il testo non termina con un newline,
+-- così il messaggio successivo può continuarla o, con `\r`, sovrascriverla.
+local function append_stream_text(output, text)
+	-- `\r\n` è un semplice a capo: non deve sovrascrivere la riga aperta.
+	text = text:gsub("\r\n", "\n")
+	local pieces = vim.split(text, "\n", { plain = true })
+	for i, piece in ipairs(pieces) do
+		local overwrite = piece:find("\r", 1, true) ~= nil
+		if overwrite then
+			piece = last_overwrite(piece)
+		end
+		if i == 1 and output.partial then
+			-- Continua (o sovrascrive) la riga lasciata aperta dal messaggio precedente
+			if not overwrite then
+				piece = output.partial .. piece
+			end
+			output.content[#output.content] = ansi.parse(piece, "Normal")
+			output.partial = piece
+		elseif i < #pieces or piece ~= "" then
+			table.insert(output.content, ansi.parse(piece, "Normal"))
+			output.partial = piece
+		end
+	end
+	-- Se il testo termina con un newline l'ultima riga è completa.
+	if pieces[#pieces] == "" then
+		output.partial = nil
+	end
+end
+
 function M.render_stream(cell_id, jupyter_msg)
 	local cell_info = state.get_cell(cell_id)
 	if not cell_info then
@@ -486,26 +943,20 @@ function M.render_stream(cell_id, jupyter_msg)
 		return
 	end
 
-	local cleaned_text = clean_string(text)
-	cleaned_text = cleaned_text:gsub(".*\r", "") -- Gestisce la sovrascrittura di riga
-	local lines_of_chunks = {}
-	for _, line in ipairs(vim.split(cleaned_text, "\n", { trimempty = true })) do
-		table.insert(lines_of_chunks, ansi.parse(line, "Normal"))
-	end
-
-	if #lines_of_chunks > 0 then
-		-- Heuristic: stream updates often replace the last stream output.
-		if #cell_info.outputs > 0 and cell_info.outputs[#cell_info.outputs].type == "stream" then
-			cell_info.outputs[#cell_info.outputs].content = lines_of_chunks
-		else
-			state.add_output_to_cell(cell_id, { type = "stream", content = lines_of_chunks })
-		end
-		M.redraw_cell(cell_id)
+	-- Lo stream continua l'ultimo output se anch'esso è uno stream, altrimenti ne inizia uno nuovo.
+	local last = cell_info.outputs[#cell_info.outputs]
+	if not last or last.type ~= "stream" then
+		last = { type = "stream", content = {} }
+		state.add_output_to_cell(cell_id, last)
+	else
+		state.note_output_growth(cell_id)
 	end
+	append_stream_text(last, clean_string(text))
+	M.redraw_cell(cell_id)
 end
 
-function M.render_execute_result(cell_id, jupyter_msg)
-	process_rich_output(cell_id, jupyter_msg, "execute_result", false)
+function M.render_execute_result(cell_id, jupyter_msg, page, dropped)
+	process_rich_output(cell_id, jupyter_msg, "execute_result", false, page, dropped)
 end
 
 --- Ridisegna solo i marcatori del prompt (In[n]: e le barre verticali) per una cella.
@@ -612,7 +1063,7 @@ function M.render_error(cell_id, jupyter_msg)
 	end
 end
 
-function M.render_display_data(cell_id, jupyter_msg)
+function M.render_display_data(cell_id, jupyter_msg, page, dropped)
 	local renderer = require("jove").get_config().image_renderer
 	local content = jupyter_msg.content
 
@@ -633,10 +1084,10 @@ function M.render_display_data(cell_id, jupyter_msg)
 	end
 
 	-- Fallback a testo se non è un'immagine o se il rendering dell'immagine fallisce
-	process_rich_output(cell_id, jupyter_msg, "display_data", false)
+	process_rich_output(cell_id, jupyter_msg, "display_data", false, page, dropped)
 end
 
-function M.render_update_display_data(cell_id, jupyter_msg)
+function M.render_update_display_data(cell_id, jupyter_msg, page, dropped)
 	local renderer = require("jove").get_config().image_renderer
 	local content = jupyter_msg.content
 
@@ -656,7 +1107,7 @@ function M.render_update_display_data(cell_id, jupyter_msg)
 		end
 	end
 
-	process_rich_output(cell_id, jupyter_msg, "display_data", true)
+	process_rich_output(cell_id, jupyter_msg, "display_data", true, page, dropped)
 end
 
 function M.render_clear_output(cell_id, jupyter_msg)
@@ -707,7 +1158,7 @@ function M.clear_output_in_range(bufnr, start_row, end_row)
 		if cell_info then
 			-- NUOVO: Pulisce l'immagine dal terminale se esiste
 			if cell_info.image_output_info then
-				require("jove.image_renderer").clear_image_area(cell_info.image_output_info)
+				require("jove.image_renderer").clear_image_area(cell_info.image_output_info, nil, true)
 				cell_info.image_output_info = nil -- Rimuovi le informazioni dopo la pulizia
 			end
 
@@ -799,10 +1250,86 @@ function M.render_history_reply(jupyter_msg)
 	vim.bo[bufnr].filetype = "python" -- o il filetype del kernel
 end
 
---- Mostra l'output di una cella in una finestra flottante per la selezione.
-function M.show_selectable_output(bufnr, cursor_row)
-	local target_cell_id
-	-- Trova la cella in cui si trova il cursore o la cella il cui output è più vicino
+-- Filetype dei buffer aperti da JoveMime, per tipo MIME.
+local MIME_FILETYPES = {
+	["text/html"] = "html",
+	["text/markdown"] = "markdown",
+	["text/latex"] = "tex",
+	["image/svg+xml"] = "xml",
+	["application/javascript"] = "javascript",
+}
+
+--- Mostra in un nuovo buffer una rappresentazione ricevuta con fetch_mime.
+local function open_mime_buffer(mime_type, reply)
+	local text = reply.data
+	local filetype = MIME_FILETYPES[mime_type]
+	if type(text) ~= "string" then
+		-- Rappresentazioni JSON (es. application/vnd.jupyter.widget-view+json)
+		text = vim.json.encode(text)
+		filetype = "json"
+	end
+	vim.cmd("new")
+	local bufnr = vim.api.nvim_get_current_buf()
+	vim.bo[bufnr].buftype = "nofile"
+	vim.bo[bufnr].bufhidden = "wipe"
+	vim.bo[bufnr].swapfile = false
+	pcall(vim.api.nvim_buf_set_name, bufnr, string.format("Jove %s #%d", mime_type, reply.id))
+	vim.api.nvim_buf_set_lines(bufnr, 0, -1, false, vim.split(text, "\n", { plain = true }))
+	if filetype then
+		vim.bo[bufnr].filetype = filetype
+	end
+end
+
+--- Apre una rappresentazione che il client Python non ha inoltrato (vedi `output_mime_types`)
+-- di un output della cella vicina al cursore. Se ce n'è più d'una, chiede quale aprire.
+-- @param mime_type (string|nil) Apre solo rappresentazioni di questo tipo.
+function M.open_dropped_output(bufnr, cursor_row, mime_type)
+	local cell_id = M.find_cell_near(bufnr, cursor_row)
+	local cell_info = cell_id and state.get_cell(cell_id)
+	local choices = {}
+	for index, output in ipairs(cell_info and cell_info.outputs or {}) do
+		if output.dropped then
+			for _, mime in ipairs(output.dropped.mime_types) do
+				if not mime_type or mime == mime_type then
+					table.insert(choices, { index = index, output = output, mime = mime })
+				end
+			end
+		end
+	end
+	if #choices == 0 then
+		log.add(vim.log.levels.INFO, "Nessuna rappresentazione non inoltrata per gli output vicino al cursore.")
+		return
+	end
+
+	local function open(choice)
+		require("jove.kernel").fetch_mime(choice.output.dropped, choice.mime, function(reply)
+			if reply.error then
+				log.add(vim.log.levels.WARN, "[Jove] " .. reply.error)
+				return
+			end
+			open_mime_buffer(choice.mime, reply)
+		end)
+	end
+
+	if #choices == 1 then
+		open(choices[1])
+		return
+	end
+	vim.ui.select(choices, {
+		prompt = "Rappresentazione da aprire:",
+		format_item = function(choice)
+			return string.format("Output %d: %s", choice.index, choice.mime)
+		end,
+	}, function(choice)
+		if choice then
+			open(choice)
+		end
+	end)
+end
+
+--- Trova la cella in cui si trova il cursore o, altrimenti, quella che inizia più vicino.
+-- @return (integer|nil) L'ID della cella.
+function M.find_cell_near(bufnr, cursor_row)
 	local best_candidate = { id = nil, distance = math.huge }
 	local NS_ID = state.get_namespace_id()
 
@@ -825,7 +1352,13 @@ function M.show_selectable_output(bufnr, cursor_row)
 			end
 		end
 	end
-	target_cell_id = best_candidate.id
+	return best_candidate.id
+end
+
+--- Mostra l'output di una cella in una finestra flottante per la selezione.
+-- Le righe degli output paginati non ancora caricate vengono prima richieste al client Python.
+function M.show_selectable_output(bufnr, cursor_row)
+	local target_cell_id = M.find_cell_near(bufnr, cursor_row)
 
 	if not target_cell_id then
 		log.add(vim.log.levels.INFO, "Nessuna cella Jove trovata vicino alla posizione del cursore.")
@@ -838,40 +1371,46 @@ function M.show_selectable_output(bufnr, cursor_row)
 		return
 	end
 
+	local incomplete = vim.tbl_filter(has_more_pages, cell_info.outputs)
+	if #incomplete > 0 then
+		local pending = #incomplete
+		for _, output in ipairs(incomplete) do
+			load_output_page(target_cell_id, output, nil, function()
+				pending = pending - 1
+				if pending == 0 then
+					M.show_selectable_output(bufnr, cursor_row)
+				end
+			end)
+		end
+		return
+	end
+
 	local image_renderer = require("jove.image_renderer")
-	local lines = {}
-	local render_tasks = {}
+	state.touch_cell(target_cell_id)
 
 	-- Calcola la larghezza desiderata per la finestra flottante (e l'immagine)
 	-- Usiamo il 70% della larghezza dello schermo, meno bordi e padding
 	local desired_width = math.floor(vim.o.columns * 0.7)
 	local image_max_width = desired_width - 4
 
+	local function content_to_lines(content, into)
+		for _, line_chunks in ipairs(content) do
+			local line_text = ""
+			for _, chunk in ipairs(line_chunks) do
+				line_text = line_text .. chunk[1]
+			end
+			table.insert(into, line_text)
+		end
+	end
+
+	-- Ogni segmento è testo già pronto oppure un'immagine da preparare in modo asincrono.
+	local segments = {}
+	local pending_images = 0
 	for _, output in ipairs(cell_info.outputs) do
 		if (output.type == "terminal_popup" or output.type == "image_inline") and output.b64_data then
-			-- Pass 0 for max_pixels to disable resizing (use full resolution) for popup
-			local image_props, err = image_renderer.get_inline_image_properties(output.b64_data, image_max_width, 0)
-			if image_props then
-				-- Aggiungiamo un padding verticale per evitare che l'immagine venga tagliata o non pulita correttamente
-				image_props.height = image_props.height + 1
-				local image_start_line = #lines
-				for _ = 1, image_props.height do
-					table.insert(lines, "") -- Aggiungi linee vuote per fare spazio
-				end
-				table.insert(render_tasks, { props = image_props, lineno = image_start_line })
-			else
-				log.add(
-					vim.log.levels.WARN,
-					"Impossibile renderizzare l'immagine nel popup: " .. (err or "sconosciuto")
-				)
-				for _, line_chunks in ipairs(output.content) do
-					local line_text = ""
-					for _, chunk in ipairs(line_chunks) do
-						line_text = line_text .. chunk[1]
-					end
-					table.insert(lines, line_text)
-				end
-			end
+			local segment = { output = output }
+			table.insert(segments, segment)
+			pending_images = pending_images + 1
 		elseif
 			output.type == "stream"
 			or output.type == "execute_result"
@@ -879,71 +1418,115 @@ function M.show_selectable_output(bufnr, cursor_row)
 			or output.type == "error"
 			or output.type == "image_popup"
 		then
-			for _, line_chunks in ipairs(output.content) do
-				local line_text = ""
-				for _, chunk in ipairs(line_chunks) do
-					line_text = line_text .. chunk[1]
-				end
-				table.insert(lines, line_text)
-			end
+			local segment = { lines = {} }
+			content_to_lines(state.get_output_content(output), segment.lines)
+			table.insert(segments, segment)
 		elseif output.type == "image_inline" then
 			-- Fallback se b64_data non è presente (vecchi output?)
-			table.insert(lines, "[Immagine: inline (dati mancanti)]")
+			table.insert(segments, { lines = { "[Immagine: inline (dati mancanti)]" } })
 		end
 	end
 
-	if #lines == 0 then
-		log.add(vim.log.levels.INFO, "La cella Jove trovata non ha output di testo da selezionare.")
-		return
-	end
+	local function open_window()
+		local lines = {}
+		local render_tasks = {}
+		for _, segment in ipairs(segments) do
+			if segment.image_props then
+				local image_start_line = #lines
+				for _ = 1, segment.image_props.height do
+					table.insert(lines, "") -- Aggiungi linee vuote per fare spazio
+				end
+				table.insert(render_tasks, { props = segment.image_props, lineno = image_start_line })
+			elseif segment.output then
+				log.add(
+					vim.log.levels.WARN,
+					"Impossibile renderizzare l'immagine nel popup: " .. (segment.err or "sconosciuto")
+				)
+				content_to_lines(segment.output.content, lines)
+			else
+				vim.list_extend(lines, segment.lines)
+			end
+		end
 
-	local buf = vim.api.nvim_create_buf(false, true)
-	vim.bo[buf].buftype = "nofile"
-	vim.bo[buf].bufhidden = "hide"
-	vim.api.nvim_buf_set_lines(buf, 0, -1, false, lines)
-	local width = desired_width
-	local height = math.min(#lines, math.floor(vim.o.lines * 0.8))
-	local win = vim.api.nvim_open_win(buf, true, {
-		relative = "cursor",
-		width = width,
-		height = height,
-		row = 1,
-		col = 0,
-		style = "minimal",
-		border = "rounded",
-		title = "Jove Output (press 'q' to close)",
-		title_pos = "center",
-	})
-	vim.api.nvim_buf_set_keymap(buf, "n", "q", "<cmd>close<cr>", { noremap = true, silent = true })
+		if #lines == 0 then
+			log.add(vim.log.levels.INFO, "La cella Jove trovata non ha output di testo da selezionare.")
+			return
+		end
 
-	if #render_tasks > 0 then
-		local win_pos = vim.api.nvim_win_get_position(win)
-		local win_row, win_col = win_pos[1], win_pos[2]
-		local cleanup_tasks = {}
+		local buf = vim.api.nvim_create_buf(false, true)
+		vim.bo[buf].buftype = "nofile"
+		vim.bo[buf].bufhidden = "hide"
+		vim.api.nvim_buf_set_lines(buf, 0, -1, false, lines)
+		local width = desired_width
+		local height = math.min(#lines, math.floor(vim.o.lines * 0.8))
+		local win = vim.api.nvim_open_win(buf, true, {
+			relative = "cursor",
+			width = width,
+			height = height,
+			row = 1,
+			col = 0,
+			style = "minimal",
+			border = "rounded",
+			title = "Jove Output (press 'q' to close)",
+			title_pos = "center",
+		})
+		vim.api.nvim_buf_set_keymap(buf, "n", "q", "<cmd>close<cr>", { noremap = true, silent = true })
+
+		if #render_tasks > 0 then
+			local win_pos = vim.api.nvim_win_get_position(win)
+			local win_row, win_col = win_pos[1], win_pos[2]
+			local cleanup_tasks = {}
+
+			vim.schedule(function()
+				for _, task in ipairs(render_tasks) do
+					local abs_row = win_row + 1 + task.lineno
+					image_renderer.draw_inline_image_at_pos(abs_row, win_col, task.props)
+					table.insert(cleanup_tasks, {
+						line = abs_row + 1, -- La pulizia è 1-indexed
+						col = win_col + 2, -- win_col + 1(border) + 1(ANSI)
+						width = task.props.width,
+						height = task.props.height,
+						images = { task.props },
+						placement = require("jove.term-image.adapter").placements.POPUP,
+					})
+				end
+			end)
+
+			vim.api.nvim_create_autocmd("WinClosed", {
+				pattern = tostring(win),
+				once = true,
+				callback = function(ctx)
+					for _, task in ipairs(cleanup_tasks) do
+						image_renderer.clear_image_area(task)
+					end
+					vim.api.nvim_del_autocmd(ctx.id) -- Pulisce l'autocomando
+				end,
+			})
+		end
+	end
 
-		vim.schedule(function()
-			for _, task in ipairs(render_tasks) do
-				local abs_row = win_row + 1 + task.lineno
-				image_renderer.draw_inline_image_at_pos(abs_row, win_col, task.props)
-				table.insert(cleanup_tasks, {
-					line = abs_row + 1, -- La pulizia è 1-indexed
-					col = win_col + 2, -- win_col + 1(border) + 1(ANSI)
-					width = task.props.width,
-					height = task.props.height,
-				})
-			end
-		end)
+	if pending_images == 0 then
+		open_window()
+		return
+	end
 
-		vim.api.nvim_create_autocmd("WinClosed", {
-			pattern = tostring(win),
-			once = true,
-			callback = function(ctx)
-				for _, task in ipairs(cleanup_tasks) do
-					image_renderer.clear_image_area(task)
+	for _, segment in ipairs(segments) do
+		if segment.output then
+			-- Pass 0 for max_pixels to disable resizing (use full resolution) for popup
+			image_renderer.get_inline_image_properties(segment.output.b64_data, image_max_width, 0, function(image_props, err)
+				if image_props then
+					-- Aggiungiamo un padding verticale per evitare che l'immagine venga tagliata o non pulita correttamente
+					image_props.height = image_props.height + 1
+					segment.image_props = image_props
+				else
+					segment.err = err
 				end
-				vim.api.nvim_del_autocmd(ctx.id) -- Pulisce l'autocomando
-			end,
-		})
+				pending_images = pending_images - 1
+				if pending_images == 0 then
+					open_window()
+				end
+			end)
+		end
 	end
 end
 
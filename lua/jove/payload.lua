@@ -0,0 +1,77 @@
+-- lua/jove/payload.lua
+-- Riferimenti a payload grandi (immagini base64) scritti su file dal client Python.
+-- Un riferimento ha la forma `{ ["$ref"] = path, length = n, sha1 = hash }`: i dati
+-- vengono letti dal disco solo quando servono davvero (es. quando l'immagine viene disegnata).
+-- Con `offset` il riferimento indica una porzione del file (es. il file di spill, vedi `jove.spill`).
+local M = {}
+
+local log = require("jove.log")
+
+-- Ultimi payload letti, per non rileggere lo stesso file a ogni ridisegno.
+local MAX_CACHED = 4
+local recent = {} -- lista di { key = sha1, data = ... }, il più recente in fondo
+
+--- Indica se un valore è un riferimento a un payload su file.
+function M.is_ref(value)
+	return type(value) == "table" and type(value["$ref"]) == "string"
+end
+
+--- Restituisce il percorso del file di un riferimento (o nil se non è un riferimento).
+function M.path(value)
+	if M.is_ref(value) then
+		return value["$ref"]
+	end
+	return nil
+end
+
+--- Restituisce i dati di un payload, leggendoli dal file se è un riferimento.
+-- @param value (string|table) Il payload in linea o il riferimento.
+-- @return (string|nil, string|nil) I dati, oppure nil e un messaggio di errore.
+function M.resolve(value)
+	if not M.is_ref(value) then
+		return value
+	end
+
+	local key = value.sha1 or (value["$ref"] .. ":" .. tostring(value.offset or 0))
+	for i, entry in ipairs(recent) do
+		if entry.key == key then
+			table.remove(recent, i)
+			table.insert(recent, entry)
+			return entry.data
+		end
+	end
+
+	local file = io.open(value["$ref"], "rb")
+	if not file then
+		return nil, "Impossibile aprire il payload: " .. value["$ref"]
+	end
+	local data
+	if value.offset then
+		file:seek("set", value.offset)
+		data = file:read(value.length) or ""
+	else
+		data = file:read("*a")
+	end
+	file:close()
+
+	if value.length and #data ~= value.length then
+		return nil, string.format("Payload incompleto: %s (%d/%d byte)", value["$ref"], #data, value.length)
+	end
+
+	table.insert(recent, { key = key, data = data })
+	if #recent > MAX_CACHED then
+		table.remove(recent, 1)
+	end
+	return data
+end
+
+--- Come `resolve`, ma registra l'errore nel log e restituisce solo i dati (o nil).
+function M.resolve_or_log(value)
+	local data, err = M.resolve(value)
+	if not data then
+		log.add(vim.log.levels.ERROR, "[Jove] " .. err)
+	end
+	return data
+end
+
+return M
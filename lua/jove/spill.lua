@@ -0,0 +1,47 @@
+-- lua/jove/spill.lua
+-- File di spill della sessione: un unico file append-only in cui vengono spostati i dati
+-- degli output trattenuti (immagini base64, righe di testo nascoste) per liberare memoria.
+-- Ogni scrittura restituisce un riferimento `{ ["$ref"] = path, offset = n, length = m }`,
+-- leggibile con `jove.payload.resolve`.
+local M = {}
+
+local log = require("jove.log")
+
+local spill_path = nil
+local spill_size = 0
+
+--- Percorso del file di spill, nella directory temporanea di Neovim (rimossa all'uscita).
+local function get_path()
+	if not spill_path then
+		spill_path = vim.fn.tempname() .. "-jove-spill"
+	end
+	return spill_path
+end
+
+--- Accoda dei dati al file di spill.
+-- @param data (string) I dati da salvare.
+-- @return (table|nil) Il riferimento ai dati, o nil in caso di errore.
+function M.write(data)
+	local path = get_path()
+	local file = io.open(path, "ab")
+	if not file then
+		log.add(vim.log.levels.ERROR, "[Jove] Impossibile aprire il file di spill: " .. path)
+		return nil
+	end
+	local offset = file:seek("end")
+	local ok = file:write(data)
+	file:close()
+	if not ok then
+		log.add(vim.log.levels.ERROR, "[Jove] Scrittura nel file di spill fallita: " .. path)
+		return nil
+	end
+	spill_size = offset + #data
+	return { ["$ref"] = path, offset = offset, length = #data }
+end
+
+--- Numero di byte scritti nel file di spill in questa sessione.
+function M.size()
+	return spill_size
+end
+
+return M
@@ -13,9 +13,14 @@ local state = {
 	--     status = "idle", -- "starting", "idle", "busy", "error", "disconnected"
 	--     config = { ... }, -- La configurazione statica del kernel
 	--     ipykernel_job_id = nil,
-	--     py_client_job_id = nil,
+	--     py_client_job_id = nil, -- Client Python dedicato (kernel_bridge = "per_kernel")
+	--     bridge_id = nil, -- ID del kernel nel bridge condiviso (kernel_bridge = "shared")
 	--     on_ready_callback = nil,
-	--     current_execution_cell_id = nil,
+	--     connected = false, -- Il client Python è collegato al kernel
+	--     route = { name = ... }, -- Nome usato dai callback dei processi (nil dopo l'arresto)
+	--     pool_of = nil, -- Per i kernel di riserva: il nome del kernel di cui sono riserva
+	--     executions = { [msg_id] = { cell_id = ... } }, -- Richieste execute in corso o in coda
+	--     run_records = { [bufnr] = { [i] = sha256 } }, -- Celle Jupytext già eseguite (JoveRunStale)
 	--   }
 	-- }
 
@@ -24,6 +29,10 @@ local state = {
 
 	-- Struttura per memorizzare le celle. La chiave è un ID univoco (extmark ID).
 	cells = {},
+
+	-- Contatore usato come orologio logico per l'ordine LRU delle celle.
+	use_counter = 0,
+	budget_check_pending = false,
 }
 
 -- =========================================================================
@@ -38,12 +47,27 @@ function M.add_kernel(kernel_name, kernel_config)
 		config = kernel_config,
 		ipykernel_job_id = nil,
 		py_client_job_id = nil,
+		bridge_id = nil,
 		on_ready_callback = nil,
-		current_execution_cell_id = nil,
+		executions = {},
+		run_records = {},
 	}
 	vim.cmd("redraws!") -- Aggiorna la statusline
 end
 
+--- Registra un kernel esistente sotto un altro nome (es. un kernel preso dal pool).
+--- @return (table|nil) I dati del kernel, o nil se `old_name` non esiste.
+function M.rename_kernel(old_name, new_name)
+	local kernel_info = state.kernels[old_name]
+	if not kernel_info then
+		return nil
+	end
+	state.kernels[old_name] = nil
+	kernel_info.name = new_name
+	state.kernels[new_name] = kernel_info
+	return kernel_info
+end
+
 --- Rimuove un kernel dallo stato.
 function M.remove_kernel(kernel_name)
 	state.kernels[kernel_name] = nil
@@ -114,6 +138,7 @@ function M.add_cell(bufnr, start_row, end_row)
 		outputs = {}, -- Struttura dati per gli output
 		pending_clear = false, -- Per `clear_output(wait=true)`
 	}
+	M.touch_cell(cell_id)
 	return cell_id
 end
 
@@ -131,6 +156,7 @@ end
 function M.add_output_to_cell(cell_id, output_data)
 	if state.cells[cell_id] then
 		table.insert(state.cells[cell_id].outputs, output_data)
+		M.note_output_growth(cell_id)
 		return true
 	end
 	return false
@@ -141,7 +167,7 @@ function M.clear_cell_outputs(cell_id)
 	local cell_info = state.cells[cell_id]
 	if cell_info then
 		if cell_info.image_output_info then
-			require("jove.image_renderer").clear_image_area(cell_info.image_output_info, cell_id)
+			require("jove.image_renderer").clear_image_area(cell_info.image_output_info, cell_id, true)
 			cell_info.image_output_info = nil
 		end
 		cell_info.outputs = {}
@@ -153,7 +179,7 @@ function M.remove_cell(cell_id)
 	local cell_info = state.cells[cell_id]
 	if cell_info then
 		if cell_info.image_output_info then
-			require("jove.image_renderer").clear_image_area(cell_info.image_output_info, cell_id)
+			require("jove.image_renderer").clear_image_area(cell_info.image_output_info, cell_id, true)
 		end
 		-- Rimuove tutti i marcatori associati
 		for _, mark_id in ipairs(cell_info.output_marks) do
@@ -164,6 +190,7 @@ function M.remove_cell(cell_id)
 		end
 		pcall(vim.api.nvim_buf_del_extmark, cell_info.bufnr, NS_ID, cell_info.start_mark)
 		pcall(vim.api.nvim_buf_del_extmark, cell_info.bufnr, NS_ID, cell_info.end_mark)
+		require("jove.stats").forget_cell(cell_id)
 
 		state.cells[cell_id] = nil
 	end
@@ -191,4 +218,313 @@ function M.find_and_remove_cells_in_range(bufnr, start_row, end_row)
 	end
 end
 
+-- =========================================================================
+-- BUDGET DI MEMORIA DEGLI OUTPUT
+-- =========================================================================
+-- Gli output trattenuti hanno una dimensione stimata. Se il totale supera
+-- `output_memory_budget`, le celle usate meno di recente spostano nel file di spill
+-- (vedi `jove.spill`) i dati base64 delle immagini e le righe di testo nascoste dal
+-- limite `output_max_lines`; i dati vengono riletti solo quando servono.
+
+-- Stima del costo di ogni chunk di testo (tabella, stringa del gruppo di highlight).
+local CHUNK_OVERHEAD = 48
+-- Dati più piccoli di così non vale la pena spostarli su disco.
+local MIN_SPILL_BYTES = 4096
+
+--- Segna una cella come usata di recente.
+function M.touch_cell(cell_id)
+	local cell_info = state.cells[cell_id]
+	if cell_info then
+		state.use_counter = state.use_counter + 1
+		cell_info.last_used = state.use_counter
+	end
+end
+
+--- Segna una cella come usata e programma un controllo del budget di memoria.
+function M.note_output_growth(cell_id)
+	M.touch_cell(cell_id)
+	if state.budget_check_pending then
+		return
+	end
+	state.budget_check_pending = true
+	vim.defer_fn(function()
+		state.budget_check_pending = false
+		M.enforce_output_budget()
+	end, 1000)
+end
+
+--- Numero di righe di un output, comprese quelle spostate su disco.
+function M.output_line_count(output)
+	return #(output.content or {}) + (output.spilled_lines or 0)
+end
+
+--- Restituisce tutte le righe di un output, rileggendo dal disco quelle spostate.
+-- Non modifica l'output: serve per mostrarne il testo completo (es. JoveSelectOutput).
+function M.get_output_content(output)
+	if not output.spilled_head then
+		return output.content or {}
+	end
+	local payload = require("jove.payload")
+	local lines = {}
+	for _, part in ipairs(output.spilled_head) do
+		local data = payload.resolve_or_log(part.ref)
+		local ok, decoded = pcall(vim.json.decode, data or "")
+		if ok and type(decoded) == "table" then
+			vim.list_extend(lines, decoded)
+		else
+			for _ = 1, part.count do
+				table.insert(lines, { { "[riga non disponibile]", "Comment" } })
+			end
+		end
+	end
+	return vim.list_extend(lines, output.content or {})
+end
+
+--- Riporta in memoria le righe di un output spostate su disco.
+function M.restore_output(output)
+	if output.spilled_head then
+		output.content = M.get_output_content(output)
+		output.spilled_head = nil
+		output.spilled_lines = nil
+		output.spilled_bytes = nil
+		output._mem_lines = nil
+	end
+end
+
+--- Stima (in byte) la memoria del testo di un output. Le righe già contate vengono
+-- memorizzate nell'output, così gli stream che crescono costano solo le righe nuove.
+local function content_bytes(output)
+	local content = output.content or {}
+	-- L'ultima riga di uno stream può ancora cambiare: la ricontiamo sempre.
+	local cached_lines = math.max(#content - 1, 0)
+	local counted = output._mem_lines or 0
+	local bytes = output._mem_bytes or 0
+	if counted > cached_lines then
+		counted, bytes = 0, 0
+	end
+	local function line_bytes(line)
+		local n = 0
+		for _, chunk in ipairs(line) do
+			n = n + #chunk[1] + CHUNK_OVERHEAD
+		end
+		return n
+	end
+	for i = counted + 1, cached_lines do
+		bytes = bytes + line_bytes(content[i])
+	end
+	output._mem_lines = cached_lines
+	output._mem_bytes = bytes
+	if #content > 0 then
+		return bytes + line_bytes(content[#content])
+	end
+	return bytes
+end
+
+--- Stima (in byte) la memoria trattenuta da un output.
+function M.output_memory(output)
+	local bytes = content_bytes(output)
+	if type(output.b64_data) == "string" then
+		bytes = bytes + #output.b64_data
+	end
+	local props = output.image_props
+	if props and type(props.b64) == "string" and props.b64 ~= output.b64_data then
+		bytes = bytes + #props.b64
+	end
+	return bytes
+end
+
+--- Memoria trattenuta da una cella e byte spostati su disco.
+-- @return (integer, integer) Byte in memoria, byte su disco.
+function M.cell_memory(cell_info)
+	local in_memory, spilled = 0, 0
+	for _, output in ipairs(cell_info.outputs) do
+		in_memory = in_memory + M.output_memory(output)
+		spilled = spilled + (output.spilled_bytes or 0)
+	end
+	return in_memory, spilled
+end
+
+--- Sposta su disco un valore base64 e restituisce il riferimento (o il valore originale).
+local function spill_value(output, value)
+	if type(value) ~= "string" or #value < MIN_SPILL_BYTES then
+		return value, 0
+	end
+	local ref = require("jove.spill").write(value)
+	if not ref then
+		return value, 0
+	end
+	output.spilled_bytes = (output.spilled_bytes or 0) + #value
+	return ref, #value
+end
+
+--- Sposta su disco tutto ciò che una cella può liberare senza cambiare ciò che è visibile.
+-- @return (integer) Byte liberati (stimati).
+local function spill_cell(cell_info)
+	local freed = 0
+	local max_lines = require("jove").get_config().output_max_lines or 0
+	local total = 0
+	for _, output in ipairs(cell_info.outputs) do
+		total = total + M.output_line_count(output)
+	end
+	local hidden = (max_lines > 0 and total > max_lines) and (total - max_lines) or 0
+
+	local before = 0
+	for _, output in ipairs(cell_info.outputs) do
+		-- Immagini: i dati base64 (e quelli ricodificati per il disegno).
+		local props = output.image_props
+		local shared = props and props.b64 == output.b64_data
+		local ref, n = spill_value(output, output.b64_data)
+		output.b64_data = ref
+		freed = freed + n
+		if props then
+			if shared then
+				props.b64 = ref
+			else
+				props.b64, n = spill_value(output, props.b64)
+				freed = freed + n
+			end
+		end
+
+		-- Testo: le prime righe dell'output che ricadono nella parte nascosta.
+		local spilled_lines = output.spilled_lines or 0
+		local content = output.content or {}
+		local count = math.min(math.max(hidden - before - spilled_lines, 0), #content)
+		if count > 0 then
+			local head = {}
+			for i = 1, count do
+				head[i] = content[i]
+			end
+			local before_bytes = content_bytes(output)
+			local data = vim.json.encode(head)
+			local head_ref = require("jove.spill").write(data)
+			if head_ref then
+				local rest = {}
+				for i = count + 1, #content do
+					rest[#rest + 1] = content[i]
+				end
+				output.content = rest
+				output.spilled_head = output.spilled_head or {}
+				table.insert(output.spilled_head, { ref = head_ref, count = count })
+				output.spilled_lines = spilled_lines + count
+				output.spilled_bytes = (output.spilled_bytes or 0) + #data
+				freed = freed + before_bytes - content_bytes(output)
+			end
+		end
+		before = before + M.output_line_count(output)
+	end
+	return freed
+end
+
+--- Se la memoria stimata degli output supera il budget, sposta su disco i dati delle
+-- celle usate meno di recente finché non si rientra nel limite.
+function M.enforce_output_budget()
+	local budget = require("jove").get_config().output_memory_budget or 0
+	if budget <= 0 then
+		return
+	end
+
+	local entries = {}
+	local total = 0
+	for _, cell_info in pairs(state.cells) do
+		local bytes = M.cell_memory(cell_info)
+		total = total + bytes
+		table.insert(entries, cell_info)
+	end
+	if total <= budget then
+		return
+	end
+
+	table.sort(entries, function(a, b)
+		return (a.last_used or 0) < (b.last_used or 0)
+	end)
+	for _, cell_info in ipairs(entries) do
+		if total <= budget then
+			break
+		end
+		total = total - spill_cell(cell_info)
+	end
+end
+
+local function format_bytes(bytes)
+	if bytes >= 1024 * 1024 then
+		return string.format("%.1f MiB", bytes / (1024 * 1024))
+	elseif bytes >= 1024 then
+		return string.format("%.1f KiB", bytes / 1024)
+	end
+	return string.format("%d B", bytes)
+end
+
+--- Righe del report sulla memoria degli output, per buffer e per cella.
+function M.memory_report()
+	local budget = require("jove").get_config().output_memory_budget or 0
+	local buffers = {}
+	local buffer_order = {}
+	local total_memory, total_spilled = 0, 0
+	for cell_id, cell_info in pairs(state.cells) do
+		local in_memory, spilled = M.cell_memory(cell_info)
+		total_memory = total_memory + in_memory
+		total_spilled = total_spilled + spilled
+		local buf = buffers[cell_info.bufnr]
+		if not buf then
+			buf = { memory = 0, spilled = 0, cells = {} }
+			buffers[cell_info.bufnr] = buf
+			table.insert(buffer_order, cell_info.bufnr)
+		end
+		buf.memory = buf.memory + in_memory
+		buf.spilled = buf.spilled + spilled
+		-- Le celle di un buffer cancellato restano in state.cells: la loro riga non è più nota.
+		local pos = vim.api.nvim_buf_is_valid(cell_info.bufnr)
+			and vim.api.nvim_buf_get_extmark_by_id(cell_info.bufnr, NS_ID, cell_info.start_mark, {})
+		table.insert(buf.cells, {
+			id = cell_id,
+			row = pos and pos[1] and (pos[1] + 1) or 0,
+			outputs = #cell_info.outputs,
+			memory = in_memory,
+			spilled = spilled,
+		})
+	end
+
+	local lines = {
+		string.format(
+			"Output Jove: %s in memoria (budget %s), %s su disco (file di spill: %s)",
+			format_bytes(total_memory),
+			budget > 0 and format_bytes(budget) or "illimitato",
+			format_bytes(total_spilled),
+			format_bytes(require("jove.spill").size())
+		),
+	}
+	table.sort(buffer_order)
+	for _, bufnr in ipairs(buffer_order) do
+		local buf = buffers[bufnr]
+		local name = vim.api.nvim_buf_is_valid(bufnr) and vim.api.nvim_buf_get_name(bufnr) or ""
+		table.insert(
+			lines,
+			string.format(
+				"Buffer %d %s: %s in memoria, %s su disco",
+				bufnr,
+				name ~= "" and vim.fn.fnamemodify(name, ":~:.") or "[senza nome]",
+				format_bytes(buf.memory),
+				format_bytes(buf.spilled)
+			)
+		)
+		table.sort(buf.cells, function(a, b)
+			return a.row < b.row
+		end)
+		for _, cell in ipairs(buf.cells) do
+			table.insert(
+				lines,
+				string.format(
+					"  Cella %d (riga %d): %d output, %s in memoria, %s su disco",
+					cell.id,
+					cell.row,
+					cell.outputs,
+					format_bytes(cell.memory),
+					format_bytes(cell.spilled)
+				)
+			)
+		end
+	end
+	return lines
+end
+
 return M
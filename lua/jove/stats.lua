@@ -0,0 +1,264 @@
+-- lua/jove/stats.lua
+-- Statistiche per kernel: contatori di messaggi e byte ricevuti dal client Python e
+-- istogrammi della latenza di ogni fase, dal kernel fino al disegno in Neovim.
+--
+-- Ogni messaggio porta con sé dei timestamp (secondi dall'epoca):
+--   k = creazione nel kernel (header.date)
+--   r = ricezione nel client Python (_listen_kernel)
+--   s = invio a Lua (send_to_lua)
+--   h = ricezione in Lua (handle_py_client_message)
+--   d = fine del disegno (redraw_cell, o disegno dell'immagine per gli output immagine)
+local M = {}
+
+M.STAGES = {
+	{ name = "kernel", from = "k", to = "r", desc = "kernel → client Python" },
+	{ name = "bridge", from = "r", to = "s", desc = "client Python (accorpamento, immagini)" },
+	{ name = "transport", from = "s", to = "h", desc = "JSON su stdout → Lua" },
+	{ name = "render", from = "h", to = "d", desc = "Lua → disegno" },
+	{ name = "total", from = "k", to = "d", desc = "totale" },
+}
+
+-- Limite superiore (ms) di ogni bucket degli istogrammi; l'ultimo raccoglie il resto.
+local BUCKETS_MS = { 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, math.huge }
+-- Messaggi in attesa di disegno tenuti per cella (i più vecchi vengono scartati).
+local MAX_PENDING_PER_CELL = 64
+
+local kernels = {} -- [kernel_name] = { messages, bytes, by_type, histograms, since }
+local pending = {} -- [cell_id] = lista di { kernel_name, trace, kind }
+
+--- Ora corrente in secondi dall'epoca, confrontabile con i timestamp del client Python.
+function M.now()
+	local sec, usec = (vim.uv or vim.loop).gettimeofday()
+	return sec + usec / 1e6
+end
+
+local function new_histogram()
+	local buckets = {}
+	for i = 1, #BUCKETS_MS do
+		buckets[i] = 0
+	end
+	return { count = 0, sum = 0, min = nil, max = nil, buckets = buckets }
+end
+
+local function get_kernel_stats(kernel_name)
+	local entry = kernels[kernel_name]
+	if not entry then
+		entry = { messages = 0, bytes = 0, by_type = {}, histograms = {}, since = M.now() }
+		for _, stage in ipairs(M.STAGES) do
+			entry.histograms[stage.name] = new_histogram()
+		end
+		kernels[kernel_name] = entry
+	end
+	return entry
+end
+
+local function observe(histogram, ms)
+	if ms < 0 then
+		ms = 0 -- Orologi di processi diversi: piccoli scarti negativi sono rumore
+	end
+	histogram.count = histogram.count + 1
+	histogram.sum = histogram.sum + ms
+	histogram.min = histogram.min and math.min(histogram.min, ms) or ms
+	histogram.max = histogram.max and math.max(histogram.max, ms) or ms
+	for i, limit in ipairs(BUCKETS_MS) do
+		if ms <= limit then
+			histogram.buckets[i] = histogram.buckets[i] + 1
+			break
+		end
+	end
+end
+
+--- Registra le fasi del trace di cui sono noti entrambi gli estremi.
+local function record_stages(kernel_name, trace)
+	local entry = get_kernel_stats(kernel_name)
+	for _, stage in ipairs(M.STAGES) do
+		local from, to = trace[stage.from], trace[stage.to]
+		if from and to and not trace["_" .. stage.name] then
+			trace["_" .. stage.name] = true
+			observe(entry.histograms[stage.name], (to - from) * 1000)
+		end
+	end
+end
+
+--- Percentile stimato da un istogramma (limite superiore del bucket, al massimo il valore massimo).
+local function percentile(histogram, p)
+	if histogram.count == 0 then
+		return nil
+	end
+	local target = math.max(1, math.ceil(histogram.count * p))
+	local seen = 0
+	for i, n in ipairs(histogram.buckets) do
+		seen = seen + n
+		if seen >= target then
+			return math.min(BUCKETS_MS[i], histogram.max)
+		end
+	end
+	return histogram.max
+end
+
+--- Conta un messaggio ricevuto dal client Python.
+-- @param msg_type (string) Il tipo del messaggio (es. "iopub/stream", "image_iip").
+-- @param bytes (integer) La lunghezza della riga JSON.
+function M.count_message(kernel_name, msg_type, bytes)
+	local entry = get_kernel_stats(kernel_name)
+	entry.messages = entry.messages + 1
+	entry.bytes = entry.bytes + bytes
+	local by_type = entry.by_type[msg_type]
+	if not by_type then
+		by_type = { messages = 0, bytes = 0 }
+		entry.by_type[msg_type] = by_type
+	end
+	by_type.messages = by_type.messages + 1
+	by_type.bytes = by_type.bytes + bytes
+end
+
+--- Registra le fasi già concluse di un messaggio diretto a una cella e lo mette in attesa del disegno.
+-- @param trace (table) I timestamp ricevuti da Python, con `h` già impostato.
+-- @param kind (string) "text" (concluso da redraw_cell) o "image" (concluso dal disegno dell'immagine).
+function M.begin(kernel_name, cell_id, trace, kind)
+	record_stages(kernel_name, trace)
+	local list = pending[cell_id]
+	if not list then
+		list = {}
+		pending[cell_id] = list
+	end
+	table.insert(list, { kernel_name = kernel_name, trace = trace, kind = kind })
+	if #list > MAX_PENDING_PER_CELL then
+		table.remove(list, 1)
+	end
+end
+
+--- Chiude i messaggi in attesa per una cella: il loro output è stato disegnato.
+-- @param kind (string|nil) "text" (predefinito) o "image".
+function M.rendered(cell_id, kind)
+	local list = pending[cell_id]
+	if not list then
+		return
+	end
+	kind = kind or "text"
+	local now = M.now()
+	local remaining = {}
+	for _, item in ipairs(list) do
+		if item.kind == kind then
+			item.trace.d = now
+			record_stages(item.kernel_name, item.trace)
+		else
+			table.insert(remaining, item)
+		end
+	end
+	pending[cell_id] = #remaining > 0 and remaining or nil
+end
+
+--- Scarta i messaggi in attesa di disegno di una cella rimossa (non verranno più disegnati).
+function M.forget_cell(cell_id)
+	pending[cell_id] = nil
+end
+
+--- Azzera tutte le statistiche.
+function M.reset()
+	kernels = {}
+	pending = {}
+end
+
+--- Restituisce una copia delle statistiche, adatta alla serializzazione JSON.
+function M.snapshot()
+	local result = { time = M.now(), buckets_ms = {}, kernels = {} }
+	for i, limit in ipairs(BUCKETS_MS) do
+		result.buckets_ms[i] = limit == math.huge and "inf" or limit
+	end
+	for kernel_name, entry in pairs(kernels) do
+		local stages = {}
+		for _, stage in ipairs(M.STAGES) do
+			local h = entry.histograms[stage.name]
+			stages[stage.name] = {
+				count = h.count,
+				mean_ms = h.count > 0 and h.sum / h.count or vim.NIL,
+				min_ms = h.min or vim.NIL,
+				max_ms = h.max or vim.NIL,
+				p50_ms = percentile(h, 0.5) or vim.NIL,
+				p95_ms = percentile(h, 0.95) or vim.NIL,
+				buckets = vim.deepcopy(h.buckets),
+			}
+		end
+		result.kernels[kernel_name] = {
+			since = entry.since,
+			messages = entry.messages,
+			bytes = entry.bytes,
+			by_type = vim.deepcopy(entry.by_type),
+			stages = stages,
+		}
+	end
+	return result
+end
+
+--- Scrive le statistiche in un file JSON.
+-- @return (boolean, string|nil) true in caso di successo, altrimenti false e il messaggio di errore.
+function M.dump(path)
+	local file, err = io.open(path, "w")
+	if not file then
+		return false, err
+	end
+	file:write(vim.json.encode(M.snapshot()))
+	file:close()
+	return true
+end
+
+local function format_ms(value)
+	if value == nil then
+		return "-"
+	end
+	return string.format("%.1f", value)
+end
+
+--- Restituisce il riepilogo delle statistiche, riga per riga.
+function M.report()
+	local names = vim.tbl_keys(kernels)
+	table.sort(names)
+	if #names == 0 then
+		return { "Nessuna statistica raccolta." }
+	end
+
+	local lines = {}
+	for _, kernel_name in ipairs(names) do
+		local entry = kernels[kernel_name]
+		table.insert(
+			lines,
+			string.format(
+				"Kernel '%s': %d messaggi, %.1f KiB in %.0f s",
+				kernel_name,
+				entry.messages,
+				entry.bytes / 1024,
+				M.now() - entry.since
+			)
+		)
+		table.insert(lines, string.format("  %-10s %7s %8s %8s %8s  %s", "fase", "n", "media", "p50", "p95", "max (ms)"))
+		for _, stage in ipairs(M.STAGES) do
+			local h = entry.histograms[stage.name]
+			table.insert(
+				lines,
+				string.format(
+					"  %-10s %7d %8s %8s %8s  %-8s %s",
+					stage.name,
+					h.count,
+					format_ms(h.count > 0 and h.sum / h.count or nil),
+					format_ms(percentile(h, 0.5)),
+					format_ms(percentile(h, 0.95)),
+					format_ms(h.max),
+					stage.desc
+				)
+			)
+		end
+		local types = vim.tbl_keys(entry.by_type)
+		table.sort(types)
+		for _, msg_type in ipairs(types) do
+			local by_type = entry.by_type[msg_type]
+			table.insert(
+				lines,
+				string.format("  %-24s %7d messaggi %10.1f KiB", msg_type, by_type.messages, by_type.bytes / 1024)
+			)
+		end
+	end
+	return lines
+end
+
+return M
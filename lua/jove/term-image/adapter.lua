@@ -6,24 +6,47 @@ local log = require("jove.log")
 -- Tipi di adattatori
 M.adapters = {
 	IIP = "IIP",
-	-- Sixel, Kitty, etc. verranno aggiunti qui
+	KGP = "KGP", -- Kitty graphics protocol
+	-- Sixel, etc. verranno aggiunti qui
 	NONE = "NONE",
 }
 
+-- ID dei posizionamenti delle immagini (usati dai protocolli che li supportano).
+M.placements = {
+	INLINE = 1, -- Immagine sotto la cella
+	POPUP = 2, -- Immagine nella finestra di JoveSelectOutput
+}
+
 -- Mappa da emulatore ad adattatore
 local emulator_map = {
 	[emulator.known_emulators.WEZTERM] = M.adapters.IIP,
+	[emulator.known_emulators.KITTY] = M.adapters.KGP,
+	[emulator.known_emulators.GHOSTTY] = M.adapters.KGP,
+}
+
+-- Valori dell'opzione `image_protocol`
+local protocol_option = {
+	iip = M.adapters.IIP,
+	kgp = M.adapters.KGP,
 }
 
 -- Implementazioni dei driver
 local drivers = {
 	[M.adapters.IIP] = require("jove.term-image.drivers.iip"),
+	[M.adapters.KGP] = require("jove.term-image.drivers.kgp"),
 }
 
 local active_adapter = nil
 
---- Rileva e configura l'adattatore attivo in base al terminale.
+--- Rileva e configura l'adattatore attivo in base al terminale (o all'opzione `image_protocol`).
 function M.setup()
+	local forced = protocol_option[require("jove").get_config().image_protocol]
+	if forced then
+		active_adapter = forced
+		log.add(vim.log.levels.INFO, string.format("[term-image] Uso l'adattatore '%s' (image_protocol).", forced))
+		return
+	end
+
 	local detected_term = emulator.detect()
 	if detected_term and emulator_map[detected_term] then
 		active_adapter = emulator_map[detected_term]
@@ -32,19 +55,63 @@ function M.setup()
 			string.format("[term-image] Rilevato terminale '%s', uso l'adattatore '%s'.", detected_term, active_adapter)
 		)
 	else
-		active_adapter = M.adapters.NONE
-		if detected_term then
-			log.add(
-				vim.log.levels.WARN,
-				string.format(
-					"[term-image] Rilevato terminale '%s' ma nessun adattatore supportato trovato.",
-					detected_term
-				)
-			)
-		else
-			log.add(vim.log.levels.INFO, "[term-image] Nessun terminale conosciuto rilevato, supporto immagini disabilitato.")
-		end
+		-- Come prima dell'introduzione degli adattatori, in un terminale sconosciuto si prova IIP.
+		active_adapter = M.adapters.IIP
+		log.add(vim.log.levels.INFO, "[term-image] Nessun terminale conosciuto rilevato, uso l'adattatore IIP.")
+	end
+end
+
+--- Restituisce il driver dell'adattatore attivo (nil se non supportato).
+local function active_driver()
+	if not active_adapter then
+		M.setup() -- Configurazione automatica alla prima chiamata
+	end
+	return drivers[active_adapter]
+end
+
+--- Sequenza che disegna un'immagine alla posizione del cursore.
+-- @param image (table) Le proprietà dell'immagine preparate dal worker (`b64`, `width`, `height`).
+-- @param opts (table) `placement` (vedi M.placements), `name` (base64, per IIP), `float`.
+-- @return (string|nil) La sequenza, o nil se non è possibile disegnare l'immagine.
+function M.draw(image, opts)
+	local driver = active_driver()
+	if driver and driver.draw then
+		return driver.draw(image, opts or {})
 	end
+	return nil
+end
+
+--- Sequenza che cancella le immagini indicate, per i protocolli che le gestiscono per ID.
+-- @param image_info (table) `images` (le proprietà delle immagini) e `placement`.
+-- @param free (boolean|nil) Libera anche i dati delle immagini nel terminale.
+-- @return (string|nil) nil se il protocollo non supporta la cancellazione per ID.
+function M.delete(image_info, free)
+	local driver = active_driver()
+	if driver and driver.delete then
+		return driver.delete(image_info, free)
+	end
+	return nil
+end
+
+--- Indica se le immagini restano sullo schermo finché non vengono cancellate.
+function M.persistent_placements()
+	local driver = active_driver()
+	return driver ~= nil and driver.persistent_placements == true
+end
+
+--- Indica se il protocollo richiede immagini PNG.
+function M.needs_png()
+	local driver = active_driver()
+	return driver ~= nil and driver.needs_png == true
+end
+
+--- Sequenza che cancella tutte le immagini dal terminale (nil se non serve).
+function M.reset()
+	local driver = active_driver()
+	if driver and driver.reset then
+		return driver.reset()
+	end
+	return nil
 end
 
 --- Renderizza un'immagine usando l'adattatore attivo.
@@ -52,11 +119,7 @@ end
 -- @param opts (table) Opzioni per il rendering.
 -- @return (string|nil) La sequenza di escape per l'immagine, o nil se non supportato.
 function M.render(b64_data, opts)
-	if not active_adapter then
-		M.setup() -- Configurazione automatica alla prima chiamata
-	end
-
-	local driver = drivers[active_adapter]
+	local driver = active_driver()
 	if driver and driver.create_sequence then
 		return driver.create_sequence(b64_data, opts)
 	end
@@ -0,0 +1,100 @@
+--- Dimensione in pixel delle celle del terminale, per preparare ogni immagine esattamente
+-- per il riquadro che occuperà (invece di inviarla alla risoluzione originale).
+-- Viene letta con l'ioctl TIOCGWINSZ (ws_xpixel/ws_ypixel) oppure dall'opzione `image_cell_size`.
+local M = {}
+
+local log = require("jove.log")
+
+local ffi_ok, ffi = pcall(require, "ffi")
+
+-- Richiesta ioctl per leggere la dimensione della finestra del terminale.
+local TIOCGWINSZ = (ffi_ok and (ffi.os == "OSX" or ffi.os == "BSD")) and 0x40087468 or 0x5413
+local O_RDONLY = 0
+
+local cdef_ok = ffi_ok
+	and pcall(
+		ffi.cdef,
+		[[
+	struct jove_winsize { unsigned short ws_row, ws_col, ws_xpixel, ws_ypixel; };
+	int ioctl(int fd, unsigned long request, ...);
+	int open(const char *path, int flags, ...);
+	int close(int fd);
+]]
+	)
+
+-- Ultima dimensione letta: false se il terminale non la riporta, nil se non ancora letta.
+local cached = nil
+
+--- Legge la dimensione della finestra da un file descriptor.
+-- @return (table|nil) `{ width, height }` in pixel per cella, o nil se non disponibile.
+local function query_fd(fd)
+	local size = ffi.new("struct jove_winsize")
+	if ffi.C.ioctl(fd, TIOCGWINSZ, size) ~= 0 then
+		return nil
+	end
+	if size.ws_col == 0 or size.ws_row == 0 or size.ws_xpixel == 0 or size.ws_ypixel == 0 then
+		return nil -- Il terminale non riporta i pixel (es. alcuni multiplexer)
+	end
+	return {
+		width = size.ws_xpixel / size.ws_col,
+		height = size.ws_ypixel / size.ws_row,
+	}
+end
+
+--- Interroga il terminale (prima /dev/tty, poi stdout/stdin/stderr).
+local function query_terminal()
+	if not cdef_ok or ffi.os == "Windows" then
+		return nil
+	end
+	local ok, result = pcall(function()
+		local fd = ffi.C.open("/dev/tty", O_RDONLY)
+		if fd >= 0 then
+			local size = query_fd(fd)
+			ffi.C.close(fd)
+			if size then
+				return size
+			end
+		end
+		for _, std_fd in ipairs({ 1, 0, 2 }) do
+			local size = query_fd(std_fd)
+			if size then
+				return size
+			end
+		end
+		return nil
+	end)
+	if not ok then
+		log.add(vim.log.levels.DEBUG, "[term-image] Lettura della dimensione delle celle fallita: " .. tostring(result))
+		return nil
+	end
+	return result
+end
+
+--- Restituisce la dimensione in pixel di una cella del terminale.
+-- @return (table|nil) `{ width, height }`, o nil se sconosciuta (si usano le proporzioni predefinite).
+function M.get()
+	local configured = require("jove").get_config().image_cell_size
+	if type(configured) == "table" and configured.width and configured.height then
+		return { width = configured.width, height = configured.height }
+	end
+	if configured == false then
+		return nil
+	end
+	if cached == nil then
+		cached = query_terminal() or false
+		if cached then
+			log.add(
+				vim.log.levels.DEBUG,
+				string.format("[term-image] Celle del terminale di %.1fx%.1f pixel.", cached.width, cached.height)
+			)
+		end
+	end
+	return cached or nil
+end
+
+--- Dimentica la dimensione letta (es. dopo VimResized, per un cambio di font).
+function M.invalidate()
+	cached = nil
+end
+
+return M
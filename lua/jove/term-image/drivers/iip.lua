@@ -2,6 +2,7 @@
 local M = {}
 
 local log = require("jove.log")
+local payload = require("jove.payload")
 
 -- Fallback in puro Lua per la decodifica base64.
 local function lua_b64_decode(data)
@@ -70,4 +71,22 @@ function M.create_sequence(b64_data, opts)
 	return sequence
 end
 
+--- Sequenza che disegna un'immagine alla posizione del cursore. Con questo protocollo
+-- l'immagine viene inviata per intero a ogni disegno.
+-- @param image (table) Le proprietà dell'immagine (`b64`, anche come riferimento allo spool).
+-- @param opts (table) `name`: nome dell'immagine già codificato in base64, per poterla
+--   sostituire in seguito; `float`: immagine in una finestra flottante (non sposta il cursore).
+-- @return (string|nil) La sequenza, o nil se i dati dell'immagine non sono disponibili.
+function M.draw(image, opts)
+	local b64_data = payload.resolve_or_log(image.b64)
+	if not b64_data then
+		return nil
+	end
+	if opts.float then
+		return string.format("\x1b]1337;File=inline=1;size=%d;doNotMoveCursor=1:%s\a", #b64_data, b64_data)
+	end
+	local name_part = opts.name and string.format("name=%s;", opts.name) or ""
+	return string.format("\x1b]1337;File=%sinline=1:%s\a", name_part, b64_data)
+end
+
 return M
@@ -0,0 +1,100 @@
+--- Implementa il Kitty graphics protocol, usato da kitty e Ghostty.
+-- Ogni immagine viene trasmessa al terminale una sola volta, con un ID; poi bastano
+-- comandi di posizionamento (a=p) e di cancellazione (a=d) di poche decine di byte,
+-- invece di reinviare l'intera immagine a ogni ridisegno o scroll.
+local M = {}
+
+local payload = require("jove.payload")
+
+-- Le immagini restano sullo schermo (sopra il testo) finché non vengono cancellate:
+-- quelle delle celle uscite dalla finestra vanno tolte esplicitamente.
+M.persistent_placements = true
+-- Il protocollo accetta solo PNG (f=100) o pixel grezzi.
+M.needs_png = true
+
+-- Dimensione massima di ogni blocco base64 di una trasmissione.
+local CHUNK_SIZE = 4096
+
+local next_image_id = 0
+-- [image_id] = true per le immagini già trasmesse al terminale
+local transmitted = {}
+
+--- Comando APC del protocollo, con i dati (base64) opzionali.
+local function command(control, data)
+	if data then
+		return "\27_G" .. control .. ";" .. data .. "\27\\"
+	end
+	return "\27_G" .. control .. "\27\\"
+end
+
+--- Sequenza che trasmette (senza mostrarla) un'immagine PNG, divisa in blocchi.
+local function transmit(image_id, b64_data)
+	local parts = {}
+	local total = #b64_data
+	for offset = 1, total, CHUNK_SIZE do
+		local more = offset + CHUNK_SIZE <= total and 1 or 0
+		local chunk = b64_data:sub(offset, offset + CHUNK_SIZE - 1)
+		if offset == 1 then
+			parts[#parts + 1] = command(string.format("a=t,f=100,i=%d,q=2,m=%d", image_id, more), chunk)
+		else
+			parts[#parts + 1] = command(string.format("m=%d,q=2", more), chunk)
+		end
+	end
+	return table.concat(parts)
+end
+
+--- Sequenza che mostra l'immagine alla posizione del cursore, trasmettendola prima se il
+-- terminale non la ha ancora. Un nuovo posizionamento con lo stesso ID sposta l'immagine.
+-- @param image (table) Le proprietà dell'immagine (`b64`, `height`); il driver vi salva il suo ID.
+-- @param opts (table) `placement`: ID del posizionamento (es. inline o popup).
+-- @return (string|nil) La sequenza, o nil se i dati dell'immagine non sono disponibili.
+function M.draw(image, opts)
+	local parts = {}
+	local image_id = image.kgp_id
+	if not image_id or not transmitted[image_id] then
+		local b64_data = payload.resolve_or_log(image.b64)
+		if not b64_data then
+			return nil
+		end
+		next_image_id = next_image_id + 1
+		image_id = next_image_id
+		image.kgp_id = image_id
+		transmitted[image_id] = true
+		parts[#parts + 1] = transmit(image_id, (b64_data:gsub("[\r\n]", "")))
+	end
+	-- Con le sole righe (r) il terminale ricava le colonne dal rapporto d'aspetto, così
+	-- l'immagine sta nelle righe virtuali riservate. C=1: il cursore non si sposta.
+	parts[#parts + 1] = command(
+		string.format("a=p,i=%d,p=%d,r=%d,C=1,q=2", image_id, opts.placement or 1, image.height or 1)
+	)
+	return table.concat(parts)
+end
+
+--- Sequenza che cancella i posizionamenti delle immagini disegnate.
+-- @param image_info (table) `images`: le proprietà delle immagini; `placement`: il loro posizionamento.
+-- @param free (boolean|nil) Libera anche i dati delle immagini nel terminale (output rimosso).
+-- @return (string) La sequenza (vuota se le immagini non sono mai state trasmesse).
+function M.delete(image_info, free)
+	local parts = {}
+	for _, image in ipairs(image_info.images or {}) do
+		local image_id = image.kgp_id
+		if image_id and transmitted[image_id] then
+			if free then
+				parts[#parts + 1] = command(string.format("a=d,d=I,i=%d,q=2", image_id))
+				transmitted[image_id] = nil
+			else
+				parts[#parts + 1] =
+					command(string.format("a=d,d=i,i=%d,p=%d,q=2", image_id, image_info.placement or 1))
+			end
+		end
+	end
+	return table.concat(parts)
+end
+
+--- Sequenza che cancella tutte le immagini e ne libera i dati (es. all'uscita).
+function M.reset()
+	transmitted = {}
+	return command("a=d,d=A,q=2")
+end
+
+return M
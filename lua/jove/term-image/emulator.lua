@@ -2,17 +2,26 @@ local M = {}
 
 M.known_emulators = {
 	WEZTERM = "WezTerm",
+	KITTY = "kitty",
+	GHOSTTY = "Ghostty",
 	-- Aggiungere altri emulatori qui in futuro
 }
 
 --- Rileva l'emulatore di terminale corrente.
 -- @return (string|nil) Il nome dell'emulatore conosciuto o nil.
 function M.detect()
-	-- Per ora, ci basiamo su TERM_PROGRAM, che è un approccio comune.
+	-- Ci basiamo sulle variabili d'ambiente impostate dai terminali, che è un approccio comune.
 	local term_program = vim.env.TERM_PROGRAM
+	local term = vim.env.TERM
 	if term_program and term_program:match("WezTerm") then
 		return M.known_emulators.WEZTERM
 	end
+	if vim.env.KITTY_WINDOW_ID or term == "xterm-kitty" then
+		return M.known_emulators.KITTY
+	end
+	if term_program == "ghostty" or term == "xterm-ghostty" then
+		return M.known_emulators.GHOSTTY
+	end
 
 	-- Aggiungere qui altre logiche di rilevamento...
 
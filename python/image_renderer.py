@@ -1,8 +1,11 @@
 import base64
+import hashlib
 import io
+import os
 import sys
 import json
 import math
+from collections import OrderedDict
 
 # Assicurarsi che Pillow sia disponibile.
 try:
@@ -13,48 +16,261 @@ except ImportError:
 CELL_ASPECT_RATIO = 1 / 3
 
 
-def prepare_iterm_image_from_b64(b64_data, max_width_chars=80, max_pixels=None):
+class PreparedImageCache:
+    """
+    Cache content-addressed delle immagini già preparate.
+    La chiave è l'hash dei byte dell'immagine più i parametri di rendering.
+    Un livello in memoria (LRU limitata) è affiancato da un livello su disco opzionale.
+    """
+
+    def __init__(self, max_entries=64, disk_dir=None, max_disk_entries=512):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_dir:
+            try:
+                os.makedirs(disk_dir, exist_ok=True)
+                self._prune_disk(max_disk_entries)
+            except OSError:
+                self.disk_dir = None
+
+    @staticmethod
+    def make_key(image_bytes, max_width_chars, max_pixels, png=False, cell_size=None):
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        key = f"{digest}-w{int(max_width_chars)}-p{int(max_pixels or 0)}{'-png' if png else ''}"
+        if cell_size:
+            key += "-c{:g}x{:g}".format(*cell_size)
+        return key
+
+    def get(self, key):
+        result = self._entries.get(key)
+        if result is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+        result = self._read_disk(key)
+        if result is not None:
+            self.disk_hits += 1
+            self._remember(key, result)
+            return result
+
+        self.misses += 1
+        return None
+
+    def put(self, key, result):
+        self._remember(key, result)
+        self._write_disk(key, result)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+        }
+
+    def _remember(self, key, result):
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key + ".json")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key, result):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(result, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+    def _prune_disk(self, max_disk_entries):
+        # Rimuove le voci più vecchie oltre il limite, una volta all'avvio del worker.
+        files = [
+            os.path.join(self.disk_dir, name)
+            for name in os.listdir(self.disk_dir)
+            if name.endswith(".json")
+        ]
+        if len(files) <= max_disk_entries:
+            return
+        files.sort(key=os.path.getmtime)
+        for path in files[: len(files) - max_disk_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def prepare_iterm_image_props(
+    b64_data, max_width_chars=80, max_pixels=None, cache=None, png=False, cell_size=None
+):
     """
     Calcola le dimensioni di un'immagine da dati base64.
     Se max_pixels è specificato, ridimensiona l'immagine (thumbnail) prima di calcolare.
+    Con `png` un'immagine in un altro formato viene ricodificata in PNG (es. per il
+    Kitty graphics protocol).
+    Con `cell_size` (larghezza e altezza in pixel di una cella del terminale) l'immagine
+    viene ridotta al riquadro che occuperà, e le dimensioni in celle sono esatte.
+    Restituisce un dizionario con `b64`, `width` e `height`, oppure con `error`.
+    Se viene passata una `PreparedImageCache`, i risultati vengono letti e salvati lì.
     """
     try:
         image_bytes = base64.b64decode(b64_data)
+    except Exception as e:
+        return {"error": str(e)}
+
+    if cache is None:
+        return _prepare_image_bytes(image_bytes, b64_data, max_width_chars, max_pixels, png, cell_size)
+
+    key = cache.make_key(image_bytes, max_width_chars, max_pixels, png, cell_size)
+    cached = cache.get(key)
+    if cached is not None:
+        result = dict(cached)
+        if result["b64"] is None:
+            result["b64"] = b64_data
+        return result
+
+    result = _prepare_image_bytes(image_bytes, b64_data, max_width_chars, max_pixels, png, cell_size)
+    if "error" not in result:
+        # Se l'immagine non è stata ricodificata non serve salvarne una copia:
+        # i dati originali arrivano comunque con ogni richiesta.
+        cached = dict(result)
+        if cached["b64"] is b64_data:
+            cached["b64"] = None
+        cache.put(key, cached)
+    return result
+
+
+def _palette_image(img):
+    """
+    Versione a palette (modo "P") dell'immagine se ha al massimo 256 colori e nessuna
+    trasparenza, come i grafici senza antialiasing: è una conversione senza perdita e il
+    PNG risultante è molto più piccolo. Restituisce None se non è applicabile.
+    """
+    if img.mode == "RGBA":
+        if img.getextrema()[3] != (255, 255):
+            return None
+        img = img.convert("RGB")
+    elif img.mode != "RGB":
+        return None
+    colors = img.getcolors(256)
+    if not colors:
+        return None
+    palette = []
+    for _, color in colors:
+        palette.extend(color)
+    palette_img = Image.new("P", (1, 1))
+    palette_img.putpalette(palette + [0, 0, 0] * (256 - len(colors)))
+    # Ogni colore dell'immagine è nella palette: la quantizzazione è esatta.
+    return img.quantize(palette=palette_img, dither=Image.Dither.NONE)
+
+
+def _encode_image(img, source_format, png, max_length=None):
+    """
+    Codifica l'immagine nel formato più economico adatto al protocollo, in base64.
+    Se il PNG supera `max_length` (la dimensione dei dati originali), un'immagine opaca
+    viene ridotta a una palette di 256 colori, quasi indistinguibile per i grafici.
+    """
+    buffered = io.BytesIO()
+    palette = _palette_image(img)
+    if palette is not None:
+        palette.save(buffered, format="PNG")
+    elif source_format == "JPEG" and not png:
+        # Una foto ridotta resta JPEG: in PNG occuperebbe molto di più.
+        img.convert("RGB").save(buffered, format="JPEG", quality=90)
+    else:
+        img.save(buffered, format="PNG")
+        if max_length and buffered.tell() * 4 / 3 > max_length and img.mode in ("RGB", "RGBA"):
+            opaque = img.mode == "RGB" or img.getextrema()[3] == (255, 255)
+            if opaque:
+                quantized = io.BytesIO()
+                reduced = img.convert("RGB").quantize(256, method=Image.Quantize.FASTOCTREE)
+                reduced.save(quantized, format="PNG")
+                if quantized.tell() < buffered.tell():
+                    buffered = quantized
+    return base64.b64encode(buffered.getvalue()).decode("utf-8")
+
+
+def _prepare_image_bytes(
+    image_bytes, b64_data, max_width_chars, max_pixels, png=False, cell_size=None
+):
+    try:
         with Image.open(io.BytesIO(image_bytes)) as img:
+            source_format = img.format
+            resized = False
             # Resize logic
             if max_pixels:
                 try:
                     max_pixels = int(max_pixels)
-                    img.thumbnail((max_pixels, max_pixels))
-                    # Save back to bytes to get new b64
-                    buffered = io.BytesIO()
-                    img.save(buffered, format="PNG")
-                    b64_data = base64.b64encode(buffered.getvalue()).decode("utf-8")
+                    if img.width > max_pixels or img.height > max_pixels:
+                        img.thumbnail((max_pixels, max_pixels))
+                        resized = True
                 except Exception:
-                    # If resizing fails, we just proceed with original image but log/return error if needed?
-                    # For now, let's just ignore resize failure and proceed or maybe return error?
-                    # Staying safe: just print error to stderr if possible or ignore.
+                    # Se il ridimensionamento fallisce si prosegue con l'immagine originale.
                     pass
 
             img_w, img_h = img.size
             if img_w == 0 or img_h == 0:
-                return json.dumps({"error": "L'immagine ha dimensioni nulle."})
+                return {"error": "L'immagine ha dimensioni nulle."}
 
-            image_aspect_in_pixels = img_w / img_h
-            image_aspect_in_cells = image_aspect_in_pixels / CELL_ASPECT_RATIO
+            if cell_size:
+                # Con la dimensione in pixel delle celle l'immagine viene ridotta esattamente
+                # al riquadro di `max_width_chars` colonne: i pixel in più non si vedrebbero.
+                cell_w, cell_h = cell_size
+                box_width = int(max_width_chars * cell_w)
+                if img_w > box_width > 0:
+                    img_h = max(1, round(img_h * box_width / img_w))
+                    img_w = box_width
+                    img = img.resize((img_w, img_h), Image.Resampling.LANCZOS)
+                    resized = True
+                final_width_chars = min(int(max_width_chars), math.ceil(img_w / cell_w))
+                final_height_chars = math.ceil(img_h / cell_h)
+            else:
+                image_aspect_in_pixels = img_w / img_h
+                image_aspect_in_cells = image_aspect_in_pixels / CELL_ASPECT_RATIO
 
-            final_width_chars = int(max_width_chars)
-            final_height_chars = math.ceil(final_width_chars / image_aspect_in_cells)
+                final_width_chars = int(max_width_chars)
+                final_height_chars = math.ceil(final_width_chars / image_aspect_in_cells)
 
-            # Non ricodifichiamo, usiamo i dati originali
-            result = {
+            if resized or (png and source_format != "PNG"):
+                b64_data = _encode_image(img, source_format, png, len(b64_data))
+            elif cell_size and source_format == "PNG":
+                # Immagine già piccola: la versione a palette conviene solo se più leggera.
+                encoded = _encode_image(img, source_format, png)
+                if len(encoded) < len(b64_data):
+                    b64_data = encoded
+
+            return {
                 "b64": b64_data,
                 "width": final_width_chars,
                 "height": int(final_height_chars),
             }
-            return json.dumps(result)
     except Exception as e:
-        return json.dumps({"error": str(e)})
+        return {"error": str(e)}
+
+
+def prepare_iterm_image_from_b64(b64_data, max_width_chars=80, max_pixels=None):
+    """Come `prepare_iterm_image_props`, ma restituisce il risultato serializzato in JSON."""
+    return json.dumps(prepare_iterm_image_props(b64_data, max_width_chars, max_pixels))
 
 
 def prepare_iterm_image(image_path, max_width_chars=80):
@@ -72,7 +288,64 @@ def prepare_iterm_image(image_path, max_width_chars=80):
         return json.dumps({"error": str(e)})
 
 
+def serve(cache=None):
+    """
+    Modalità worker persistente: legge richieste JSON (una per riga) da stdin e
+    risponde su stdout con lo stesso `id`, così Lua può gestirle in modo asincrono
+    pagando l'avvio dell'interprete e l'import di Pillow una sola volta.
+    La richiesta `{"command": "stats"}` restituisce i contatori della cache.
+    Al posto di `b64` una richiesta può indicare `path`, un file dello spool con i
+    dati base64 (eventualmente solo la porzione `offset`/`length`): in quel caso, se
+    l'immagine non viene ricodificata, la risposta omette `b64` e Lua continua a usare
+    il riferimento al file.
+    """
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            if request.get("command") == "stats":
+                result = cache.stats() if cache else {}
+            else:
+                b64_data = request.get("b64", "")
+                if request.get("path"):
+                    with open(request["path"], "rb") as f:
+                        if request.get("offset") is not None:
+                            f.seek(request["offset"])
+                            b64_data = f.read(request.get("length") or -1).decode("ascii")
+                        else:
+                            b64_data = f.read().decode("ascii")
+                cell_size = None
+                if request.get("cell_width") and request.get("cell_height"):
+                    cell_size = (float(request["cell_width"]), float(request["cell_height"]))
+                result = prepare_iterm_image_props(
+                    b64_data,
+                    request.get("max_width") or 80,
+                    request.get("max_pixels"),
+                    cache,
+                    bool(request.get("png")),
+                    cell_size,
+                )
+                if request.get("path") and result.get("b64") is b64_data:
+                    del result["b64"]
+        except Exception as e:
+            result = {"error": str(e)}
+        result["id"] = request_id
+        sys.stdout.write(json.dumps(result) + "\n")
+        sys.stdout.flush()
+
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--server":
+        # Argomenti opzionali: numero massimo di voci in memoria e directory della cache su disco.
+        cache_entries = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+        cache_dir = sys.argv[3] if len(sys.argv) > 3 and sys.argv[3] else None
+        serve(PreparedImageCache(cache_entries, cache_dir) if cache_entries > 0 else None)
+        sys.exit(0)
+
     # Legge i dati b64 da stdin e stampa il risultato JSON
     input_data = sys.stdin.read().strip()
 
@@ -1,47 +1,570 @@
-import jupyter_client
+import argparse
+import atexit
+import functools
+import hashlib
 import json
+import logging
+import logging.handlers
+import queue
+import secrets
+import shlex
+import signal
+import socket
+import subprocess
 import sys
 import threading
 import time
 import os
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from queue import Empty
 import base64
 import io
-from typing import Any, Dict, Optional
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple, Union
 
-try:
-    from PIL import Image
-except ImportError:
-    Image = None
+# jupyter_client e zmq sono lenti da importare: li importa _import_jupyter(), dopo
+# l'eventuale avvio del kernel, così i due avvii procedono in parallelo.
+jupyter_client: Any = None
+zmq: Any = None
 
-try:
-    from sixel import SixelWriter
-except ImportError:
-    SixelWriter = None
 
-# Configurazione del logging (semplice, per debug)
+# Configurazione del logging: i messaggi passano da una coda a un thread che scrive sul file,
+# così il thread del kernel e quello di stdin non attendono mai l'I/O del log.
 LOG_FILE_PATH: str = os.path.join(os.path.expanduser("~"), "jove_py_client.log")
+LOG_FORMAT: str = "%(asctime)s - %(levelname)s - %(message)s"
 
+logger = logging.getLogger("jove.py_client")
 
-def log_message(message: str) -> None:
-    # Appends a message to the log file with a timestamp.
-    with open(LOG_FILE_PATH, "a") as f:
-        f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - {message}\n")
+def _collapse_carriage_returns(text: str) -> str:
+    """
+    Applica la semantica di `\r` (ritorno a inizio riga) a un testo di stream:
+    di ogni riga sovrascritta resta solo l'ultimo contenuto visibile. Se la prima
+    riga conteneva un `\r`, conserva un `\r` iniziale per indicare a Lua che deve
+    sovrascrivere la riga parziale ricevuta in precedenza. `\r\n` è un semplice
+    a capo (come nel terminale) e non sovrascrive nulla.
+    """
+    if "\r" not in text:
+        return text
+    lines = text.replace("\r\n", "\n").split("\n")
+    for i, line in enumerate(lines):
+        if "\r" in line:
+            parts = [part for part in line.split("\r") if part]
+            visible = parts[-1] if parts else ""
+            lines[i] = "\r" + visible if i == 0 else visible
+    return "\n".join(lines)
+
+
+def _import_jupyter() -> None:
+    global jupyter_client, zmq
+    if jupyter_client is None:
+        import jupyter_client as _jupyter_client
+        import zmq as _zmq
+
+        jupyter_client, zmq = _jupyter_client, _zmq
+
+
+@functools.lru_cache(maxsize=None)
+def _pil_image() -> Any:
+    """Modulo PIL.Image, importato al primo uso (None se Pillow non è installato)."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
+
+@functools.lru_cache(maxsize=None)
+def _sixel_writer() -> Any:
+    """Classe SixelWriter, importata al primo uso (None se libsixel-python non è installato)."""
+    try:
+        from sixel import SixelWriter
+    except ImportError:
+        return None
+    return SixelWriter
+
+
+# Secondi di attesa perché il kernel risponda a kernel_info prima di segnalare "connected".
+KERNEL_READY_TIMEOUT: float = 60.0
+
+# Numero massimo di thread dedicati alla conversione delle immagini (decode, resize, Sixel).
+IMAGE_POOL_WORKERS: int = 2
+
+# Output text/plain paginati (vedi KernelClient._paginate) conservati per ogni kernel:
+# oltre questo numero i più vecchi vengono scartati e le loro pagine non sono più disponibili.
+PAGED_OUTPUTS_KEPT: int = 32
+# Bundle MIME con rappresentazioni scartate (vedi KernelClient._prune_mime) conservati per
+# ogni kernel, con lo stesso criterio delle pagine.
+DROPPED_BUNDLES_KEPT: int = 32
+# Messaggi IOPub con un bundle MIME, che può essere sfoltito e il cui text/plain può
+# essere paginato.
+DISPLAY_MSG_TYPES = ("execute_result", "display_data", "update_display_data")
+# Messaggi IOPub che devono arrivare a Lua dopo gli update_display_data in attesa della
+# stessa richiesta (vedi KernelClient._hold_update): altrimenti l'ordine cambierebbe l'output,
+# e dopo status idle Lua non associa più la richiesta alla sua cella. Vale anche per tutte
+# le risposte sul canale shell (execute_reply).
+UPDATE_BARRIER_MSG_TYPES = ("execute_result", "display_data", "clear_output", "error", "status")
+
+# Un messaggio per Lua già pronto, oppure un'immagine ancora in elaborazione nel pool.
+OutputItem = Union[Dict[str, Any], "Future[Dict[str, Any]]"]
+
+
+def setup_logging(level: str = "INFO") -> None:
+    """
+    Configura il logger del client: un QueueHandler non bloccante davanti a un
+    FileHandler servito da un QueueListener in background. Sotto il livello scelto
+    i messaggi vengono scartati prima di essere formattati.
+    Il listener viene fermato all'uscita del processo, svuotando la coda.
+    """
+    global LOG_FILE_PATH
+    logger.setLevel(getattr(logging, level.upper(), logging.INFO))
+    logger.propagate = False
+    try:
+        file_handler = logging.FileHandler(LOG_FILE_PATH, mode="w", encoding="utf-8")
+    except OSError:
+        LOG_FILE_PATH = os.path.join(os.getcwd(), "jove_py_client.log")
+        try:
+            file_handler = logging.FileHandler(LOG_FILE_PATH, mode="w", encoding="utf-8")
+        except OSError:
+            logger.addHandler(logging.NullHandler())
+            return
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+
+# Porte già assegnate ai kernel avviati da questo processo (vedi start_kernel_process).
+_reserved_ports: Set[int] = set()
+_reserved_ports_lock: threading.Lock = threading.Lock()
+
+
+def start_kernel_process(kernel_cmd: str, connection_file: str) -> subprocess.Popen:
+    """
+    Scrive un file di connessione (porte libere su localhost, chiave casuale) e avvia il
+    kernel con `kernel_cmd`, dove `{connection_file}` viene sostituito dal percorso.
+    Usa solo la libreria standard, così il kernel parte prima che jupyter_client sia importato.
+    """
+    # Le porte scelte restano riservate: un altro kernel avviato subito dopo (prima che
+    # questo le abbia aperte) potrebbe altrimenti ricevere le stesse porte libere.
+    sockets = []
+    ports: List[int] = []
+    with _reserved_ports_lock:
+        while len(ports) < 5:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.bind(("127.0.0.1", 0))
+            sockets.append(sock)
+            port = sock.getsockname()[1]
+            if port not in _reserved_ports:
+                _reserved_ports.add(port)
+                ports.append(port)
+    for sock in sockets:
+        sock.close()
+    info = {
+        "transport": "tcp",
+        "ip": "127.0.0.1",
+        "shell_port": ports[0],
+        "iopub_port": ports[1],
+        "stdin_port": ports[2],
+        "control_port": ports[3],
+        "hb_port": ports[4],
+        "key": secrets.token_hex(16),
+        "signature_scheme": "hmac-sha256",
+        "kernel_name": "",
+    }
+    fd = os.open(connection_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump(info, f)
+
+    argv = [part.replace("{connection_file}", connection_file) for part in shlex.split(kernel_cmd)]
+    logger.info("Starting kernel: %s", argv)
+    return subprocess.Popen(
+        argv,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        start_new_session=True,
+    )
+
+
+def stop_kernel_process(process: Optional[subprocess.Popen], connection_file: str) -> None:
+    """
+    Ferma un kernel avviato con start_kernel_process il cui client non si è collegato
+    (senza jupyter_client non può chiedergli di chiudersi) e ne rimuove il file di connessione.
+    """
+    if process is None:
+        return
+    if process.poll() is None:
+        process.kill()
+        process.wait()
+        logger.info("Kernel process %s killed.", process.pid)
+    try:
+        os.remove(connection_file)
+    except OSError:
+        pass
+
+
+class Bridge:
+    """
+    Il processo ponte tra Neovim e uno o più kernel. Stdout, il pool per le immagini
+    e un unico thread listener, che attende con un poller ZMQ sui canali di tutti i
+    kernel collegati, sono condivisi. In modalità multiplex ogni messaggio da e verso
+    Lua porta nel campo `kernel` l'ID del kernel scelto da Lua; altrimenti il processo
+    serve un solo kernel, registrato con ID None.
+    """
+
+    def __init__(
+        self,
+        spool_dir: Optional[str] = None,
+        spool_threshold: int = 0,
+        stream_window_ms: int = 16,
+        page_lines: int = 0,
+        mime_types: Optional[List[str]] = None,
+        display_update_max_fps: int = 0,
+    ) -> None:
+        # Payload di immagini più grandi di spool_threshold byte vengono scritti una
+        # sola volta in spool_dir e a Lua arriva solo un riferimento al file.
+        self.spool_dir: Optional[str] = None
+        self.spool_threshold: int = spool_threshold
+        if spool_dir and spool_threshold > 0:
+            try:
+                os.makedirs(spool_dir, exist_ok=True)
+                self.spool_dir = spool_dir
+            except OSError as e:
+                logger.error("Cannot create spool directory %s: %s", spool_dir, e)
+        # Messaggi `stream` consecutivi con lo stesso parent msg_id e lo stesso nome
+        # vengono accorpati per stream_window secondi (0 per inoltrarli subito).
+        self.stream_window: float = max(stream_window_ms, 0) / 1000.0
+        # Gli output text/plain più lunghi di page_lines righe restano qui: a Lua arriva
+        # solo la prima pagina, le altre vengono inviate su richiesta (0 per disabilitare).
+        self.page_lines: int = max(page_lines, 0)
+        # Rappresentazioni inoltrate a Lua, in ordine di preferenza: le altre restano qui e
+        # vengono inviate su richiesta (None per inoltrare tutto il bundle).
+        self.mime_types: Optional[List[str]] = mime_types or None
+        # Gli update_display_data di uno stesso display_id vengono inoltrati al massimo
+        # display_update_max_fps volte al secondo: tra un invio e l'altro resta in attesa
+        # solo il più recente, e i precedenti vengono scartati (0 per inoltrarli tutti).
+        self.update_interval: float = (
+            1.0 / display_update_max_fps if display_update_max_fps > 0 else 0.0
+        )
+        self._stdout_lock: threading.Lock = threading.Lock()
+        # Le immagini vengono elaborate fuori dal thread del listener.
+        self.image_pool: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=IMAGE_POOL_WORKERS, thread_name_prefix="jove-image"
+        )
+        self.clients: Dict[Optional[str], "KernelClient"] = {}
+        # Comandi ricevuti per kernel ancora in avvio, inoltrati appena il kernel è pronto,
+        # e processi dei kernel avviati ma non ancora collegati (da fermare all'uscita).
+        self._starting: Dict[Optional[str], List[Dict[str, Any]]] = {}
+        self._launching: Dict[Optional[str], subprocess.Popen] = {}
+        self._clients_lock: threading.RLock = threading.RLock()
+        # Client da aggiungere o togliere dal poller: il poller viene modificato solo
+        # dal thread del listener, che viene svegliato con un messaggio sul socket inproc.
+        self._changes: List[Tuple[str, "KernelClient", threading.Event]] = []
+        self._changes_lock: threading.Lock = threading.Lock()
+        self._wake_sender: Any = None
+        self._wake_receiver: Any = None
+        self.listener_thread: Optional[threading.Thread] = None
+        self.stop_event: threading.Event = threading.Event()
+
+    def _ensure_listener(self) -> None:
+        with self._changes_lock:
+            if self.listener_thread is not None:
+                return
+            context = zmq.Context.instance()
+            wake_address = f"inproc://jove-wake-{id(self)}"
+            self._wake_receiver = context.socket(zmq.PAIR)
+            self._wake_receiver.bind(wake_address)
+            self._wake_sender = context.socket(zmq.PAIR)
+            self._wake_sender.connect(wake_address)
+            self.listener_thread = threading.Thread(target=self._listen, daemon=True)
+            self.listener_thread.start()
+        logger.info("Kernel listener thread started.")
+
+    def _wake(self) -> None:
+        # I socket ZMQ non sono thread-safe: il lock serializza i thread che svegliano il listener.
+        with self._changes_lock:
+            try:
+                self._wake_sender.send(b"")
+            except zmq.ZMQError as e:
+                logger.error("Error waking kernel listener thread: %s", e)
+
+    def add_client(self, client: "KernelClient") -> None:
+        """Registra un client collegato e inizia ad ascoltare i suoi canali."""
+        self._ensure_listener()
+        with self._changes_lock:
+            self._changes.append(("add", client, threading.Event()))
+        self._wake()
+        with self._clients_lock:
+            queued = self._starting.pop(client.name, [])
+            self._launching.pop(client.name, None)
+            self.clients[client.name] = client
+            # Sotto il lock, così i comandi arrivati nel frattempo restano in ordine.
+            for command_data in queued:
+                client.process_command(command_data)
+
+    def remove_client(self, client: "KernelClient") -> None:
+        """Smette di ascoltare i canali di un client (inoltrando gli stream in attesa)."""
+        with self._clients_lock:
+            if self.clients.get(client.name) is client:
+                del self.clients[client.name]
+        if self.listener_thread is None:
+            return
+        done = threading.Event()
+        with self._changes_lock:
+            self._changes.append(("remove", client, done))
+        self._wake()
+        if self.listener_thread.is_alive() and threading.current_thread() is not self.listener_thread:
+            done.wait(timeout=1)
+
+    def _apply_changes(
+        self, poller: Any, sockets: Dict[Any, Tuple["KernelClient", str]], clients: List["KernelClient"]
+    ) -> None:
+        with self._changes_lock:
+            changes, self._changes = self._changes, []
+        for action, client, done in changes:
+            for name, channel in client.channels().items():
+                if action == "add":
+                    poller.register(channel.socket, zmq.POLLIN)
+                    sockets[channel.socket] = (client, name)
+                elif sockets.pop(channel.socket, None) is not None:
+                    poller.unregister(channel.socket)
+            if action == "add":
+                clients.append(client)
+            elif client in clients:
+                clients.remove(client)
+                client.flush_pending()
+            done.set()
+
+    def _listen(self) -> None:
+        """
+        Attende su tutti i canali di tutti i kernel con un unico poller ZMQ e inoltra
+        subito qualunque messaggio sia pronto. Senza messaggi il thread resta
+        bloccato in `poll()` senza alcun risveglio periodico.
+        """
+        logger.debug("Kernel listener thread running.")
+        poller = zmq.Poller()
+        poller.register(self._wake_receiver, zmq.POLLIN)
+        sockets: Dict[Any, Tuple["KernelClient", str]] = {}
+        clients: List["KernelClient"] = []
+
+        while not self.stop_event.is_set():
+            self._apply_changes(poller, sockets, clients)
+            timeouts = [t for t in (c.flush_timeout() for c in clients) if t is not None]
+            try:
+                ready = poller.poll(min(timeouts) if timeouts else None)
+            except zmq.ZMQError as e:
+                logger.error("Kernel listener poll error: %s", e)
+                break
+
+            for socket, _ in ready:
+                if socket is self._wake_receiver:
+                    self._wake_receiver.recv()
+                    continue
+                entry = sockets.get(socket)
+                if entry is not None:
+                    entry[0].read_channel(entry[1])
+
+            for client in clients:
+                client.flush_due()
+
+        self._apply_changes(poller, sockets, clients)
+        for client in clients:
+            client.flush_pending()
+        self._wake_receiver.close(linger=0)
+
+    def send_to_lua(self, data: Dict[str, Any]) -> None:
+        # Sends a JSON-serialized message to the Lua parent process via stdout.
+        trace = data.get("trace")
+        if trace is not None:
+            trace["s"] = time.time()
+        try:
+            json_data = json.dumps(data, default=repr)
+            # Il listener e i thread del pool immagini possono scrivere in parallelo.
+            with self._stdout_lock:
+                sys.stdout.write(json_data + "\n")
+                sys.stdout.flush()
+        except Exception as e:
+            logger.error("Error sending data to Lua: %s (Data was: %.200s)", e, data)
+
+    def start_client(self, name: Optional[str], payload: Dict[str, Any]) -> None:
+        """
+        Avvia (con `kernel_cmd`) o collega il kernel `name` descritto da payload:
+        connection_file, kernel_cmd, image_width, image_renderer.
+        Eseguito in un thread a sé, perché l'attesa del kernel non blocchi gli altri.
+        """
+        connection_file = payload.get("connection_file")
+        kernel_process = None
+        try:
+            if not connection_file:
+                raise ValueError("connection file path not provided")
+            if payload.get("kernel_cmd"):
+                kernel_process = start_kernel_process(payload["kernel_cmd"], connection_file)
+                with self._clients_lock:
+                    self._launching[name] = kernel_process
+            KernelClient(
+                self,
+                connection_file,
+                int(payload.get("image_width", 120)),
+                payload.get("image_renderer", "none"),
+                kernel_process=kernel_process,
+                name=name,
+            )
+        except Exception as e:
+            logger.error("Cannot start kernel %s: %s", name, e)
+            with self._clients_lock:
+                self._starting.pop(name, None)
+                self._launching.pop(name, None)
+            stop_kernel_process(kernel_process, connection_file)
+            self.send_to_lua({"kernel": name, "type": "error", "message": f"Cannot start kernel: {e}"})
+            self.send_to_lua({"kernel": name, "type": "client_exited", "exit_code": 1})
+
+    def dispatch(self, command_data: Dict[str, Any]) -> None:
+        """Inoltra un comando da Lua al kernel indicato dal campo `kernel`."""
+        name = command_data.get("kernel")
+        if command_data.get("command") == "start":
+            with self._clients_lock:
+                if name in self.clients or name in self._starting:
+                    logger.warning("Kernel %s already started.", name)
+                    return
+                self._starting[name] = []
+            threading.Thread(
+                target=self.start_client, args=(name, command_data.get("payload") or {}), daemon=True
+            ).start()
+            return
+        with self._clients_lock:
+            if name in self._starting:
+                self._starting[name].append(command_data)
+                return
+            client = self.clients.get(name)
+        if client is None:
+            logger.warning("Command %s for unknown kernel %s.", command_data.get("command"), name)
+            self.send_to_lua(
+                {"kernel": name, "type": "error", "message": f"Python client: Unknown kernel '{name}'."}
+            )
+            return
+        client.process_command(command_data)
+
+    def run(self) -> None:
+        logger.info("Python bridge now running and listening for commands from Lua via stdin.")
+        try:
+            while True:
+                line = sys.stdin.readline()
+                if not line:
+                    logger.info("Stdin closed (EOF). Exiting run loop.")
+                    break
+                line = line.strip()
+                if not line:
+                    continue
+
+                logger.debug("Received from Lua (stdin): %.500s", line)
+                try:
+                    command_data = json.loads(line)
+                    self.dispatch(command_data)
+                except json.JSONDecodeError as e:
+                    logger.error("Failed to decode JSON from Lua: %s. Line: %s", e, line)
+                    self.send_to_lua(
+                        {
+                            "type": "error",
+                            "message": f"Python client: Invalid JSON from Lua: {line}",
+                        }
+                    )
+                except Exception as e:
+                    logger.error("Error processing line from Lua: %s. Line: %s", e, line)
+                    self.send_to_lua(
+                        {
+                            "type": "error",
+                            "message": f"Python client: Error processing command: {line}",
+                        }
+                    )
+        except KeyboardInterrupt:
+            logger.info("KeyboardInterrupt received, shutting down.")
+        finally:
+            self.stop()
+
+    def stop(self) -> None:
+        """Ferma tutti i client (e i kernel avviati da qui), poi il listener."""
+        with self._clients_lock:
+            clients = list(self.clients.values())
+            launching = list(self._launching.values())
+            self._launching.clear()
+        for process in launching:
+            process.kill()
+        for client in clients:
+            client.stop()
+        self.stop_event.set()
+        if self.listener_thread is not None and self.listener_thread.is_alive():
+            self._wake()
+            self.listener_thread.join(timeout=1)
+            logger.info("Kernel listener thread joined.")
+        with self._changes_lock:
+            if self._wake_sender is not None:
+                self._wake_sender.close(linger=0)
+        self.image_pool.shutdown(wait=False, cancel_futures=True)
 
 
 class KernelClient:
     def __init__(
         self,
+        bridge: Bridge,
         connection_file_path: str,
         image_width: int = 80,
         image_renderer: str = "sixel",
+        kernel_process: Optional[subprocess.Popen] = None,
+        name: Optional[str] = None,
     ) -> None:
-        log_message(
-            f"Initializing KernelClient with connection file: {connection_file_path}, image width: {image_width}, renderer: {image_renderer}"
+        """
+        Collega il kernel e lo registra nel bridge. In caso di errore ferma il kernel
+        avviato da qui (se c'è) e solleva l'eccezione.
+        """
+        logger.info(
+            "Initializing KernelClient %s with connection file: %s, image width: %s, renderer: %s",
+            name,
+            connection_file_path,
+            image_width,
+            image_renderer,
         )
+        self.bridge: Bridge = bridge
+        self.name: Optional[str] = name
         self.image_width: int = image_width
         self.image_renderer: str = image_renderer
+        self.spool_dir: Optional[str] = bridge.spool_dir
+        self.spool_threshold: int = bridge.spool_threshold
+        self.stream_window: float = bridge.stream_window
+        self.update_interval: float = bridge.update_interval
+        self.page_lines: int = bridge.page_lines
+        # Testo completo (diviso in righe) degli output paginati, per ID di pagina.
+        self._pages: "OrderedDict[int, List[str]]" = OrderedDict()
+        self._pages_lock: threading.Lock = threading.Lock()
+        self._page_counter: int = 0
+        self.mime_types: Optional[List[str]] = bridge.mime_types
+        # Rappresentazioni scartate dai bundle MIME, per ID: {mime: (dato, metadata)}.
+        # Protette anch'esse da _pages_lock.
+        self._dropped: "OrderedDict[int, Dict[str, Tuple[Any, Any]]]" = OrderedDict()
+        self._dropped_counter: int = 0
+        # Per mantenere l'ordine dell'output di ogni cella, i messaggi con lo stesso
+        # parent msg_id arrivati dopo un'immagine ancora in elaborazione nel pool del
+        # bridge restano in coda finché l'immagine non è pronta.
+        self._order_lock: threading.Lock = threading.Lock()
+        self._pending_output: Dict[Optional[str], Deque[OutputItem]] = {}
+        # Stream in accumulo (vedi Bridge.stream_window). Usato solo dal thread del listener.
+        self._pending_streams: Dict[Optional[str], Dict[str, Any]] = {}
+        # update_display_data in attesa, per display_id (vedi Bridge.update_interval), e
+        # istante dell'ultimo inoltro di ogni display_id. Usati solo dal thread del listener.
+        self._pending_updates: Dict[str, Dict[str, Any]] = {}
+        self._update_sent: Dict[str, float] = {}
+        self.updates_dropped: int = 0
+        # Il kernel avviato da questo processo (con --kernel-cmd) viene fermato da stop().
+        self.kernel_process: Optional[subprocess.Popen] = kernel_process
+        self.connection_file_path: str = connection_file_path
+        self.stop_event: threading.Event = threading.Event()
+        if kernel_process is not None and kernel_process.stderr is not None:
+            threading.Thread(
+                target=self._forward_kernel_stderr, args=(kernel_process.stderr,), daemon=True
+            ).start()
         try:
+            _import_jupyter()
             self.kc: jupyter_client.BlockingKernelClient = (
                 jupyter_client.BlockingKernelClient(
                     connection_file=connection_file_path
@@ -49,20 +572,15 @@ class KernelClient:
             )
             self.kc.load_connection_file()
             self.kc.start_channels()
-            log_message("IOPub and Shell channels started.")
+            logger.info("IOPub and Shell channels started.")
+            self._wait_for_kernel()
+            logger.info("Kernel ready.")
         except Exception as e:
-            log_message(f"Failed to start jupyter_client.KernelClient: {e}")
-            self.send_to_lua(
-                {"type": "error", "message": f"Failed to start KernelClient: {e}"}
-            )
-            sys.exit(1)
+            logger.error("Failed to start jupyter_client.KernelClient: %s", e)
+            self.stop_event.set()
+            self._shutdown_kernel()
+            raise
 
-        self.stop_event: threading.Event = threading.Event()
-        self.kernel_listener_thread: threading.Thread = threading.Thread(
-            target=self._listen_kernel, daemon=True
-        )
-        self.kernel_listener_thread.start()
-        log_message("Kernel listener thread started.")
         self.send_to_lua(
             {
                 "type": "status",
@@ -70,55 +588,459 @@ class KernelClient:
                 "kernel_info": self.kc.get_connection_info(),
             }
         )
+        bridge.add_client(self)
 
-    def _listen_kernel(self) -> None:
-        log_message("Kernel listener thread running.")
-        while not self.stop_event.is_set():
+    def _wait_for_kernel(self) -> None:
+        """
+        Attende che il kernel risponda a kernel_info sul canale shell e che la
+        sottoscrizione IOPub sia attiva (arriva un messaggio IOPub: iopub_welcome o
+        lo status di una richiesta). Diversamente da BlockingKernelClient.wait_for_ready
+        non ha attese fisse, e fallisce subito se il kernel avviato da qui termina.
+        """
+        deadline = time.monotonic() + KERNEL_READY_TIMEOUT
+        shell_ready = iopub_ready = False
+        next_request = 0.0
+        while not (shell_ready and iopub_ready):
+            now = time.monotonic()
+            if self.kernel_process is not None and self.kernel_process.poll() is not None:
+                raise RuntimeError(f"Kernel exited with code {self.kernel_process.returncode}")
+            if now > deadline:
+                raise RuntimeError(f"Kernel didn't respond in {KERNEL_READY_TIMEOUT:.0f} seconds")
+            if now >= next_request:
+                # Ogni kernel_info produce anche degli status su IOPub.
+                self.kc.kernel_info()
+                next_request = now + 0.5
             try:
-                # Block on iopub for a while, then check shell.
-                try:
-                    msg = self.kc.get_iopub_msg(timeout=0.1)
-                    msg_type = msg.get("header", {}).get("msg_type", "unknown")
-                    log_message(f"IOPub received: {msg_type}")
-
-                    if msg_type in ("display_data", "execute_result"):
-                        data = msg.get("content", {}).get("data", {})
-                        if (
-                            "image/png" in data
-                            or "image/jpeg" in data
-                            or "image/gif" in data
-                        ):
-                            if self.handle_image_output(data):
-                                continue  # Immagine gestita, salta l'invio del messaggio originale
-
-                    self.send_to_lua({"type": "iopub", "message": msg})
-                except Empty:
-                    pass  # No message on iopub, that's fine.
-
-                # Check shell channel without blocking
-                try:
-                    msg = self.kc.get_shell_msg(timeout=0)
-                    msg_type = msg.get("header", {}).get("msg_type", "unknown")
-                    log_message(f"Shell received: {msg_type}")
-                    self.send_to_lua({"type": "shell", "message": msg})
-                except Empty:
-                    pass  # No message on shell
+                if self.kc.get_shell_msg(timeout=0.02)["msg_type"] == "kernel_info_reply":
+                    shell_ready = True
+            except Empty:
+                pass
+            try:
+                self.kc.get_iopub_msg(timeout=0.02)
+                iopub_ready = True
+            except Empty:
+                pass
 
-            except Exception as e:
-                log_message(f"Kernel Listener thread error: {e}")
+    def _forward_kernel_stderr(self, stream: Any) -> None:
+        for raw in stream:
+            line = raw.decode("utf-8", errors="replace").rstrip("\n")
+            if line:
+                self.send_to_lua({"type": "kernel_stderr", "message": line})
+        # Fine dello stderr: il kernel è terminato (da solo, se non lo stiamo fermando noi).
+        process = self.kernel_process
+        if process is not None and not self.stop_event.is_set():
+            exit_code = process.wait()
+            logger.warning("Kernel exited with code %s.", exit_code)
+            self.send_to_lua({"type": "kernel_exited", "exit_code": exit_code})
 
-    def send_to_lua(self, data: Dict[str, Any]) -> None:
-        # Sends a JSON-serialized message to the Lua parent process via stdout.
+    def _shutdown_kernel(self) -> None:
+        """Ferma il kernel avviato da questo processo (se ce n'è uno)."""
+        process, self.kernel_process = self.kernel_process, None
+        if process is None:
+            return
+        if process.poll() is None:
+            try:
+                self.kc.shutdown()
+                process.wait(timeout=1)
+            except Exception:
+                process.kill()
+                process.wait()
+            logger.info("Kernel shut down (exit code %s).", process.returncode)
         try:
-            json_data = json.dumps(data, default=repr)
-            sys.stdout.write(json_data + "\n")
-            sys.stdout.flush()
+            os.remove(self.connection_file_path)
+        except OSError:
+            pass
+
+    def channels(self) -> Dict[str, Any]:
+        """I canali del kernel ascoltati dal listener del bridge, per nome."""
+        return {
+            "iopub": self.kc.iopub_channel,
+            "shell": self.kc.shell_channel,
+            "control": self.kc.control_channel,
+            "stdin": self.kc.stdin_channel,
+        }
+
+    def read_channel(self, name: str) -> None:
+        """Legge e inoltra un messaggio pronto sul canale `name` (dal thread del listener)."""
+        try:
+            msg = self.channels()[name].get_msg(timeout=0)
+        except Empty:
+            return
+        except Exception as e:
+            logger.error("Kernel Listener thread error on %s: %s", name, e)
+            return
+        try:
+            self._dispatch_kernel_msg(name, msg)
         except Exception as e:
-            log_message(f"Error sending data to Lua: {e} (Data was: {str(data)[:200]})")
+            logger.error("Kernel Listener thread error: %s", e)
+
+    @staticmethod
+    def _trace_stamp(msg: Dict[str, Any]) -> Dict[str, float]:
+        """
+        Timestamp (secondi dall'epoca) per le statistiche di latenza in Lua:
+        `k` creazione nel kernel, `r` ricezione qui; `s` viene aggiunto da send_to_lua.
+        """
+        trace = {"r": time.time()}
+        date = msg.get("header", {}).get("date")
+        if hasattr(date, "timestamp"):
+            trace["k"] = date.timestamp()
+        return trace
+
+    def _dispatch_kernel_msg(self, channel: str, msg: Dict[str, Any]) -> None:
+        trace = self._trace_stamp(msg)
+        msg_type = msg.get("header", {}).get("msg_type", "unknown")
+        logger.debug("%s received: %s", channel, msg_type)
+        parent_id = msg.get("parent_header", {}).get("msg_id")
+
+        if self.stream_window > 0:
+            if channel == "iopub" and msg_type == "stream":
+                self._buffer_stream(parent_id, msg, trace)
+                return
+            # Qualunque altro messaggio (status idle, errori, display_data...) della
+            # stessa richiesta deve arrivare dopo lo stream accumulato finora.
+            self._flush_stream(parent_id)
+
+        if self.update_interval > 0:
+            if channel == "iopub" and msg_type == "update_display_data":
+                if self._hold_update(parent_id, msg, trace):
+                    return
+            elif channel == "shell" or msg_type in UPDATE_BARRIER_MSG_TYPES:
+                self._flush_updates(parent_id)
+
+        self._forward_kernel_msg(channel, msg_type, parent_id, msg, trace)
+
+    def _forward_kernel_msg(
+        self,
+        channel: str,
+        msg_type: str,
+        parent_id: Optional[str],
+        msg: Dict[str, Any],
+        trace: Dict[str, float],
+    ) -> None:
+        item: OutputItem = {"type": channel, "message": msg, "trace": trace}
+        if channel == "iopub" and msg_type in DISPLAY_MSG_TYPES:
+            self._prune_mime(item)
+            self._paginate(item)
+            data = msg.get("content", {}).get("data", {})
+            if "image/png" in data or "image/jpeg" in data or "image/gif" in data:
+                original = item
+                item = self.handle_image_output(data, item)
+                if item is not original and "dropped" in original:
+                    # I messaggi delle immagini non riportano le rappresentazioni scartate.
+                    with self._pages_lock:
+                        self._dropped.pop(original["dropped"]["id"], None)
+
+        if not isinstance(item, Future):
+            item.setdefault("trace", trace)
+            item = self._spool_payloads(item)
+        self._deliver_output(parent_id, item)
+
+    def _prune_mime(self, item: Dict[str, Any]) -> None:
+        """
+        Lascia nel bundle MIME del messaggio solo le rappresentazioni in mime_types (delle
+        immagini, solo la preferita) e conserva le altre: `item["dropped"]` le elenca
+        per Lua, che può chiederle con `fetch_mime`.
+        """
+        if not self.mime_types:
+            return
+        content = item["message"].get("content", {})
+        data = content.get("data")
+        if not isinstance(data, dict):
+            return
+        image_kept = False
+        dropped: Dict[str, Tuple[Any, Any]] = {}
+        metadata = content.get("metadata")
+        if not isinstance(metadata, dict):
+            metadata = {}
+        kept = set()
+        for mime in self.mime_types:
+            if mime not in data:
+                continue
+            if mime.startswith("image/"):
+                if image_kept:
+                    continue
+                image_kept = True
+            kept.add(mime)
+        for mime in [m for m in data if m not in kept]:
+            dropped[mime] = (data.pop(mime), metadata.pop(mime, None))
+        if not dropped:
+            return
+        with self._pages_lock:
+            self._dropped_counter += 1
+            bundle_id = self._dropped_counter
+            self._dropped[bundle_id] = dropped
+            while len(self._dropped) > DROPPED_BUNDLES_KEPT:
+                self._dropped.popitem(last=False)
+        item["dropped"] = {"id": bundle_id, "mime_types": list(dropped)}
+
+    def send_mime(self, request: Dict[str, Any]) -> None:
+        """
+        Invia a Lua una rappresentazione scartata da _prune_mime. `request` viene
+        riportato nella risposta.
+        """
+        bundle_id = request.get("id")
+        mime = request.get("mime_type")
+        with self._pages_lock:
+            bundle = self._dropped.get(bundle_id)
+            if bundle is not None:
+                self._dropped.move_to_end(bundle_id)
+        reply: Dict[str, Any] = {
+            "type": "mime",
+            "id": bundle_id,
+            "mime_type": mime,
+            "request": request.get("request"),
+        }
+        if bundle is None:
+            reply["error"] = f"Output {bundle_id} is no longer available."
+        elif mime not in bundle:
+            reply["error"] = f"Output {bundle_id} has no {mime} representation."
+        else:
+            reply["data"], reply["metadata"] = bundle[mime]
+        self.send_to_lua(reply)
+
+    def _paginate(self, item: Dict[str, Any]) -> None:
+        """
+        Se il text/plain del messaggio supera page_lines righe, lo conserva e lascia nel
+        messaggio solo la prima pagina; `item["page"]` indica a Lua quante righe mancano.
+        """
+        if self.page_lines <= 0:
+            return
+        data = item["message"].get("content", {}).get("data")
+        text = data.get("text/plain") if isinstance(data, dict) else None
+        if not isinstance(text, str):
+            return
+        lines = text.split("\n")
+        if len(lines) <= self.page_lines:
+            return
+        with self._pages_lock:
+            self._page_counter += 1
+            page_id = self._page_counter
+            self._pages[page_id] = lines
+            while len(self._pages) > PAGED_OUTPUTS_KEPT:
+                self._pages.popitem(last=False)
+        data["text/plain"] = "\n".join(lines[: self.page_lines])
+        item["page"] = {"id": page_id, "next": self.page_lines, "total": len(lines)}
+
+    def send_page(self, request: Dict[str, Any]) -> None:
+        """
+        Invia a Lua le righe [start, start + count) di un output paginato (tutte le
+        rimanenti se count manca). `request` viene riportato nella risposta.
+        """
+        page_id = request.get("id")
+        with self._pages_lock:
+            lines = self._pages.get(page_id)
+            if lines is not None:
+                self._pages.move_to_end(page_id)
+        reply: Dict[str, Any] = {"type": "page", "id": page_id, "request": request.get("request")}
+        if lines is None:
+            reply["error"] = f"Page {page_id} is no longer available."
+        else:
+            start = max(int(request.get("start", 0)), 0)
+            count = request.get("count")
+            end = len(lines) if not count else min(start + int(count), len(lines))
+            reply.update(start=start, next=end, total=len(lines), lines=lines[start:end])
+        self.send_to_lua(reply)
 
-    def _render_to_sixel(self, img: "Image.Image", target_width: int) -> Optional[str]:
+    def _buffer_stream(
+        self, parent_id: Optional[str], msg: Dict[str, Any], trace: Dict[str, float]
+    ) -> None:
+        content = msg.get("content", {})
+        name = content.get("name", "stdout")
+        pending = self._pending_streams.get(parent_id)
+        if pending is not None and pending["name"] != name:
+            self._flush_stream(parent_id)
+            pending = None
+        if pending is None:
+            self._pending_streams[parent_id] = {
+                "name": name,
+                "message": msg,
+                "parts": [content.get("text", "")],
+                "trace": trace,
+                "deadline": time.monotonic() + self.stream_window,
+            }
+        else:
+            pending["parts"].append(content.get("text", ""))
+
+    def _flush_stream(self, parent_id: Optional[str]) -> None:
+        """Inoltra lo stream accumulato per parent_id come un unico messaggio."""
+        pending = self._pending_streams.pop(parent_id, None)
+        if pending is None:
+            return
+        msg = pending["message"]
+        msg["content"]["text"] = _collapse_carriage_returns("".join(pending["parts"]))
+        self._deliver_output(
+            parent_id, {"type": "iopub", "message": msg, "trace": pending["trace"]}
+        )
+
+    def _hold_update(
+        self, parent_id: Optional[str], msg: Dict[str, Any], trace: Dict[str, float]
+    ) -> bool:
+        """
+        Trattiene un update_display_data arrivato meno di update_interval secondi dopo
+        l'ultimo inoltrato per lo stesso display_id. Resta in attesa solo il più recente:
+        quello che sostituisce viene scartato prima di qualunque elaborazione.
+        Restituisce False se il messaggio va inoltrato subito.
+        """
+        transient = msg.get("content", {}).get("transient")
+        display_id = transient.get("display_id") if isinstance(transient, dict) else None
+        if not display_id:
+            return False
+        pending = self._pending_updates.get(display_id)
+        if pending is not None:
+            pending.update(parent_id=parent_id, message=msg, trace=trace)
+            self.updates_dropped += 1
+            logger.debug("Dropped superseded update of display %s", display_id)
+            return True
+        now = time.monotonic()
+        last_sent = self._update_sent.get(display_id)
+        if last_sent is None or now - last_sent >= self.update_interval:
+            self._update_sent[display_id] = now
+            return False
+        self._pending_updates[display_id] = {
+            "parent_id": parent_id,
+            "message": msg,
+            "trace": trace,
+            "deadline": last_sent + self.update_interval,
+        }
+        return True
+
+    def _flush_update(self, display_id: str) -> None:
+        """Inoltra l'update_display_data in attesa per display_id."""
+        pending = self._pending_updates.pop(display_id, None)
+        if pending is None:
+            return
+        self._update_sent[display_id] = time.monotonic()
+        self._forward_kernel_msg(
+            "iopub",
+            "update_display_data",
+            pending["parent_id"],
+            pending["message"],
+            pending["trace"],
+        )
+
+    def _flush_updates(self, parent_id: Optional[str]) -> None:
+        for display_id, pending in list(self._pending_updates.items()):
+            if pending["parent_id"] == parent_id:
+                self._flush_update(display_id)
+
+    def flush_streams(self) -> None:
+        for parent_id in list(self._pending_streams):
+            self._flush_stream(parent_id)
+
+    def flush_pending(self) -> None:
+        """Inoltra subito tutti gli stream e gli update_display_data in attesa."""
+        self.flush_streams()
+        for display_id in list(self._pending_updates):
+            self._flush_update(display_id)
+
+    def flush_due(self) -> None:
+        now = time.monotonic()
+        for parent_id, pending in list(self._pending_streams.items()):
+            if pending["deadline"] <= now:
+                self._flush_stream(parent_id)
+        for display_id, pending in list(self._pending_updates.items()):
+            if pending["deadline"] <= now:
+                self._flush_update(display_id)
+        if len(self._update_sent) > len(self._pending_updates) + 64:
+            # Dimentica i display non aggiornati di recente, che non vanno più limitati.
+            for display_id, sent in list(self._update_sent.items()):
+                if now - sent >= self.update_interval and display_id not in self._pending_updates:
+                    del self._update_sent[display_id]
+
+    def flush_timeout(self) -> Optional[int]:
+        """
+        Timeout (ms) per il poll: fino alla prossima scadenza di uno stream o di un
+        update_display_data in attesa.
+        """
+        deadlines = [p["deadline"] for p in self._pending_streams.values()]
+        deadlines.extend(p["deadline"] for p in self._pending_updates.values())
+        if not deadlines:
+            return None
+        return max(0, int((min(deadlines) - time.monotonic()) * 1000) + 1)
+
+    def _deliver_output(self, parent_id: Optional[str], item: OutputItem) -> None:
+        """
+        Invia un messaggio a Lua rispettando l'ordine per parent msg_id: se per
+        quella richiesta c'è già un'immagine in elaborazione, il messaggio viene
+        accodato e inviato quando tutto ciò che lo precede è pronto.
+        """
+        with self._order_lock:
+            queue = self._pending_output.get(parent_id)
+            if queue is None:
+                if not isinstance(item, Future):
+                    self.send_to_lua(item)
+                    return
+                queue = self._pending_output[parent_id] = deque()
+            queue.append(item)
+
+        if isinstance(item, Future):
+            item.add_done_callback(lambda _f: self._drain_output(parent_id))
+
+    def _drain_output(self, parent_id: Optional[str]) -> None:
+        """Invia i messaggi in testa alla coda di parent_id finché sono pronti."""
+        with self._order_lock:
+            queue = self._pending_output.get(parent_id)
+            while queue:
+                head = queue[0]
+                if isinstance(head, Future):
+                    if not head.done():
+                        return
+                    queue.popleft()
+                    try:
+                        self.send_to_lua(head.result())
+                    except Exception as e:
+                        logger.error("Image processing task failed: %s", e)
+                else:
+                    queue.popleft()
+                    self.send_to_lua(head)
+            self._pending_output.pop(parent_id, None)
+
+    def _spool_payloads(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """Sostituisce i payload di immagini troppo grandi con riferimenti allo spool."""
+        if not self.spool_dir:
+            return item
+        if item.get("type") in ("image_iip", "image_sixel"):
+            item["payload"] = self._spool_value(item.get("payload"))
+            return item
+        message = item.get("message")
+        if isinstance(message, dict):
+            data = message.get("content", {}).get("data")
+            if isinstance(data, dict):
+                for mime, value in data.items():
+                    if mime.startswith("image/"):
+                        data[mime] = self._spool_value(value)
+        return item
+
+    def _spool_value(self, value: Any) -> Any:
+        """
+        Scrive un payload base64 nello spool (indirizzato per contenuto, quindi una
+        sola volta per immagine) e restituisce `{"$ref": path, "length": n, "sha1": h}`.
+        """
+        if not isinstance(value, str) or len(value) < self.spool_threshold:
+            return value
+        try:
+            encoded = value.replace("\n", "").replace("\r", "").encode("ascii")
+            digest = hashlib.sha1(encoded).hexdigest()
+            path = os.path.join(self.spool_dir, digest + ".b64")
+            if not os.path.exists(path):
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(encoded)
+                os.replace(tmp_path, path)
+            return {"$ref": path, "length": len(encoded), "sha1": digest}
+        except (OSError, UnicodeEncodeError) as e:
+            logger.error("Error writing payload to spool: %s", e)
+            return value
+
+    def send_to_lua(self, data: Dict[str, Any]) -> None:
+        if self.name is not None:
+            data["kernel"] = self.name
+        self.bridge.send_to_lua(data)
+
+    def _render_to_sixel(self, img: Any, target_width: int) -> Optional[str]:
+        SixelWriter = _sixel_writer()
         if not SixelWriter:
-            log_message("libsixel-python not installed. Cannot use Sixel renderer.")
+            logger.warning("libsixel-python not installed. Cannot use Sixel renderer.")
             return None
 
         w, h = img.size
@@ -128,54 +1050,102 @@ class KernelClient:
         if new_h == 0:
             return None
 
-        resized_img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
+        resized_img = img.resize((new_w, new_h), _pil_image().Resampling.LANCZOS)
 
         d = io.BytesIO()
         writer = SixelWriter(d)
         writer.draw(resized_img)
         return d.getvalue().decode("ascii")
 
-    def handle_image_output(self, data: Dict[str, str]) -> bool:
-        target_width = self.image_width
-        if not Image:
-            log_message("Pillow library not installed.")
-            return False
-
+    def handle_image_output(
+        self, data: Dict[str, str], original: Dict[str, Any]
+    ) -> OutputItem:
+        """
+        Restituisce il messaggio da inviare a Lua per un output con immagine.
+        Per il renderer Sixel il lavoro con Pillow viene affidato al pool e viene
+        restituito un Future; per iip basta ripulire il base64, senza decodificarlo.
+        """
         b64_data = (
             data.get("image/png") or data.get("image/jpeg") or data.get("image/gif")
         )
         if not b64_data:
-            return False
+            return original
+
+        parent_id = original["message"].get("parent_header", {}).get("msg_id")
+        if self.image_renderer == "sixel":
+            if not _pil_image():
+                logger.warning("Pillow library not installed.")
+                return original
+            return self.bridge.image_pool.submit(
+                self._render_image_message, b64_data, original, parent_id
+            )
+
+        return self._iip_image_message(b64_data, original, parent_id)
+
+    @staticmethod
+    def _image_message(
+        kind: str, payload: str, original: Dict[str, Any], parent_id: Optional[str]
+    ) -> Dict[str, Any]:
+        """
+        Messaggio per Lua con un'immagine convertita. Riporta il tipo del messaggio
+        originale e il suo display_id, così un update_display_data sostituisce l'immagine
+        mostrata con lo stesso display_id invece di aggiungerne un'altra.
+        """
+        message = original["message"]
+        transient = message.get("content", {}).get("transient")
+        display_id = transient.get("display_id") if isinstance(transient, dict) else None
+        result = {
+            "type": kind,
+            "payload": payload,
+            "parent_msg_id": parent_id,
+            "msg_type": message.get("header", {}).get("msg_type"),
+        }
+        if display_id:
+            result["display_id"] = display_id
+        return result
+
+    def _iip_image_message(
+        self, b64_data: str, original: Dict[str, Any], parent_id: Optional[str]
+    ) -> Dict[str, Any]:
+        # For iTerm2, we just send the original base64 data.
+        # Rimuoviamo newline e ritorni a capo per evitare di rompere il JSON-per-linea
+        sanitized_b64 = b64_data.replace("\n", "").replace("\r", "")
+        return self._image_message("image_iip", sanitized_b64, original, parent_id)
 
+    def _render_image_message(
+        self, b64_data: str, original: Dict[str, Any], parent_id: Optional[str]
+    ) -> Dict[str, Any]:
+        # Eseguito in un thread del pool immagini.
+        message = self._convert_image(b64_data, original, parent_id)
+        message.setdefault("trace", original.get("trace"))
+        return self._spool_payloads(message)
+
+    def _convert_image(
+        self, b64_data: str, original: Dict[str, Any], parent_id: Optional[str]
+    ) -> Dict[str, Any]:
         try:
             image_data = base64.b64decode(b64_data)
-            img = Image.open(io.BytesIO(image_data)).convert("RGB")
-
-            if self.image_renderer == "sixel":
-                output_str = self._render_to_sixel(img, target_width)
-                if output_str:
-                    self.send_to_lua({"type": "image_sixel", "payload": output_str})
-                    return True
-
-            # Fallback to iTerm2 if Sixel fails or is not the chosen renderer.
-            # For iTerm2, we just send the original base64 data.
-            # Rimuoviamo newline e ritorni a capo per evitare di rompere il JSON-per-linea
-            sanitized_b64 = b64_data.replace("\n", "").replace("\r", "")
-            self.send_to_lua({"type": "image_iip", "payload": sanitized_b64})
-            return True
+            img = _pil_image().open(io.BytesIO(image_data)).convert("RGB")
+
+            output_str = self._render_to_sixel(img, self.image_width)
+            if output_str:
+                return self._image_message("image_sixel", output_str, original, parent_id)
+
+            # Fallback to iTerm2 if Sixel fails.
+            return self._iip_image_message(b64_data, original, parent_id)
 
         except Exception as e:
-            log_message(f"Error processing image with Pillow: {e}")
+            logger.error("Error processing image with Pillow: %s", e)
 
-        return False
+        return original
 
     def send_execute_request(self, jupyter_msg_payload: Dict[str, Any]) -> None:
-        log_message("Preparing to send execute_request.")
+        logger.debug("Preparing to send execute_request.")
         try:
             content = jupyter_msg_payload.get("content", {})
             code = content.get("code")
             if not code:
-                log_message("Error: execute_request content is missing or malformed.")
+                logger.error("execute_request content is missing or malformed.")
                 self.send_to_lua(
                     {
                         "type": "error",
@@ -184,19 +1154,31 @@ class KernelClient:
                 )
                 return
 
-            self.kc.execute(
-                code=code,
-                silent=content.get("silent", False),
-                store_history=content.get("store_history", True),
-                user_expressions=content.get("user_expressions", {}),
-                allow_stdin=content.get("allow_stdin", False),
-                stop_on_error=content.get("stop_on_error", True),
+            msg = self.kc.session.msg(
+                "execute_request",
+                {
+                    "code": code,
+                    "silent": content.get("silent", False),
+                    "store_history": content.get("store_history", True),
+                    "user_expressions": content.get("user_expressions") or {},
+                    "allow_stdin": content.get("allow_stdin", False),
+                    "stop_on_error": content.get("stop_on_error", True),
+                },
             )
-            log_message(
-                f"Execute request for code '{code[:50]}...' sent via KernelClient."
+            # Usiamo il msg_id scelto da Lua, così gli output (che lo riportano in
+            # parent_header.msg_id) possono essere instradati alla cella giusta.
+            msg_id = jupyter_msg_payload.get("header", {}).get("msg_id")
+            if msg_id:
+                msg["header"]["msg_id"] = msg_id
+                msg["msg_id"] = msg_id
+            self.kc.shell_channel.send(msg)
+            logger.debug(
+                "Execute request %s for code '%.50s...' sent via KernelClient.",
+                msg["header"]["msg_id"],
+                code,
             )
         except Exception as e:
-            log_message(f"Error sending execute_request: {e}")
+            logger.error("Error sending execute_request: %s", e)
             self.send_to_lua(
                 {
                     "type": "error",
@@ -208,8 +1190,10 @@ class KernelClient:
         self, content: Dict[str, Any], high_detail: bool = False
     ) -> None:
         """Sends an inspect_request to the kernel."""
-        log_message(
-            f"Sending inspect_request for code: '{content.get('code')}' at pos {content.get('cursor_pos')}"
+        logger.debug(
+            "Sending inspect_request for code: '%s' at pos %s",
+            content.get("code"),
+            content.get("cursor_pos"),
         )
         try:
             self.kc.inspect(
@@ -218,7 +1202,7 @@ class KernelClient:
                 detail_level=int(high_detail),
             )
         except Exception as e:
-            log_message(f"Error sending inspect_request: {e}")
+            logger.error("Error sending inspect_request: %s", e)
             self.send_to_lua(
                 {"type": "error", "message": f"Error sending inspect_request: {e}"}
             )
@@ -227,38 +1211,38 @@ class KernelClient:
 
     def send_interrupt_request(self) -> None:
         """Sends an interrupt_request to the kernel via the control channel."""
-        log_message("Sending interrupt_request to kernel.")
+        logger.info("Sending interrupt_request to kernel.")
         try:
             # CORREZIONE: Invia un messaggio grezzo invece di chiamare un metodo di alto livello.
             # Questo è più stabile tra le versioni di jupyter-client.
             msg = self.kc.session.msg("interrupt_request", content={})
             self.kc.control_channel.send(msg)
-            log_message("Interrupt request sent successfully.")
+            logger.info("Interrupt request sent successfully.")
         except Exception as e:
-            log_message(f"Error sending interrupt_request: {e}")
+            logger.error("Error sending interrupt_request: %s", e)
             self.send_to_lua(
                 {"type": "error", "message": f"Error sending interrupt_request: {e}"}
             )
 
     def send_restart_request(self) -> None:
         """Sends a shutdown_request with restart=True to the kernel."""
-        log_message("Requesting kernel restart.")
+        logger.info("Requesting kernel restart.")
         try:
             # CORREZIONE: Invia un messaggio grezzo 'shutdown_request' con restart=True.
             self.kc.shutdown(restart=True)
-            log_message("Restart request sent successfully.")
+            logger.info("Restart request sent successfully.")
             # Notifica a Lua che la richiesta è stata inviata. Il listener del kernel
             # si occuperà di rilevare il nuovo stato 'idle' quando il riavvio sarà completato.
             self.send_to_lua({"type": "status", "message": "kernel_restarted"})
         except Exception as e:
-            log_message(f"Error on kernel restart: {e}")
+            logger.error("Error on kernel restart: %s", e)
             self.send_to_lua(
                 {"type": "error", "message": f"Error on kernel restart: {e}"}
             )
 
     def send_history_request(self, content: Dict[str, Any]) -> None:
         """Sends a history_request to the kernel."""
-        log_message("Sending history_request.")
+        logger.debug("Sending history_request.")
         try:
             self.kc.history(
                 hist_access_type=content.get("hist_access_type", "range"),
@@ -266,7 +1250,7 @@ class KernelClient:
                 output=content.get("output", False),
             )
         except Exception as e:
-            log_message(f"Error sending history_request: {e}")
+            logger.error("Error sending history_request: %s", e)
             self.send_to_lua(
                 {"type": "error", "message": f"Error sending history_request: {e}"}
             )
@@ -274,13 +1258,13 @@ class KernelClient:
     def process_command(self, command_data: Dict[str, Any]) -> None:
         command = command_data.get("command")
         payload = command_data.get("payload")
-        log_message(f"Processing command from Lua: {command}")
+        logger.debug("Processing command from Lua: %s", command)
 
         if command == "execute":
             if payload:
                 self.send_execute_request(payload)
             else:
-                log_message("Execute command received without payload.")
+                logger.warning("Execute command received without payload.")
                 self.send_to_lua(
                     {
                         "type": "error",
@@ -292,7 +1276,7 @@ class KernelClient:
             if payload:
                 self.send_inspect_request(payload)
             else:
-                log_message("Inspect command received without payload.")
+                logger.warning("Inspect command received without payload.")
                 self.send_to_lua(
                     {
                         "type": "error",
@@ -309,11 +1293,17 @@ class KernelClient:
         elif command == "history":
             self.send_history_request(payload if payload else {})
 
+        elif command == "fetch_page":
+            self.send_page(payload if payload else {})
+
+        elif command == "fetch_mime":
+            self.send_mime(payload if payload else {})
+
         elif command == "shutdown":
-            log_message("Shutdown command received. Stopping client.")
+            logger.info("Shutdown command received. Stopping client.")
             self.stop()
         else:
-            log_message(f"Unknown command: {command}")
+            logger.warning("Unknown command: %s", command)
             self.send_to_lua(
                 {
                     "type": "error",
@@ -321,62 +1311,101 @@ class KernelClient:
                 }
             )
 
-    def run(self) -> None:
-        log_message(
-            "Python KernelClient now running and listening for commands from Lua via stdin."
-        )
-        try:
-            while True:
-                line = sys.stdin.readline()
-                if not line:
-                    log_message("Stdin closed (EOF). Exiting run loop.")
-                    break
-                line = line.strip()
-                if not line:
-                    continue
-
-                log_message(f"Received from Lua (stdin): {line[:500]}")
-                try:
-                    command_data = json.loads(line)
-                    self.process_command(command_data)
-                except json.JSONDecodeError as e:
-                    log_message(f"Failed to decode JSON from Lua: {e}. Line: {line}")
-                    self.send_to_lua(
-                        {
-                            "type": "error",
-                            "message": f"Python client: Invalid JSON from Lua: {line}",
-                        }
-                    )
-                except Exception as e:
-                    log_message(f"Error processing line from Lua: {e}. Line: {line}")
-                    self.send_to_lua(
-                        {
-                            "type": "error",
-                            "message": f"Python client: Error processing command: {line}",
-                        }
-                    )
-        except KeyboardInterrupt:
-            log_message("KeyboardInterrupt received, shutting down.")
-        finally:
-            self.stop()
-
     def stop(self) -> None:
-        log_message("Stopping KernelClient...")
+        if self.bridge.clients.get(self.name) is not self:
+            return
+        logger.info("Stopping KernelClient %s...", self.name)
         self.stop_event.set()
-        if self.kernel_listener_thread and self.kernel_listener_thread.is_alive():
-            self.kernel_listener_thread.join(timeout=1)
-            log_message("Kernel listener thread joined.")
-
+        self.bridge.remove_client(self)
+        self._shutdown_kernel()
         if self.kc.is_alive():
             self.kc.stop_channels()
-            log_message("Jupyter channels stopped.")
-        log_message("KernelClient stopped.")
+            logger.info("Jupyter channels stopped.")
+        logger.info("KernelClient stopped.")
         self.send_to_lua({"type": "status", "message": "disconnected"})
+        if self.name is not None:
+            self.send_to_lua({"type": "client_exited", "exit_code": 0})
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        log_message("Error: Connection file path not provided.")
+    parser = argparse.ArgumentParser(description="Jove bridge between Neovim and a Jupyter kernel.")
+    parser.add_argument("connection_file", nargs="?")
+    parser.add_argument("image_width", nargs="?", type=int, default=120)
+    parser.add_argument("image_renderer", nargs="?", default="sixel")
+    parser.add_argument(
+        "--spool-dir", default=None, help="Directory for out-of-band image payloads."
+    )
+    parser.add_argument(
+        "--spool-threshold",
+        type=int,
+        default=0,
+        help="Payloads of at least this many bytes go to the spool directory (0 disables).",
+    )
+    parser.add_argument(
+        "--stream-window-ms",
+        type=int,
+        default=16,
+        help="Coalesce consecutive stream messages within this window (0 disables).",
+    )
+    parser.add_argument(
+        "--page-lines",
+        type=int,
+        default=0,
+        help="Forward only the first page of text/plain outputs longer than this many "
+        "lines; the rest is sent on 'fetch_page' requests (0 disables).",
+    )
+    parser.add_argument(
+        "--mime-types",
+        default="",
+        help="Comma-separated MIME types to forward, in order of preference (only the "
+        "first image type found is kept); the others are sent on 'fetch_mime' requests. "
+        "Empty forwards every representation.",
+    )
+    parser.add_argument(
+        "--display-update-max-fps",
+        type=int,
+        default=0,
+        help="Forward update_display_data for the same display_id at most this many times "
+        "per second, keeping only the newest pending one (0 disables).",
+    )
+    parser.add_argument(
+        "--kernel-cmd",
+        default=None,
+        help="Start the kernel with this command ({connection_file} is substituted), "
+        "writing connection_file first, instead of connecting to a running kernel.",
+    )
+    parser.add_argument(
+        "--multiplex",
+        action="store_true",
+        help="Serve any number of kernels, started with 'start' commands; every message "
+        "carries the kernel ID chosen by Lua in its 'kernel' field.",
+    )
+    parser.add_argument(
+        "--log-level",
+        default="INFO",
+        help="Minimum level written to the log file (DEBUG, INFO, WARNING, ERROR).",
+    )
+    args = parser.parse_args()
+    setup_logging(args.log_level)
+    # jobstop() di Neovim invia SIGTERM: usciamo passando da stop(), che ferma anche il kernel.
+    signal.signal(signal.SIGTERM, lambda _signum, _frame: sys.exit(0))
+
+    bridge = Bridge(
+        spool_dir=args.spool_dir,
+        spool_threshold=args.spool_threshold,
+        stream_window_ms=args.stream_window_ms,
+        page_lines=args.page_lines,
+        mime_types=[m.strip() for m in args.mime_types.split(",") if m.strip()],
+        display_update_max_fps=args.display_update_max_fps,
+    )
+    if args.multiplex:
+        logger.info("Python bridge starting in multiplex mode.")
+        bridge.run()
+        logger.info("Python bridge finished.")
+        sys.exit(0)
+
+    if not args.connection_file:
+        logger.error("Connection file path not provided.")
         print(
             json.dumps(
                 {
@@ -388,18 +1417,23 @@ if __name__ == "__main__":
         )
         sys.exit(1)
 
-    connection_file = sys.argv[1]
-    image_width = int(sys.argv[2]) if len(sys.argv) > 2 else 120
-    image_renderer = sys.argv[3] if len(sys.argv) > 3 else "sixel"
+    connection_file = args.connection_file
+    logger.info("Python client starting with connection file: %s", connection_file)
+    kernel_process = None
     try:
-        with open(LOG_FILE_PATH, "w") as f:
-            f.write(
-                f"{time.strftime('%Y-%m-%d %H:%M:%S')} - Python client starting with connection file: {connection_file}\n"
-            )
-    except Exception:
-        LOG_FILE_PATH = os.path.join(os.getcwd(), "jove_py_client.log")
-        log_message("Log file path changed to current working directory.")
-
-    client = KernelClient(connection_file, image_width, image_renderer)
-    client.run()
-    log_message("Python KernelClient finished.")
+        if args.kernel_cmd:
+            kernel_process = start_kernel_process(args.kernel_cmd, connection_file)
+        KernelClient(
+            bridge,
+            connection_file,
+            args.image_width,
+            args.image_renderer,
+            kernel_process=kernel_process,
+        )
+    except Exception as e:
+        logger.error("Cannot start kernel: %s", e)
+        stop_kernel_process(kernel_process, connection_file)
+        bridge.send_to_lua({"type": "error", "message": f"Failed to start KernelClient: {e}"})
+        sys.exit(1)
+    bridge.run()
+    logger.info("Python KernelClient finished.")
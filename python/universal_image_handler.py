@@ -4,20 +4,147 @@ from PIL import Image
 import numpy as np
 
 
+# Numero massimo di elementi della matrice (coppie banda/colore x colonne) elaborata
+# in un singolo blocco dall'encoder vettoriale: limita la memoria per immagini grandi.
+SIXEL_BLOCK_ELEMENTS = 1 << 22
+
+
+def quantize_for_sixel(img, max_colors=255):
+    """
+    Quantizza un'immagine PIL per la codifica Sixel.
+    Restituisce (indici della palette come array NumPy, palette piatta RGB).
+    """
+    # Convertiamo in RGBA per gestire la trasparenza, poi quantizziamo.
+    # Per le immagini RGBA Pillow supporta solo FASTOCTREE (o libimagequant).
+    quantized_img = img.convert("RGBA").quantize(
+        colors=max_colors, method=Image.Quantize.FASTOCTREE
+    )
+    return np.array(quantized_img), quantized_img.getpalette()
+
+
+def _sixel_templates(n_colors, width):
+    """
+    Tabella (uint8) dei frammenti fissi dell'output Sixel: "" , "-", "#<colore>" per
+    ogni colore e "!<n>" per ogni lunghezza di run. Restituisce (tabella, lunghezze,
+    indice del primo "#", indice del primo "!").
+    """
+    strings = ["", "-"]
+    color_base = len(strings)
+    strings += [f"#{c}" for c in range(n_colors)]
+    run_base = len(strings)
+    strings += [f"!{n}" for n in range(width + 1)]
+
+    lengths = np.array([len(t) for t in strings], dtype=np.int64)
+    table = np.zeros((len(strings), int(lengths.max())), dtype=np.uint8)
+    for i, t in enumerate(strings):
+        table[i, : len(t)] = np.frombuffer(t.encode("ascii"), dtype=np.uint8)
+    return table, lengths, color_base, run_base
+
+
+def encode_sixel_bands(pixels):
+    """
+    Codifica una matrice di indici di palette (altezza x larghezza) nei dati Sixel
+    delle bande da 6 righe, con run-length encoding, usando operazioni NumPy su
+    interi blocchi di bande invece di cicli per pixel.
+    """
+    height, width = pixels.shape
+    if height == 0 or width == 0:
+        return ""
+
+    n_colors = int(pixels.max()) + 1
+    table, template_len, color_base, run_base = _sixel_templates(n_colors, width)
+
+    row_bits = 1 << (np.arange(height, dtype=np.int64) % 6)
+    band_of_row = np.arange(height, dtype=np.int64) // 6
+    columns = np.arange(width, dtype=np.int64)
+
+    # Limita la dimensione della matrice (coppie banda/colore x colonne) per blocco.
+    pairs_per_band = min(n_colors, 6 * width)
+    bands_per_block = max(1, SIXEL_BLOCK_ELEMENTS // (pairs_per_band * width))
+    rows_per_block = 6 * bands_per_block
+
+    pieces = []
+    for y0 in range(0, height, rows_per_block):
+        block = pixels[y0 : y0 + rows_per_block].astype(np.int64)
+        block_height = block.shape[0]
+        block_bands = band_of_row[y0 : y0 + block_height] - band_of_row[y0]
+
+        # 1. Coppie (banda, colore) presenti: np.unique le restituisce ordinate per
+        #    banda e poi per colore, cioè esattamente nell'ordine di scrittura.
+        keys = (block_bands[:, None] * n_colors + block).ravel()
+        pairs, pair_of_pixel = np.unique(keys, return_inverse=True)
+        pair_of_pixel = pair_of_pixel.reshape(block.shape)
+        n_pairs = len(pairs)
+
+        # 2. Bit-packing: ogni riga della banda contribuisce un bit diverso, quindi
+        #    la somma per (coppia, colonna) equivale all'OR dei bit.
+        bits = np.broadcast_to(row_bits[y0 : y0 + block_height, None], block.shape)
+        packed = np.bincount(
+            (pair_of_pixel * width + columns).ravel(),
+            weights=bits.ravel(),
+            minlength=n_pairs * width,
+        ).astype(np.uint8)
+
+        # 3. Run-length encoding su tutte le righe (coppie) del blocco insieme.
+        change = np.empty(packed.size, dtype=bool)
+        change[0] = True
+        np.not_equal(packed[1:], packed[:-1], out=change[1:])
+        change[::width] = True  # Ogni riga (colore) ricomincia la codifica
+        starts = np.flatnonzero(change)
+        run_lengths = np.diff(np.append(starts, packed.size))
+        n_runs = len(starts)
+
+        # 4. Posizione di ogni elemento nell'output: "#colore" prima dei run di ogni
+        #    riga, "-" dopo l'ultima riga di ogni banda.
+        run_row = starts // width
+        first_run = np.flatnonzero(starts % width == 0)
+        pair_band = pairs // n_colors
+        is_last = np.append(pair_band[1:] != pair_band[:-1], True)
+        terms_before = np.concatenate(([0], np.cumsum(is_last)[:-1]))
+        last_rows = np.flatnonzero(is_last)
+        row_end = np.append(first_run[1:], n_runs)
+
+        header_pos = first_run + np.arange(n_pairs) + terms_before
+        run_pos = np.arange(n_runs) + run_row + 1 + terms_before[run_row]
+        term_pos = row_end[last_rows] + last_rows + 1 + terms_before[last_rows]
+
+        # Ogni elemento = frammento fisso della tabella + carattere ripetuto `repeat` volte.
+        n_items = n_runs + n_pairs + len(last_rows)
+        template = np.zeros(n_items, dtype=np.int64)
+        char = np.zeros(n_items, dtype=np.uint8)
+        repeat = np.zeros(n_items, dtype=np.int64)
+
+        template[header_pos] = color_base + pairs % n_colors
+        template[term_pos] = 1
+        long_run = run_lengths > 3
+        template[run_pos] = np.where(long_run, run_base + run_lengths, 0)
+        char[run_pos] = packed[starts] + 63
+        repeat[run_pos] = np.where(long_run, 1, run_lengths)
+
+        # 5. Espansione in byte.
+        item_template_len = template_len[template]
+        item_len = item_template_len + repeat
+        item_offset = np.cumsum(item_len) - item_len
+        item_of_byte = np.repeat(np.arange(n_items), item_len)
+        pos = np.arange(int(item_len.sum())) - item_offset[item_of_byte]
+        in_template = pos < item_template_len[item_of_byte]
+        out = np.where(
+            in_template,
+            table[template[item_of_byte], np.minimum(pos, table.shape[1] - 1)],
+            char[item_of_byte],
+        )
+        pieces.append(out.tobytes().decode("ascii"))
+
+    return "".join(pieces)
+
+
 # Funzione centrale che converte un oggetto Pillow Image in Sixel
-# (Questa è una versione migliorata della funzione precedente)
 def render_pil_image_to_sixel(img, max_colors=255):
     """Converte un oggetto PIL.Image in una stringa Sixel."""
 
     # 1. Quantizzazione (passo cruciale)
-    # Convertiamo in RGBA per gestire la trasparenza, poi quantizziamo.
-    # Il metodo MAXCOVERAGE di solito dà i risultati migliori.
-    quantized_img = img.convert("RGBA").quantize(
-        colors=max_colors, method=Image.Quantize.MAXCOVERAGE
-    )
-    palette = quantized_img.getpalette()
-    pixels = np.array(quantized_img)  # Indici della palette
-    width, height = quantized_img.size
+    pixels, palette = quantize_for_sixel(img, max_colors)
+    height, width = pixels.shape
 
     sixel_data = io.StringIO()
 
@@ -34,40 +161,7 @@ def render_pil_image_to_sixel(img, max_colors=255):
                 )
 
     # 3. Codifica dei dati dei pixel in sixels
-    # (La logica di codifica rimane la stessa della risposta precedente)
-    for y in range(0, height, 6):
-        # ... logica di codifica per la banda di 6 righe ...
-        # (per brevità, si omette la logica RLE già vista)
-        bands = {}
-        for i in range(6):
-            if y + i >= height:
-                continue
-            for x in range(width):
-                color_index = pixels[y + i, x]
-                if color_index not in bands:
-                    bands[color_index] = np.zeros(width, dtype=int)
-                bands[color_index][x] |= 1 << i
-
-        for color_index, data in sorted(bands.items()):
-            sixel_data.write(f"#{color_index}")
-            last_val = -1
-            count = 0
-            for val in data:
-                if val == last_val:
-                    count += 1
-                else:
-                    if count > 3:
-                        sixel_data.write(f"!{count}{chr(last_val + 63)}")
-                    else:
-                        sixel_data.write(chr(last_val + 63) * count)
-                    last_val = val
-                    count = 1
-            if count > 3:
-                sixel_data.write(f"!{count}{chr(last_val + 63)}")
-            else:
-                sixel_data.write(chr(last_val + 63) * count)
-
-        sixel_data.write("-")
+    sixel_data.write(encode_sixel_bands(pixels))
 
     sixel_data.write("\x1b\\")  # Terminatore
     return sixel_data.getvalue()